@@ -1,11 +1,42 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
+import openpyxl
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.units import cm
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+from reportlab.graphics.shapes import Drawing
+from reportlab.graphics.charts.piecharts import Pie
+from reportlab.graphics.charts.barcharts import VerticalBarChart
+from reportlab.graphics.charts.legends import Legend
 from datetime import datetime
+from xml.sax.saxutils import escape
 import uuid
+import threading
+from collections.abc import Mapping
+from types import MappingProxyType
 import hashlib
 import json
+import atexit
+import queue
+import os
+import sqlite3
+import zlib
+import bisect
+import heapq
+import re
+import itertools
+import logging
+import time
+import tempfile
+import gzip
+import io
+import csv
+from concurrent.futures import ThreadPoolExecutor
 
 # Page configuration
 st.set_page_config(
@@ -925,52 +956,529 @@ def initialize_session_state():
         st.session_state.custom_operational = []
     if 'support_package' not in st.session_state:
         st.session_state.support_package = None
+    if 'support_department' not in st.session_state:
+        st.session_state.support_department = None
     if 'support_extras' not in st.session_state:
         st.session_state.support_extras = {'support': 0, 'training': 0, 'reports': 0}
-    if 'implementation_projects' not in st.session_state:
-        st.session_state.implementation_projects = []
+    if 'project_store' not in st.session_state:
+        st.session_state.project_store = build_project_store([])
     if 'company_info' not in st.session_state:
         st.session_state.company_info = {}
     if 'app_mode' not in st.session_state:
         st.session_state.app_mode = 'client'  # 'client' or 'admin'
     if 'admin_authenticated' not in st.session_state:
         st.session_state.admin_authenticated = False
+    if 'ledger_consistency_check' not in st.session_state:
+        st.session_state.ledger_consistency_check = False  # Enabled by tests
     
-    # Initialize admin-managed data from defaults
-    if 'admin_oracle_services' not in st.session_state:
-        st.session_state.admin_oracle_services = DEFAULT_ORACLE_SERVICES.copy()
-    if 'admin_microsoft_services' not in st.session_state:
-        st.session_state.admin_microsoft_services = DEFAULT_MICROSOFT_SERVICES.copy()
-    if 'admin_procurement_services' not in st.session_state:
-        st.session_state.admin_procurement_services = DEFAULT_PROCUREMENT_SERVICES.copy()
-    if 'admin_facility_safety_services' not in st.session_state:
-        st.session_state.admin_facility_safety_services = DEFAULT_FACILITY_SAFETY_SERVICES.copy()
-    if 'admin_support_packages' not in st.session_state:
-        st.session_state.admin_support_packages = DEFAULT_SUPPORT_PACKAGES.copy()
-    if 'admin_rpa_packages' not in st.session_state:
-        st.session_state.admin_rpa_packages = DEFAULT_RPA_PACKAGES.copy()
-    if 'admin_it_project_categories' not in st.session_state:
-        st.session_state.admin_it_project_categories = DEFAULT_IT_PROJECT_CATEGORIES.copy()
-    if 'admin_procurement_service_categories' not in st.session_state:
-        st.session_state.admin_procurement_service_categories = DEFAULT_PROCUREMENT_SERVICE_CATEGORIES.copy()
-    if 'admin_facility_safety_service_categories' not in st.session_state:
-        st.session_state.admin_facility_safety_service_categories = DEFAULT_FACILITY_SAFETY_SERVICE_CATEGORIES.copy()
-
-# Get current data (admin-managed if available, otherwise defaults)
-def get_current_data():
-    """Get current data from admin-managed session state"""
+    # Every rerun reads one stable catalog version
+    pin_catalog_snapshot()
+    
+    # Apply a draft requested on the previous rerun, before any widget exists
+    pending_draft = st.session_state.pop('pending_draft', None)
+    if pending_draft:
+        restore_draft(pending_draft)
+
+# Persistent storage - a local SQLite database in WAL mode, so readers never block writers
+DATABASE_PATH = os.environ.get('SHARED_SERVICES_DB', 'shared_services.db')
+
+DATABASE_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS catalog_meta (
+        key TEXT PRIMARY KEY,
+        value INTEGER NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS pricing_units (
+        unit_key TEXT PRIMARY KEY,
+        unit TEXT NOT NULL,
+        volume_label TEXT NOT NULL,
+        months INTEGER NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS services (
+        catalog_key TEXT NOT NULL,
+        name TEXT NOT NULL,
+        description TEXT NOT NULL,
+        department TEXT NOT NULL,
+        unit_key TEXT REFERENCES pricing_units (unit_key),
+        rate NUMERIC NOT NULL DEFAULT 0,
+        setup_cost NUMERIC NOT NULL DEFAULT 0,
+        position INTEGER NOT NULL,
+        PRIMARY KEY (catalog_key, name)
+    )""",
+    # Appending a service looks up MAX(position) - keep that an index seek for bulk imports
+    "CREATE INDEX IF NOT EXISTS idx_services_position ON services (catalog_key, position)",
+    """CREATE TABLE IF NOT EXISTS support_packages (
+        name TEXT PRIMARY KEY,
+        price NUMERIC NOT NULL,
+        support_requests_standard INTEGER NOT NULL,
+        support_requests_priority INTEGER NOT NULL,
+        support_requests_premium INTEGER NOT NULL,
+        total_support_requests INTEGER NOT NULL,
+        improvement_hours INTEGER NOT NULL,
+        training_requests INTEGER NOT NULL,
+        report_requests INTEGER NOT NULL,
+        systems_operation TEXT NOT NULL,
+        description TEXT NOT NULL,
+        departments TEXT NOT NULL,
+        position INTEGER NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS rpa_packages (
+        name TEXT PRIMARY KEY,
+        discovery_analysis NUMERIC NOT NULL,
+        build_implementation NUMERIC NOT NULL,
+        project_management NUMERIC NOT NULL,
+        infrastructure_license NUMERIC NOT NULL,
+        year_1_total NUMERIC NOT NULL,
+        year_2_cost NUMERIC NOT NULL,
+        year_3_cost NUMERIC NOT NULL,
+        processes_covered TEXT NOT NULL,
+        implementation_processes TEXT NOT NULL,
+        position INTEGER NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS categories (
+        catalog_key TEXT NOT NULL,
+        category TEXT NOT NULL,
+        category_position INTEGER NOT NULL,
+        item TEXT NOT NULL,
+        item_position INTEGER NOT NULL,
+        PRIMARY KEY (catalog_key, category, item)
+    )""",
+    # Change log of catalog records, one row per record per version - drives incremental exports
+    """CREATE TABLE IF NOT EXISTS catalog_changes (
+        version INTEGER NOT NULL,
+        catalog_key TEXT NOT NULL,
+        name TEXT NOT NULL,
+        changed_at TEXT NOT NULL,
+        PRIMARY KEY (version, catalog_key, name)
+    )""",
+    """CREATE TABLE IF NOT EXISTS catalog_snapshots (
+        name TEXT PRIMARY KEY,
+        version INTEGER NOT NULL,
+        created_at TEXT NOT NULL,
+        payload BLOB NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS submissions (
+        reference_id TEXT PRIMARY KEY,
+        company TEXT NOT NULL,
+        department TEXT NOT NULL,
+        shared_service_dept TEXT NOT NULL,
+        contact_person TEXT,
+        email TEXT,
+        submitted_at TEXT NOT NULL,
+        catalog_version INTEGER,
+        operational_total NUMERIC NOT NULL,
+        support_total NUMERIC NOT NULL,
+        implementation_total NUMERIC NOT NULL,
+        total_budget NUMERIC NOT NULL,
+        selections TEXT NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS idx_submissions_company_department ON submissions (company, department)",
+    """CREATE TABLE IF NOT EXISTS submission_lines (
+        reference_id TEXT NOT NULL REFERENCES submissions (reference_id),
+        line_no INTEGER NOT NULL,
+        bucket TEXT NOT NULL,
+        name TEXT NOT NULL,
+        department TEXT,
+        quantity NUMERIC,
+        annual_cost NUMERIC NOT NULL,
+        setup_cost NUMERIC NOT NULL,
+        total NUMERIC NOT NULL,
+        details TEXT,
+        PRIMARY KEY (reference_id, line_no)
+    )""",
+    """CREATE TABLE IF NOT EXISTS drafts (
+        email TEXT NOT NULL,
+        company TEXT NOT NULL,
+        format_version INTEGER NOT NULL,
+        saved_at TEXT NOT NULL,
+        payload BLOB NOT NULL,
+        PRIMARY KEY (email, company)
+    )"""
+]
+
+DB_CONNECTIONS = threading.local()
+
+def get_db_connection():
+    """Per-thread connection to the shared services database"""
+    conn = getattr(DB_CONNECTIONS, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(DATABASE_PATH, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        for statement in DATABASE_SCHEMA:
+            conn.execute(statement)
+        DB_CONNECTIONS.conn = conn
+    return conn
+
+# Shared catalog store - one copy of every admin-managed catalog per process.
+# Sessions read immutable snapshots by reference; admin writes publish a new snapshot.
+DEFAULT_CATALOGS = {
+    'ORACLE_SERVICES': DEFAULT_ORACLE_SERVICES,
+    'MICROSOFT_SERVICES': DEFAULT_MICROSOFT_SERVICES,
+    'PROCUREMENT_SERVICES': DEFAULT_PROCUREMENT_SERVICES,
+    'FACILITY_SAFETY_SERVICES': DEFAULT_FACILITY_SAFETY_SERVICES,
+    'SUPPORT_PACKAGES': DEFAULT_SUPPORT_PACKAGES,
+    'RPA_PACKAGES': DEFAULT_RPA_PACKAGES,
+    'IT_PROJECT_CATEGORIES': DEFAULT_IT_PROJECT_CATEGORIES,
+    'PROCUREMENT_SERVICE_CATEGORIES': DEFAULT_PROCUREMENT_SERVICE_CATEGORIES,
+    'FACILITY_SAFETY_SERVICE_CATEGORIES': DEFAULT_FACILITY_SAFETY_SERVICE_CATEGORIES
+}
+
+def freeze_catalog_value(value):
+    """Return a read-only copy of a catalog value (dicts become mapping proxies, lists tuples)"""
+    if isinstance(value, Mapping):
+        return MappingProxyType({key: freeze_catalog_value(item) for key, item in value.items()})
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze_catalog_value(item) for item in value)
+    return value
+
+def thaw_catalog_value(value):
+    """Return a plain, mutable copy of a frozen catalog value"""
+    if isinstance(value, Mapping):
+        return {key: thaw_catalog_value(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [thaw_catalog_value(item) for item in value]
+    return value
+
+# Catalog tables - how each catalog in DEFAULT_CATALOGS is stored
+SERVICE_CATALOGS = ['ORACLE_SERVICES', 'MICROSOFT_SERVICES', 'PROCUREMENT_SERVICES', 'FACILITY_SAFETY_SERVICES']
+CATEGORY_CATALOGS = ['IT_PROJECT_CATEGORIES', 'PROCUREMENT_SERVICE_CATEGORIES', 'FACILITY_SAFETY_SERVICE_CATEGORIES']
+PACKAGE_TABLES = {
+    'SUPPORT_PACKAGES': ('support_packages', [
+        'price', 'support_requests_standard', 'support_requests_priority', 'support_requests_premium',
+        'total_support_requests', 'improvement_hours', 'training_requests', 'report_requests',
+        'systems_operation', 'description', 'departments'
+    ]),
+    'RPA_PACKAGES': ('rpa_packages', [
+        'discovery_analysis', 'build_implementation', 'project_management', 'infrastructure_license',
+        'year_1_total', 'year_2_cost', 'year_3_cost', 'processes_covered', 'implementation_processes'
+    ])
+}
+
+def read_catalog_version(conn):
+    row = conn.execute("SELECT value FROM catalog_meta WHERE key = 'version'").fetchone()
+    return row[0] if row else None
+
+def write_catalog_record(conn, catalog_key, record_name, record):
+    """Insert, replace or (record=None) delete one catalog record inside the caller's transaction"""
+    if catalog_key in SERVICE_CATALOGS:
+        if record is None:
+            conn.execute("DELETE FROM services WHERE catalog_key = ? AND name = ?", (catalog_key, record_name))
+            return
+        unit_key = get_pricing_unit(record)
+        conn.execute(
+            """INSERT INTO services (catalog_key, name, description, department, unit_key, rate, setup_cost, position)
+               VALUES (?, ?, ?, ?, ?, ?, ?,
+                       (SELECT COALESCE(MAX(position) + 1, 0) FROM services WHERE catalog_key = ?))
+               ON CONFLICT (catalog_key, name) DO UPDATE SET
+                   description = excluded.description, department = excluded.department,
+                   unit_key = excluded.unit_key, rate = excluded.rate, setup_cost = excluded.setup_cost""",
+            (catalog_key, record_name, record.get('description', ''), record.get('department', ''),
+             unit_key, record[unit_key] if unit_key else 0, record.get('setup_cost', 0), catalog_key)
+        )
+    elif catalog_key in CATEGORY_CATALOGS:
+        existing = conn.execute(
+            "SELECT category_position FROM categories WHERE catalog_key = ? AND category = ? LIMIT 1",
+            (catalog_key, record_name)
+        ).fetchone()
+        conn.execute("DELETE FROM categories WHERE catalog_key = ? AND category = ?", (catalog_key, record_name))
+        if record is None:
+            return
+        if existing:
+            category_position = existing[0]
+        else:
+            category_position = conn.execute(
+                "SELECT COALESCE(MAX(category_position) + 1, 0) FROM categories WHERE catalog_key = ?", (catalog_key,)
+            ).fetchone()[0]
+        conn.executemany(
+            "INSERT INTO categories (catalog_key, category, category_position, item, item_position) VALUES (?, ?, ?, ?, ?)",
+            [(catalog_key, record_name, category_position, item, i) for i, item in enumerate(dict.fromkeys(record))]
+        )
+    else:
+        table, fields = PACKAGE_TABLES[catalog_key]
+        if record is None:
+            conn.execute(f"DELETE FROM {table} WHERE name = ?", (record_name,))
+            return
+        values = [json.dumps(list(record[field])) if field == 'departments' else record[field] for field in fields]
+        conn.execute(
+            f"""INSERT INTO {table} (name, {', '.join(fields)}, position)
+                VALUES (?, {', '.join('?' for _ in fields)}, (SELECT COALESCE(MAX(position) + 1, 0) FROM {table}))
+                ON CONFLICT (name) DO UPDATE SET {', '.join(f'{field} = excluded.{field}' for field in fields)}""",
+            [record_name] + values
+        )
+
+def seed_catalog_database(conn):
+    """Load the DEFAULT_* catalogs into an empty database"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if read_catalog_version(conn) is None:
+            conn.executemany(
+                "INSERT OR REPLACE INTO pricing_units (unit_key, unit, volume_label, months) VALUES (?, ?, ?, ?)",
+                [(unit_key, unit['unit'], unit['volume_label'], unit['months']) for unit_key, unit in PRICING_UNITS.items()]
+            )
+            for catalog_key, catalog in DEFAULT_CATALOGS.items():
+                for record_name, record in catalog.items():
+                    write_catalog_record(conn, catalog_key, record_name, record)
+            conn.execute("INSERT INTO catalog_meta (key, value) VALUES ('version', 0)")
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+def load_catalog_snapshot(conn):
+    """Read every catalog from the database into an immutable snapshot"""
+    conn.execute("BEGIN")
+    try:
+        version = read_catalog_version(conn)
+        data = {catalog_key: {} for catalog_key in DEFAULT_CATALOGS}
+        
+        for catalog_key, name, description, department, unit_key, rate, setup_cost in conn.execute(
+            """SELECT catalog_key, name, description, department, unit_key, rate, setup_cost
+               FROM services ORDER BY catalog_key, position"""
+        ):
+            record = {'description': description}
+            if unit_key:
+                record[unit_key] = rate
+            record['setup_cost'] = setup_cost
+            record['department'] = department
+            data[catalog_key][name] = record
+        
+        for catalog_key, category, item in conn.execute(
+            "SELECT catalog_key, category, item FROM categories ORDER BY catalog_key, category_position, item_position"
+        ):
+            data[catalog_key].setdefault(category, []).append(item)
+        
+        for catalog_key, (table, fields) in PACKAGE_TABLES.items():
+            for row in conn.execute(f"SELECT name, {', '.join(fields)} FROM {table} ORDER BY position"):
+                record = dict(zip(fields, row[1:]))
+                if 'departments' in record:
+                    record['departments'] = json.loads(record['departments'])
+                data[catalog_key][row[0]] = record
+    finally:
+        conn.execute("COMMIT")
+    
+    return MappingProxyType({'version': version, 'data': freeze_catalog_value(data)})
+
+@st.cache_resource
+def get_catalog_store():
+    """Process-wide catalog store shared by all sessions - an in-memory read cache over the database"""
+    conn = get_db_connection()
+    seed_catalog_database(conn)
+    current = load_catalog_snapshot(conn)
     return {
-        'ORACLE_SERVICES': st.session_state.admin_oracle_services,
-        'MICROSOFT_SERVICES': st.session_state.admin_microsoft_services,
-        'PROCUREMENT_SERVICES': st.session_state.admin_procurement_services,
-        'FACILITY_SAFETY_SERVICES': st.session_state.admin_facility_safety_services,
-        'SUPPORT_PACKAGES': st.session_state.admin_support_packages,
-        'RPA_PACKAGES': st.session_state.admin_rpa_packages,
-        'IT_PROJECT_CATEGORIES': st.session_state.admin_it_project_categories,
-        'PROCUREMENT_SERVICE_CATEGORIES': st.session_state.admin_procurement_service_categories,
-        'FACILITY_SAFETY_SERVICE_CATEGORIES': st.session_state.admin_facility_safety_service_categories
+        'lock': threading.Lock(),
+        'current': current,
+        # Recent snapshots by version - rolling back to one of these is a pointer swap
+        'history': {current['version']: current}
     }
 
+def write_catalog_order(conn, catalog_key, record_names):
+    """Renumber a catalog's stored positions to match record_names, inside the caller's transaction"""
+    if catalog_key in SERVICE_CATALOGS:
+        statement = "UPDATE services SET position = ? WHERE catalog_key = ? AND name = ?"
+        params = [(position, catalog_key, name) for position, name in enumerate(record_names)]
+    elif catalog_key in CATEGORY_CATALOGS:
+        statement = "UPDATE categories SET category_position = ? WHERE catalog_key = ? AND category = ?"
+        params = [(position, catalog_key, name) for position, name in enumerate(record_names)]
+    else:
+        table, _ = PACKAGE_TABLES[catalog_key]
+        statement = f"UPDATE {table} SET position = ? WHERE name = ?"
+        params = [(position, name) for position, name in enumerate(record_names)]
+    conn.executemany(statement, params)
+
+def commit_catalog_changes(conn, changes, orders=None):
+    """Write resolved catalog changes (and any full catalog orders), bump the catalog version and log the change; returns the new version"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for (catalog_key, record_name), record in changes.items():
+            write_catalog_record(conn, catalog_key, record_name, record)
+        for catalog_key, record_names in (orders or {}).items():
+            write_catalog_order(conn, catalog_key, record_names)
+        
+        conn.execute("UPDATE catalog_meta SET value = value + 1 WHERE key = 'version'")
+        version = read_catalog_version(conn)
+        changed_at = datetime.now().isoformat(timespec='seconds')
+        conn.executemany(
+            "INSERT INTO catalog_changes (version, catalog_key, name, changed_at) VALUES (?, ?, ?, ?)",
+            [(version, catalog_key, record_name, changed_at) for catalog_key, record_name in changes]
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return version
+
+def publish_catalog_snapshot(store, conn, base, version, data):
+    """Make data the current snapshot (caller holds the store lock)"""
+    if version != base['version'] + 1:
+        # Another process wrote in between - our base snapshot is stale
+        store['current'] = load_catalog_snapshot(conn)
+    else:
+        store['current'] = MappingProxyType({'version': version, 'data': MappingProxyType(data)})
+    
+    remember_catalog_snapshot(store, store['current'])
+
+def remember_catalog_snapshot(store, snapshot):
+    history = store['history']
+    history[snapshot['version']] = snapshot
+    while len(history) > CATALOG_HISTORY_SIZE:
+        del history[min(history)]
+
+def apply_catalog_changes(changes, merge=False):
+    """Persist catalog changes and publish a new immutable catalog snapshot.
+    
+    changes maps (catalog_key, record_name) to the new record, or None to remove it.
+    With merge=True the given fields are merged into the existing record. Only the
+    touched catalogs and records are rebuilt; everything else is shared with the
+    previous snapshot.
+    """
+    store = get_catalog_store()
+    conn = get_db_connection()
+    with store['lock']:
+        current = store['current']
+        if merge:
+            changes = {
+                (catalog_key, record_name): None if record is None else {**current['data'][catalog_key][record_name], **record}
+                for (catalog_key, record_name), record in changes.items()
+            }
+        
+        version = commit_catalog_changes(conn, changes)
+        
+        touched = {catalog_key: dict(current['data'][catalog_key]) for catalog_key, _ in changes}
+        for (catalog_key, record_name), record in changes.items():
+            if record is None:
+                touched[catalog_key].pop(record_name, None)
+            else:
+                touched[catalog_key][record_name] = freeze_catalog_value(record)
+        
+        data = dict(current['data'])
+        data.update({catalog_key: MappingProxyType(catalog) for catalog_key, catalog in touched.items()})
+        publish_catalog_snapshot(store, conn, current, version, data)
+
+def put_catalog_record(catalog_key, record_name, record):
+    apply_catalog_changes({(catalog_key, record_name): record})
+
+def update_catalog_record(catalog_key, record_name, changes):
+    apply_catalog_changes({(catalog_key, record_name): changes}, merge=True)
+
+def delete_catalog_record(catalog_key, record_name):
+    apply_catalog_changes({(catalog_key, record_name): None})
+
+def pin_catalog_snapshot():
+    """Hold the current catalog snapshot for the rest of this rerun"""
+    store = get_catalog_store()
+    conn = get_db_connection()
+    if read_catalog_version(conn) != store['current']['version']:
+        with store['lock']:
+            if read_catalog_version(conn) != store['current']['version']:
+                store['current'] = load_catalog_snapshot(conn)
+                remember_catalog_snapshot(store, store['current'])
+    st.session_state.catalog_snapshot = store['current']
+
+def get_catalog_snapshot():
+    return st.session_state.get('catalog_snapshot') or get_catalog_store()['current']
+
+# Get current data (admin-managed catalog store)
+def get_current_data():
+    """Get current data from the pinned catalog snapshot"""
+    return get_catalog_snapshot()['data']
+
+def get_catalog_version():
+    return get_catalog_snapshot()['version']
+
+# Named snapshots and rollback - a rollback publishes the target snapshot's catalogs as the
+# new current version (all sessions pick it up on their next rerun); only records that differ
+# are rewritten in the database
+CATALOG_HISTORY_SIZE = 50
+DEFAULT_SNAPSHOT_NAME = 'Defaults'
+
+DEPARTMENT_CATALOGS = {
+    'IT': ['ORACLE_SERVICES', 'MICROSOFT_SERVICES', 'IT_PROJECT_CATEGORIES'],
+    'Procurement': ['PROCUREMENT_SERVICES', 'PROCUREMENT_SERVICE_CATEGORIES'],
+    'Facility_Safety': ['FACILITY_SAFETY_SERVICES', 'FACILITY_SAFETY_SERVICE_CATEGORIES']
+}
+
+@st.cache_resource
+def get_default_catalog_data():
+    """The DEFAULT_* catalogs as one frozen snapshot, built once per process"""
+    return freeze_catalog_value(DEFAULT_CATALOGS)
+
+def save_named_snapshot(name):
+    """Store the current catalog state under a name so it can be restored later"""
+    current = get_catalog_store()['current']
+    payload = zlib.compress(json.dumps(thaw_catalog_value(current['data'])).encode('utf-8'))
+    conn = get_db_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(
+            """INSERT INTO catalog_snapshots (name, version, created_at, payload) VALUES (?, ?, ?, ?)
+               ON CONFLICT (name) DO UPDATE SET
+                   version = excluded.version, created_at = excluded.created_at, payload = excluded.payload""",
+            (name, current['version'], datetime.now().isoformat(timespec='seconds'), payload)
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+def list_named_snapshots():
+    """(name, version, created_at) of every saved snapshot, newest first"""
+    return get_db_connection().execute(
+        "SELECT name, version, created_at FROM catalog_snapshots ORDER BY created_at DESC"
+    ).fetchall()
+
+def get_named_snapshot_data(name):
+    if name == DEFAULT_SNAPSHOT_NAME:
+        return get_default_catalog_data()
+    row = get_db_connection().execute("SELECT payload FROM catalog_snapshots WHERE name = ?", (name,)).fetchone()
+    if row is None:
+        raise KeyError(f"No catalog snapshot named {name!r}")
+    return freeze_catalog_value(json.loads(zlib.decompress(row[0]).decode('utf-8')))
+
+def get_catalog_history():
+    """Versions that can be rolled back to without touching the database for the data"""
+    return sorted(get_catalog_store()['history'], reverse=True)
+
+def restore_catalog_data(target_data, department=None):
+    """Roll the catalogs (or one department's catalogs) back to target_data as a new version.
+    
+    Catalogs that are unchanged since the target are shared as-is; the new snapshot reuses the
+    target's catalog objects, so the swap itself does not copy any records.
+    """
+    catalog_keys = DEPARTMENT_CATALOGS[department] if department else list(DEFAULT_CATALOGS)
+    store = get_catalog_store()
+    conn = get_db_connection()
+    with store['lock']:
+        current = store['current']
+        changes = {}
+        orders = {}
+        for catalog_key in catalog_keys:
+            current_catalog, target_catalog = current['data'][catalog_key], target_data[catalog_key]
+            if current_catalog is target_catalog:
+                continue
+            for record_name in {**current_catalog, **target_catalog}:
+                record = target_catalog.get(record_name)
+                if current_catalog.get(record_name) != record:
+                    changes[(catalog_key, record_name)] = thaw_catalog_value(record) if record is not None else None
+            # Re-inserted records are appended in the database; store the target's order as well
+            if list(current_catalog) != list(target_catalog):
+                orders[catalog_key] = list(target_catalog)
+        
+        if not changes and not orders:
+            return current['version']
+        
+        version = commit_catalog_changes(conn, changes, orders)
+        data = dict(current['data'])
+        data.update({catalog_key: target_data[catalog_key] for catalog_key in catalog_keys})
+        publish_catalog_snapshot(store, conn, current, version, data)
+        return store['current']['version']
+
+def rollback_catalog_version(version, department=None):
+    """Roll back to a recent catalog version held in the snapshot history"""
+    return restore_catalog_data(get_catalog_store()['history'][version]['data'], department)
+
+def reset_catalogs_to_defaults(department=None):
+    return restore_catalog_data(get_default_catalog_data(), department)
+
 # Department configurations
 def get_departments_config():
     """Get departments configuration with current data"""
@@ -1079,6 +1587,61 @@ def show_admin_overview():
         support_count = len(current_data['SUPPORT_PACKAGES'])
         st.metric("Support Packages", support_count)
     
+    # Group-wide budget export, generated in the export worker pool
+    st.markdown("### 📥 Group-Wide Budget Export")
+    export_future = st.session_state.get('group_export_future')
+    
+    if st.button("📊 Generate Group-Wide Excel", key="group_export_btn", disabled=export_future is not None and not export_future.done()):
+        st.session_state.group_export_future = get_export_executor().submit(export_group_workbook)
+        st.rerun()
+    
+    if export_future is not None:
+        if not export_future.done():
+            st.info("⏳ Group-wide export is being generated - refresh this page in a moment.")
+        elif export_future.exception():
+            st.error(f"❌ Group-wide export failed: {export_future.exception()}")
+        else:
+            st.download_button(
+                "⬇️ Download Group-Wide Excel",
+                data=export_future.result(),
+                file_name=f"alkhorayef_group_budgets_2025_{datetime.now().strftime('%Y%m%d')}.xlsx",
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                key="download_group_export_btn"
+            )
+    
+    # Group-wide multi-year TCO across every stored submission
+    with st.expander(f"📈 Group-Wide {TCO_DEFAULT_HORIZON}-Year TCO Projection", expanded=False):
+        if st.button("Calculate Projection", key="group_tco_btn"):
+            flush_submissions()
+            tco = compute_tco(build_tco_line_items(iter_stored_submissions(ALKHORAYEF_COMPANIES)))
+            by_company = tco['matrix'].groupby('company')[tco['year_columns'] + ['Total', 'NPV']].sum()
+            st.metric("Group total (nominal)", f"SAR {tco['nominal_total']:,.0f}", f"NPV SAR {tco['npv']:,.0f}", delta_color="off")
+            st.dataframe(by_company.style.format("{:,.0f}"), use_container_width=True)
+    
+    # Support package savings across every stored submission
+    with st.expander("💡 Support Package Savings Across Submissions", expanded=False):
+        if st.button("Find Savings", key="support_savings_btn"):
+            flush_submissions()
+            packages = get_current_data()['SUPPORT_PACKAGES']
+            submissions = [
+                (submission['reference_id'], submission['company'], submission['selections']['support_package'], submission['support_total'],
+                 get_selection_support_demand(submission['selections'], packages))
+                for submission in iter_stored_submissions(ALKHORAYEF_COMPANIES) if submission['selections'].get('support_package')
+            ]
+            if submissions:
+                demand = pd.DataFrame([row[4] for row in submissions])
+                savings = optimize_support_packages(demand, packages)
+                savings.insert(0, 'reference_id', [row[0] for row in submissions])
+                savings.insert(1, 'company', [row[1] for row in submissions])
+                savings.insert(2, 'current_package', [row[2] for row in submissions])
+                savings.insert(3, 'current_cost', [row[3] for row in submissions])
+                savings['saving'] = savings['current_cost'] - savings['total']
+                savings = savings[savings['saving'] > 0].sort_values('saving', ascending=False)
+                st.metric("Potential yearly saving", f"SAR {savings['saving'].sum():,.0f}", f"{len(savings)} submission(s)", delta_color="off")
+                st.dataframe(savings, hide_index=True, use_container_width=True)
+            else:
+                st.info("No stored submissions include a support package yet.")
+    
     # Recent activity (simulation)
     st.markdown("### 📈 Recent Admin Activity")
     st.info("🔄 This section would show recent changes made by department heads in a production environment.")
@@ -1089,15 +1652,430 @@ def show_admin_overview():
     
     with col1:
         if st.button("📊 Export All Data", use_container_width=True):
-            st.success("📊 System data export functionality would be implemented here.")
+            st.session_state.show_data_export = True
     
     with col2:
         if st.button("🔄 Reset to Defaults", use_container_width=True):
-            st.warning("⚠️ Reset functionality would restore all services to default settings.")
+            st.session_state.show_catalog_rollback = True
     
     with col3:
         if st.button("📧 Notify Departments", use_container_width=True):
             st.success("📧 Notification system would alert departments of updates.")
+    
+    if st.session_state.get('show_data_export'):
+        show_data_export()
+    
+    if st.session_state.get('show_catalog_rollback'):
+        st.markdown("### 🔄 Reset & Rollback Catalogs")
+        show_catalog_rollback([None] + list(DEPARTMENT_CATALOGS), 'all')
+
+# Reset / rollback panel - restores defaults, a named snapshot or a recent version.
+# A scope of None covers every catalog; department scopes cover that department's catalogs.
+def show_catalog_rollback(scopes, key_suffix):
+    departments_config = get_departments_config()
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        department = st.selectbox(
+            "Scope", scopes, key=f"rollback_scope_{key_suffix}", disabled=len(scopes) == 1,
+            format_func=lambda dept: "All catalogs" if dept is None else departments_config[dept]['title']
+        )
+        
+        targets = [('named', DEFAULT_SNAPSHOT_NAME)]
+        targets += [('named', name) for name, _, _ in list_named_snapshots()]
+        targets += [('version', version) for version in get_catalog_history() if version != get_catalog_version()]
+        target = st.selectbox(
+            "Restore to", targets, key=f"rollback_target_{key_suffix}",
+            format_func=lambda target: f"Version {target[1]}" if target[0] == 'version' else f"Snapshot: {target[1]}"
+        )
+        
+        if st.button("🔄 Restore", type="primary", key=f"rollback_btn_{key_suffix}"):
+            kind, value = target
+            if kind == 'version':
+                version = rollback_catalog_version(value, department)
+            else:
+                version = restore_catalog_data(get_named_snapshot_data(value), department)
+            st.success(f"✅ Catalogs restored - now at version {version}. All sessions will see the change on their next interaction.")
+    
+    with col2:
+        snapshot_name = st.text_input("Save current catalogs as snapshot", key=f"snapshot_name_{key_suffix}").strip()
+        if st.button("💾 Save Snapshot", key=f"save_snapshot_btn_{key_suffix}"):
+            if not snapshot_name or snapshot_name == DEFAULT_SNAPSHOT_NAME:
+                st.error("Please enter a snapshot name (other than Defaults).")
+            else:
+                save_named_snapshot(snapshot_name)
+                st.success(f"💾 Saved snapshot '{snapshot_name}' at version {get_catalog_store()['current']['version']}")
+
+# Data export panel - the dump is generated in the export worker pool
+def show_data_export():
+    st.markdown("### 🗄️ Export All Data")
+    st.caption(
+        "Exports every catalog record, category, support and RPA package and stored submission. "
+        "Incremental exports include only records changed since a catalog version (catalogs only) or a timestamp."
+    )
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        export_format = st.radio("Format", ['jsonl', 'csv'], format_func=lambda value: value.upper() + " (gzip)", key="data_export_format")
+    with col2:
+        mode = st.radio("Scope", ['Everything', 'Since catalog version', 'Since timestamp'], key="data_export_mode")
+    with col3:
+        since_version = since_timestamp = None
+        if mode == 'Since catalog version':
+            since_version = st.number_input("Catalog version", min_value=0, value=0, step=1, key="data_export_since_version")
+        elif mode == 'Since timestamp':
+            since_timestamp = st.text_input("Changed after (YYYY-MM-DDTHH:MM:SS)", key="data_export_since_timestamp").strip() or None
+            if since_timestamp:
+                try:
+                    datetime.fromisoformat(since_timestamp)
+                except ValueError:
+                    st.error("Please enter an ISO timestamp, e.g. 2025-01-31T18:00:00")
+                    since_timestamp = None
+    
+    export_future = st.session_state.get('data_export_future')
+    ready = mode == 'Everything' or since_version is not None or since_timestamp is not None
+    if st.button("🗄️ Generate Export", key="data_export_btn", disabled=not ready or (export_future is not None and not export_future.done())):
+        discard_data_export(export_future)
+        st.session_state.data_export_future = get_export_executor().submit(export_all_data, export_format, since_version, since_timestamp)
+        st.session_state.data_export_name = (
+            f"shared_services_export_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+            + (f"_since_v{since_version}" if since_version is not None else "")
+            + f".{export_format}.gz"
+        )
+        st.rerun()
+    
+    if export_future is not None:
+        if not export_future.done():
+            st.info("⏳ Export is being generated - refresh this page in a moment.")
+        elif export_future.exception():
+            st.error(f"❌ Export failed: {export_future.exception()}")
+        elif os.path.exists(export_future.result()):
+            export_path = export_future.result()
+            st.caption(f"Export ready: {os.path.getsize(export_path) / 1024:,.1f} KB compressed")
+            # The file is only read when the download is clicked, not on every rerun
+            st.download_button(
+                "⬇️ Download Export",
+                data=lambda: read_data_export(export_path),
+                file_name=st.session_state.data_export_name,
+                mime="application/gzip",
+                key="download_data_export_btn"
+            )
+        else:
+            st.warning("The generated export file is no longer available - please generate it again.")
+
+# Bulk catalog import - price books are streamed row by row (csv reader or a read-only
+# openpyxl workbook), validated, and applied as one catalog version
+IMPORT_PRICING_UNITS = {
+    'ORACLE_SERVICES': ['price_per_user'],
+    'MICROSOFT_SERVICES': ['price_per_user'],
+    'PROCUREMENT_SERVICES': ['price_per_user', 'price_per_transaction', 'price_per_supplier', 'price_per_contract', 'price_per_event'],
+    'FACILITY_SAFETY_SERVICES': ['price_per_user', 'price_per_employee', 'price_per_sq_meter', 'price_per_access_point',
+                                 'price_per_location', 'price_per_monitoring_point', 'price_per_asset', 'price_per_vehicle']
+}
+
+# Column -> (required, type); pricing_unit may be omitted when the catalog has a single unit
+PRICE_BOOK_SCHEMA = {
+    'service_name': (True, str),
+    'description': (True, str),
+    'pricing_unit': (False, str),
+    'rate': (True, int),
+    'setup_cost': (False, int)
+}
+
+MAX_IMPORT_ERRORS_SHOWN = 200
+
+def normalize_price_book_header(value):
+    return str(value or '').strip().lower().replace(' ', '_')
+
+def iter_price_book_rows(uploaded_file):
+    """Yield (row_number, row) from a CSV or Excel price book without loading it all at once"""
+    if uploaded_file.name.lower().endswith('.csv'):
+        reader = csv.reader(io.TextIOWrapper(uploaded_file, encoding='utf-8-sig', newline=''))
+        rows = iter(reader)
+    else:
+        workbook = openpyxl.load_workbook(uploaded_file, read_only=True, data_only=True)
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+    
+    header = [normalize_price_book_header(value) for value in next(rows, [])]
+    for row_number, values in enumerate(rows, start=2):
+        if all(value is None or str(value).strip() == '' for value in values):
+            continue
+        yield row_number, dict(zip(header, values))
+
+def parse_price_book_value(value, value_type):
+    """Coerce one cell to the schema type, raising ValueError when it does not fit"""
+    if value_type is str:
+        return str(value).strip()
+    
+    try:
+        amount = float(str(value).replace(',', '').replace('SAR', '').strip())
+    except ValueError:
+        raise ValueError("must be a number") from None
+    if amount < 0:
+        raise ValueError("must not be negative")
+    if amount != int(amount):
+        raise ValueError("must be a whole SAR amount")
+    return int(amount)
+
+def validate_price_book_row(row, catalog_key, department):
+    """Return (service_name, record, errors) for one price book row"""
+    errors = []
+    values = {}
+    for column, (required, value_type) in PRICE_BOOK_SCHEMA.items():
+        raw = row.get(column)
+        if raw is None or str(raw).strip() == '':
+            if required:
+                errors.append(f"{column} is required")
+            continue
+        try:
+            values[column] = parse_price_book_value(raw, value_type)
+        except ValueError as error:
+            errors.append(f"{column} {error}")
+    
+    units = IMPORT_PRICING_UNITS[catalog_key]
+    unit_key = values.get('pricing_unit', units[0] if len(units) == 1 else None)
+    if unit_key is None:
+        errors.append("pricing_unit is required")
+    elif unit_key not in units:
+        # Accept the display unit ("user/month") as well as the key ("price_per_user")
+        unit_key = next((key for key in units if PRICING_UNITS[key]['unit'] == unit_key), unit_key)
+        if unit_key not in units:
+            errors.append(f"pricing_unit must be one of {', '.join(units)}")
+    
+    if errors:
+        return values.get('service_name'), None, errors
+    
+    return values['service_name'], {
+        'description': values['description'],
+        unit_key: values['rate'],
+        'setup_cost': values.get('setup_cost', 0),
+        'department': department
+    }, []
+
+def read_price_book(uploaded_file, catalog_key, department):
+    """Validate a whole price book, returning (changes, errors) ready for apply_catalog_changes"""
+    changes = {}
+    first_seen = {}
+    errors = []
+    for row_number, row in iter_price_book_rows(uploaded_file):
+        service_name, record, row_errors = validate_price_book_row(row, catalog_key, department)
+        if service_name in first_seen:
+            row_errors.append(f"duplicate of row {first_seen[service_name]}")
+        elif service_name:
+            first_seen[service_name] = row_number
+        
+        if row_errors:
+            errors.append({'Row': row_number, 'Service': service_name or '', 'Errors': '; '.join(row_errors)})
+        else:
+            changes[(catalog_key, service_name)] = record
+    return changes, errors
+
+# Bulk import panel shared by the department management screens
+def show_bulk_import(catalog_options, department):
+    """Upload a CSV/Excel price book and import it as one catalog version"""
+    with st.expander("📥 Bulk Import Price Book (CSV / Excel)", expanded=False):
+        units = sorted({unit for catalog_key in catalog_options.values() for unit in IMPORT_PRICING_UNITS[catalog_key]})
+        st.caption(
+            "Columns: service_name, description, rate, setup_cost (optional), pricing_unit "
+            f"({', '.join(units)}). Existing services with the same name are updated."
+        )
+        
+        catalog_label = st.selectbox("Import into", list(catalog_options), key=f"import_catalog_{department}")
+        uploaded_file = st.file_uploader("Price book", type=['csv', 'xlsx'], key=f"import_file_{department}")
+        skip_invalid = st.checkbox("Skip invalid rows and import the rest", key=f"import_skip_{department}")
+        
+        if uploaded_file is not None and st.button("📥 Validate & Import", type="primary", key=f"import_btn_{department}"):
+            catalog_key = catalog_options[catalog_label]
+            try:
+                changes, errors = read_price_book(uploaded_file, catalog_key, department)
+            except Exception as error:
+                st.error(f"❌ Could not read {uploaded_file.name}: {error}")
+                return
+            
+            if errors:
+                st.warning(f"⚠️ {len(errors)} invalid row(s)" + (f" - showing the first {MAX_IMPORT_ERRORS_SHOWN}" if len(errors) > MAX_IMPORT_ERRORS_SHOWN else ""))
+                st.dataframe(pd.DataFrame(errors[:MAX_IMPORT_ERRORS_SHOWN]), hide_index=True, use_container_width=True)
+            
+            if errors and not skip_invalid:
+                st.error("❌ Nothing was imported. Fix the rows above or choose to skip invalid rows.")
+            elif not changes:
+                st.info("No valid rows to import.")
+            else:
+                apply_catalog_changes(changes)
+                st.success(f"✅ Imported {len(changes)} services into {catalog_label} (catalog version {get_catalog_store()['current']['version']})")
+
+# Bulk service editor - one grid per catalog. Streamlit reports only the edited, added and
+# deleted rows, so the diff (and its validation) is proportional to the edits, not the catalog
+SERVICE_GRID_COLUMNS = ['Service', 'Description', 'Pricing Unit', 'Rate', 'Setup Cost']
+
+def build_service_grid(catalog):
+    """One grid row per catalog service, in catalog order"""
+    rows = []
+    for service_name, details in catalog.items():
+        unit_key = get_pricing_unit(details)
+        rows.append([service_name, details['description'], unit_key, details.get(unit_key, 0), details['setup_cost']])
+    return pd.DataFrame(rows, columns=SERVICE_GRID_COLUMNS)
+
+def service_grid_row_to_price_book(row):
+    return {
+        'service_name': row.get('Service'),
+        'description': row.get('Description'),
+        'pricing_unit': row.get('Pricing Unit'),
+        'rate': row.get('Rate'),
+        'setup_cost': row.get('Setup Cost')
+    }
+
+def diff_service_grid(catalog, names, grid_changes, catalog_key, department):
+    """Turn the grid's edited/added/deleted rows into (changes, errors) for apply_catalog_changes.
+    
+    names are the services shown in the grid, in row order; catalog is the whole catalog.
+    """
+    changes = {}
+    errors = []
+    final_names = set(catalog)
+    
+    deleted = set(grid_changes.get('deleted_rows', []))
+    for position in deleted:
+        changes[(catalog_key, names[position])] = None
+        final_names.discard(names[position])
+    
+    edited = [(position, edits) for position, edits in grid_changes.get('edited_rows', {}).items() if int(position) not in deleted]
+    added = [(None, row) for row in grid_changes.get('added_rows', [])]
+    
+    for position, edits in edited + added:
+        if position is None:
+            original_name, row = None, edits
+            label = "New row"
+        else:
+            original_name = names[int(position)]
+            details = catalog[original_name]
+            unit_key = get_pricing_unit(details)
+            row = {'Service': original_name, 'Description': details['description'], 'Pricing Unit': unit_key,
+                   'Rate': details.get(unit_key, 0), 'Setup Cost': details['setup_cost'], **edits}
+            label = original_name
+        
+        service_name, record, row_errors = validate_price_book_row(service_grid_row_to_price_book(row), catalog_key, department)
+        if not row_errors and service_name != original_name and service_name in final_names:
+            row_errors.append(f"a service named {service_name!r} already exists")
+        if row_errors:
+            errors.append({'Row': label, 'Service': service_name or '', 'Errors': '; '.join(row_errors)})
+            continue
+        
+        if original_name is not None and service_name != original_name:
+            changes[(catalog_key, original_name)] = None
+            final_names.discard(original_name)
+        if catalog.get(service_name) != record:
+            changes[(catalog_key, service_name)] = record
+        final_names.add(service_name)
+    
+    return changes, errors
+
+# Admin service search - per-catalog index of lowercase name/description text plus a sorted
+# name list for prefix lookups. Updated incrementally: records unchanged since the last
+# catalog version (same object, thanks to structural sharing) keep their entries.
+ADMIN_PAGE_SIZE = 25
+
+@st.cache_resource
+def get_admin_search_index():
+    """Process-wide admin search index, one entry per catalog"""
+    return {'lock': threading.Lock(), 'catalogs': {}}
+
+def update_admin_search_entry(entry, catalog):
+    """Return the index entry for catalog, reusing whatever is unchanged from entry"""
+    if entry is not None and entry['catalog'] is catalog:
+        return entry
+    
+    old_texts = entry['texts'] if entry else {}
+    texts = {}
+    for service_name, details in catalog.items():
+        previous = old_texts.get(service_name)
+        if previous is not None and previous[0] is details:
+            texts[service_name] = previous
+        else:
+            texts[service_name] = (details, f"{service_name} {details.get('description', '')}".lower())
+    
+    prefixes = list(entry['prefixes']) if entry else []
+    for service_name in old_texts.keys() - texts.keys():
+        prefixes.remove((service_name.lower(), service_name))
+    for service_name in texts.keys() - old_texts.keys():
+        bisect.insort(prefixes, (service_name.lower(), service_name))
+    
+    return {'catalog': catalog, 'texts': texts, 'prefixes': prefixes}
+
+def search_catalog_services(catalog_key, catalog, query):
+    """Service names matching every word of query - name-prefix matches first, then substring matches"""
+    index = get_admin_search_index()
+    with index['lock']:
+        entry = update_admin_search_entry(index['catalogs'].get(catalog_key), catalog)
+        index['catalogs'][catalog_key] = entry
+    
+    words = query.lower().split()
+    if not words:
+        return list(catalog)
+    
+    query = ' '.join(words)
+    start = bisect.bisect_left(entry['prefixes'], (query,))
+    prefix_matches = []
+    for lower_name, service_name in entry['prefixes'][start:]:
+        if not lower_name.startswith(query):
+            break
+        prefix_matches.append(service_name)
+    
+    seen = set(prefix_matches)
+    substring_matches = [
+        service_name for service_name, (_, text) in entry['texts'].items()
+        if service_name not in seen and all(word in text for word in words)
+    ]
+    return prefix_matches + substring_matches
+
+@st.fragment
+def show_service_editor(catalog_key, department, heading):
+    """Searchable, paginated grid over a catalog's services; edits rerun only this grid until applied"""
+    catalog = get_current_data()[catalog_key]
+    st.markdown(heading)
+    
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        query = st.text_input("🔍 Search services", key=f"service_search_{catalog_key}", placeholder="Name or description")
+    matches = search_catalog_services(catalog_key, catalog, query)
+    page_count = max(1, -(-len(matches) // ADMIN_PAGE_SIZE))
+    with col2:
+        page = st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, value=1, key=f"service_page_{catalog_key}")
+    
+    page = min(page, page_count)
+    names = matches[(page - 1) * ADMIN_PAGE_SIZE:page * ADMIN_PAGE_SIZE]
+    st.caption(f"Showing {len(names)} of {len(matches)} matching services ({len(catalog)} total). Apply edits before changing page or search.")
+    
+    units = IMPORT_PRICING_UNITS[catalog_key]
+    # Keyed by catalog version and page so pending edits never apply to rows that have since moved
+    editor_key = f"service_grid_{catalog_key}_{get_catalog_version()}_{hashlib.sha1(query.encode('utf-8')).hexdigest()[:8]}_{page}"
+    st.data_editor(
+        build_service_grid({service_name: catalog[service_name] for service_name in names}),
+        key=editor_key,
+        num_rows="dynamic",
+        hide_index=True,
+        use_container_width=True,
+        column_config={
+            'Service': st.column_config.TextColumn(required=True),
+            'Description': st.column_config.TextColumn(width="large"),
+            'Pricing Unit': st.column_config.SelectboxColumn(
+                options=units, required=True, default=units[0], disabled=len(units) == 1
+            ),
+            'Rate': st.column_config.NumberColumn("Rate (SAR)", min_value=0, step=1, required=True),
+            'Setup Cost': st.column_config.NumberColumn("Setup Cost (SAR)", min_value=0, step=1, default=0)
+        }
+    )
+    
+    grid_changes = st.session_state.get(editor_key, {})
+    pending = len(grid_changes.get('edited_rows', {})) + len(grid_changes.get('added_rows', [])) + len(grid_changes.get('deleted_rows', []))
+    if st.button(f"💾 Apply {pending} Change(s)", type="primary", disabled=pending == 0, key=f"apply_{catalog_key}"):
+        changes, errors = diff_service_grid(catalog, names, grid_changes, catalog_key, department)
+        if errors:
+            st.error("❌ Nothing was saved - please fix these rows:")
+            st.dataframe(pd.DataFrame(errors), hide_index=True, use_container_width=True)
+        elif changes:
+            apply_catalog_changes(changes)
+            st.rerun()
 
 def show_admin_it_management():
     """Show IT services management interface"""
@@ -1112,6 +2090,11 @@ def show_admin_it_management():
     </div>
     """, unsafe_allow_html=True)
     
+    with st.expander("🔄 Reset or Roll Back Catalogs", expanded=False):
+        show_catalog_rollback(['IT'], 'IT')
+    
+    show_bulk_import({'Oracle Services': 'ORACLE_SERVICES', 'Microsoft Services': 'MICROSOFT_SERVICES'}, 'IT')
+    
     # Oracle Services Management
     st.markdown("### 🟠 Oracle Services Management")
     
@@ -1130,60 +2113,19 @@ def show_admin_it_management():
             
             if st.form_submit_button("Add Oracle Service", type="primary"):
                 if service_name and description:
-                    st.session_state.admin_oracle_services[service_name] = {
+                    put_catalog_record('ORACLE_SERVICES', service_name, {
                         "description": description,
                         "price_per_user": price_per_user,
                         "setup_cost": setup_cost,
                         "department": "IT"
-                    }
+                    })
                     st.success(f"✅ Added Oracle service: {service_name}")
                     st.rerun()
                 else:
                     st.error("Please fill in all required fields.")
     
     # Existing Oracle services
-    if st.session_state.admin_oracle_services:
-        st.markdown("#### Current Oracle Services")
-        
-        for service_name, details in st.session_state.admin_oracle_services.items():
-            with st.expander(f"🔧 {service_name}", expanded=False):
-                col1, col2, col3 = st.columns([2, 2, 1])
-                
-                with col1:
-                    new_desc = st.text_area(
-                        "Description", 
-                        value=details['description'], 
-                        key=f"oracle_desc_{service_name}"
-                    )
-                    
-                with col2:
-                    new_price = st.number_input(
-                        "Price per User (SAR/month)", 
-                        value=details['price_per_user'], 
-                        min_value=0,
-                        key=f"oracle_price_{service_name}"
-                    )
-                    new_setup = st.number_input(
-                        "Setup Cost (SAR)", 
-                        value=details['setup_cost'], 
-                        min_value=0,
-                        key=f"oracle_setup_{service_name}"
-                    )
-                
-                with col3:
-                    if st.button("💾 Update", key=f"update_oracle_{service_name}"):
-                        st.session_state.admin_oracle_services[service_name].update({
-                            'description': new_desc,
-                            'price_per_user': new_price,
-                            'setup_cost': new_setup
-                        })
-                        st.success(f"✅ Updated {service_name}")
-                        st.rerun()
-                    
-                    if st.button("🗑️ Remove", key=f"remove_oracle_{service_name}"):
-                        del st.session_state.admin_oracle_services[service_name]
-                        st.success(f"🗑️ Removed {service_name}")
-                        st.rerun()
+    show_service_editor('ORACLE_SERVICES', 'IT', "#### Current Oracle Services")
     
     st.markdown("---")
     
@@ -1205,60 +2147,19 @@ def show_admin_it_management():
             
             if st.form_submit_button("Add Microsoft Service", type="primary"):
                 if service_name and description:
-                    st.session_state.admin_microsoft_services[service_name] = {
+                    put_catalog_record('MICROSOFT_SERVICES', service_name, {
                         "description": description,
                         "price_per_user": price_per_user,
                         "setup_cost": setup_cost,
                         "department": "IT"
-                    }
+                    })
                     st.success(f"✅ Added Microsoft service: {service_name}")
                     st.rerun()
                 else:
                     st.error("Please fill in all required fields.")
     
     # Existing Microsoft services
-    if st.session_state.admin_microsoft_services:
-        st.markdown("#### Current Microsoft Services")
-        
-        for service_name, details in st.session_state.admin_microsoft_services.items():
-            with st.expander(f"🔧 {service_name}", expanded=False):
-                col1, col2, col3 = st.columns([2, 2, 1])
-                
-                with col1:
-                    new_desc = st.text_area(
-                        "Description", 
-                        value=details['description'], 
-                        key=f"ms_desc_{service_name}"
-                    )
-                    
-                with col2:
-                    new_price = st.number_input(
-                        "Price per User (SAR/month)", 
-                        value=details['price_per_user'], 
-                        min_value=0,
-                        key=f"ms_price_{service_name}"
-                    )
-                    new_setup = st.number_input(
-                        "Setup Cost (SAR)", 
-                        value=details['setup_cost'], 
-                        min_value=0,
-                        key=f"ms_setup_{service_name}"
-                    )
-                
-                with col3:
-                    if st.button("💾 Update", key=f"update_ms_{service_name}"):
-                        st.session_state.admin_microsoft_services[service_name].update({
-                            'description': new_desc,
-                            'price_per_user': new_price,
-                            'setup_cost': new_setup
-                        })
-                        st.success(f"✅ Updated {service_name}")
-                        st.rerun()
-                    
-                    if st.button("🗑️ Remove", key=f"remove_ms_{service_name}"):
-                        del st.session_state.admin_microsoft_services[service_name]
-                        st.success(f"🗑️ Removed {service_name}")
-                        st.rerun()
+    show_service_editor('MICROSOFT_SERVICES', 'IT', "#### Current Microsoft Services")
 
 def show_admin_procurement_management():
     """Show Procurement services management interface"""
@@ -1273,6 +2174,11 @@ def show_admin_procurement_management():
     </div>
     """, unsafe_allow_html=True)
     
+    with st.expander("🔄 Reset or Roll Back Catalogs", expanded=False):
+        show_catalog_rollback(['Procurement'], 'Procurement')
+    
+    show_bulk_import({'Procurement Services': 'PROCUREMENT_SERVICES'}, 'Procurement')
+    
     # Add new Procurement service
     with st.expander("➕ Add New Procurement Service", expanded=False):
         with st.form("add_procurement_service"):
@@ -1298,65 +2204,14 @@ def show_admin_procurement_management():
                         "setup_cost": setup_cost,
                         "department": "Procurement"
                     }
-                    st.session_state.admin_procurement_services[service_name] = service_data
+                    put_catalog_record('PROCUREMENT_SERVICES', service_name, service_data)
                     st.success(f"✅ Added Procurement service: {service_name}")
                     st.rerun()
                 else:
                     st.error("Please fill in all required fields.")
     
     # Existing Procurement services
-    if st.session_state.admin_procurement_services:
-        st.markdown("#### Current Procurement Services")
-        
-        for service_name, details in st.session_state.admin_procurement_services.items():
-            with st.expander(f"🔧 {service_name}", expanded=False):
-                col1, col2, col3 = st.columns([2, 2, 1])
-                
-                with col1:
-                    new_desc = st.text_area(
-                        "Description", 
-                        value=details['description'], 
-                        key=f"proc_desc_{service_name}"
-                    )
-                
-                with col2:
-                    # Find the pricing model
-                    pricing_models = ["price_per_user", "price_per_transaction", "price_per_supplier", "price_per_contract", "price_per_event"]
-                    current_pricing_model = None
-                    current_price = 0
-                    
-                    for model in pricing_models:
-                        if model in details:
-                            current_pricing_model = model
-                            current_price = details[model]
-                            break
-                    
-                    new_price = st.number_input(
-                        f"Price ({current_pricing_model.replace('_', ' ').title()})", 
-                        value=current_price, 
-                        min_value=0,
-                        key=f"proc_price_{service_name}"
-                    )
-                    new_setup = st.number_input(
-                        "Setup Cost (SAR)", 
-                        value=details['setup_cost'], 
-                        min_value=0,
-                        key=f"proc_setup_{service_name}"
-                    )
-                
-                with col3:
-                    if st.button("💾 Update", key=f"update_proc_{service_name}"):
-                        st.session_state.admin_procurement_services[service_name]['description'] = new_desc
-                        st.session_state.admin_procurement_services[service_name]['setup_cost'] = new_setup
-                        if current_pricing_model:
-                            st.session_state.admin_procurement_services[service_name][current_pricing_model] = new_price
-                        st.success(f"✅ Updated {service_name}")
-                        st.rerun()
-                    
-                    if st.button("🗑️ Remove", key=f"remove_proc_{service_name}"):
-                        del st.session_state.admin_procurement_services[service_name]
-                        st.success(f"🗑️ Removed {service_name}")
-                        st.rerun()
+    show_service_editor('PROCUREMENT_SERVICES', 'Procurement', "#### Current Procurement Services")
 
 def show_admin_facility_safety_management():
     """Show Facility & Safety services management interface"""
@@ -1371,6 +2226,11 @@ def show_admin_facility_safety_management():
     </div>
     """, unsafe_allow_html=True)
     
+    with st.expander("🔄 Reset or Roll Back Catalogs", expanded=False):
+        show_catalog_rollback(['Facility_Safety'], 'Facility_Safety')
+    
+    show_bulk_import({'Facility & Safety Services': 'FACILITY_SAFETY_SERVICES'}, 'Facility_Safety')
+    
     # Add new Facility & Safety service
     with st.expander("➕ Add New Facility & Safety Service", expanded=False):
         with st.form("add_facility_service"):
@@ -1397,66 +2257,14 @@ def show_admin_facility_safety_management():
                         "setup_cost": setup_cost,
                         "department": "Facility_Safety"
                     }
-                    st.session_state.admin_facility_safety_services[service_name] = service_data
+                    put_catalog_record('FACILITY_SAFETY_SERVICES', service_name, service_data)
                     st.success(f"✅ Added Facility & Safety service: {service_name}")
                     st.rerun()
                 else:
                     st.error("Please fill in all required fields.")
     
     # Existing Facility & Safety services
-    if st.session_state.admin_facility_safety_services:
-        st.markdown("#### Current Facility & Safety Services")
-        
-        for service_name, details in st.session_state.admin_facility_safety_services.items():
-            with st.expander(f"🔧 {service_name}", expanded=False):
-                col1, col2, col3 = st.columns([2, 2, 1])
-                
-                with col1:
-                    new_desc = st.text_area(
-                        "Description", 
-                        value=details['description'], 
-                        key=f"fac_desc_{service_name}"
-                    )
-                
-                with col2:
-                    # Find the pricing model
-                    pricing_models = ["price_per_user", "price_per_employee", "price_per_sq_meter", "price_per_access_point", 
-                                    "price_per_location", "price_per_monitoring_point", "price_per_asset", "price_per_vehicle"]
-                    current_pricing_model = None
-                    current_price = 0
-                    
-                    for model in pricing_models:
-                        if model in details:
-                            current_pricing_model = model
-                            current_price = details[model]
-                            break
-                    
-                    new_price = st.number_input(
-                        f"Price ({current_pricing_model.replace('_', ' ').title()})", 
-                        value=current_price, 
-                        min_value=0,
-                        key=f"fac_price_{service_name}"
-                    )
-                    new_setup = st.number_input(
-                        "Setup Cost (SAR)", 
-                        value=details['setup_cost'], 
-                        min_value=0,
-                        key=f"fac_setup_{service_name}"
-                    )
-                
-                with col3:
-                    if st.button("💾 Update", key=f"update_fac_{service_name}"):
-                        st.session_state.admin_facility_safety_services[service_name]['description'] = new_desc
-                        st.session_state.admin_facility_safety_services[service_name]['setup_cost'] = new_setup
-                        if current_pricing_model:
-                            st.session_state.admin_facility_safety_services[service_name][current_pricing_model] = new_price
-                        st.success(f"✅ Updated {service_name}")
-                        st.rerun()
-                    
-                    if st.button("🗑️ Remove", key=f"remove_fac_{service_name}"):
-                        del st.session_state.admin_facility_safety_services[service_name]
-                        st.success(f"🗑️ Removed {service_name}")
-                        st.rerun()
+    show_service_editor('FACILITY_SAFETY_SERVICES', 'Facility_Safety', "#### Current Facility & Safety Services")
 
 def show_admin_support_management():
     """Show support packages management interface"""
@@ -1464,6 +2272,8 @@ def show_admin_support_management():
         st.error("❌ Access denied. This section requires admin access.")
         return
     
+    current_data = get_current_data()
+    
     st.markdown("""
     <div class='admin-section'>
         <h2>🛠️ Support Packages Management</h2>
@@ -1472,10 +2282,10 @@ def show_admin_support_management():
     """, unsafe_allow_html=True)
     
     # Support Packages Management
-    if st.session_state.admin_support_packages:
+    if current_data['SUPPORT_PACKAGES']:
         st.markdown("#### Current Support Packages")
         
-        for package_name, details in st.session_state.admin_support_packages.items():
+        for package_name, details in current_data['SUPPORT_PACKAGES'].items():
             with st.expander(f"🔧 {package_name} Package", expanded=False):
                 col1, col2 = st.columns(2)
                 
@@ -1533,7 +2343,7 @@ def show_admin_support_management():
                 col1, col2 = st.columns(2)
                 with col1:
                     if st.button("💾 Update Package", key=f"update_support_{package_name}"):
-                        st.session_state.admin_support_packages[package_name].update({
+                        update_catalog_record('SUPPORT_PACKAGES', package_name, {
                             'price': new_price,
                             'description': new_description,
                             'support_requests_standard': new_standard,
@@ -1549,7 +2359,7 @@ def show_admin_support_management():
                 
                 with col2:
                     if st.button("🗑️ Remove Package", key=f"remove_support_{package_name}"):
-                        del st.session_state.admin_support_packages[package_name]
+                        delete_catalog_record('SUPPORT_PACKAGES', package_name)
                         st.success(f"🗑️ Removed {package_name} package")
                         st.rerun()
 
@@ -1565,7 +2375,7 @@ def show_department_selection():
     """, unsafe_allow_html=True)
     
     # Show current selections if returning from a department
-    if len(st.session_state.operational_services) > 0 or len(st.session_state.implementation_projects) > 0:
+    if len(st.session_state.operational_services) > 0 or len(st.session_state.project_store['projects']) > 0:
         st.info("💡 You have existing selections. Switching departments will preserve your data for each department separately.")
     
     cols = st.columns(len(departments_config))
@@ -1573,10 +2383,7 @@ def show_department_selection():
     for i, (dept_key, dept_config) in enumerate(departments_config.items()):
         with cols[i]:
             # Check if this department has any selections
-            dept_projects = [p for p in st.session_state.implementation_projects if p.get('shared_service_dept') == dept_key]
-            dept_services = [k for k, v in st.session_state.operational_services.items() if v.get('selected', False)]
-            
-            has_selections = len(dept_projects) > 0 or len(dept_services) > 0
+            has_selections = get_department_project_count(dept_key) > 0 or get_department_budget(dept_key)['total'] > 0
             
             card_class = "department-card"
             
@@ -1599,113 +2406,1572 @@ def show_department_selection():
                 st.session_state.selected_department = dept_key
                 st.rerun()
 
-# Utility functions (updated to use current data)
-def calculate_operational_total():
+# Pricing units understood by the pricing engine, in lookup order.
+# 'months' converts the catalog rate into an annual cost.
+PRICING_UNITS = {
+    "price_per_user": {"unit": "user/month", "volume_label": "Number of Users", "months": 12},
+    "price_per_transaction": {"unit": "transaction/year", "volume_label": "Annual Transactions", "months": 1},
+    "price_per_supplier": {"unit": "supplier/year", "volume_label": "Number of Suppliers", "months": 1},
+    "price_per_contract": {"unit": "contract/year", "volume_label": "Annual Contracts", "months": 1},
+    "price_per_event": {"unit": "event/year", "volume_label": "Annual Sourcing Events", "months": 1},
+    "price_per_employee": {"unit": "employee/year", "volume_label": "Number of Employees", "months": 1},
+    "price_per_sq_meter": {"unit": "sq meter/year", "volume_label": "Square Meters", "months": 1},
+    "price_per_access_point": {"unit": "access point/year", "volume_label": "Number of Access Points", "months": 1},
+    "price_per_location": {"unit": "location/year", "volume_label": "Number of Locations", "months": 1},
+    "price_per_monitoring_point": {"unit": "monitoring point/year", "volume_label": "Number of Monitoring Points", "months": 1},
+    "price_per_asset": {"unit": "asset/year", "volume_label": "Number of Assets", "months": 1},
+    "price_per_vehicle": {"unit": "vehicle/year", "volume_label": "Number of Vehicles", "months": 1}
+}
+
+# Operational catalogs in lookup order - the first catalog listing a service wins
+OPERATIONAL_CATALOGS = ['ORACLE_SERVICES', 'MICROSOFT_SERVICES', 'PROCUREMENT_SERVICES', 'FACILITY_SAFETY_SERVICES']
+
+PRICING_CATALOG_COLUMNS = ['service_name', 'catalog', 'department', 'unit_key', 'rate', 'setup_cost', 'months']
+
+LINE_ITEM_COLUMNS = [
+    'line_key', 'service_name', 'source', 'department', 'unit_key', 'selected',
+    'new_implementation', 'quantity', 'rate', 'months', 'catalog_setup_cost'
+]
+
+def get_pricing_unit(details):
+    """Return the pricing unit key of a service record, or None for custom pricing"""
+    return next((unit_key for unit_key in PRICING_UNITS if unit_key in details), None)
+
+def compile_pricing_catalog(current_data):
+    """Compile the operational service catalogs into columnar unit/rate/setup arrays"""
+    rows = []
+    for catalog in OPERATIONAL_CATALOGS:
+        for service_name, details in current_data[catalog].items():
+            unit_key = get_pricing_unit(details)
+            rows.append((
+                service_name,
+                catalog,
+                details.get('department', ''),
+                unit_key,
+                details[unit_key] if unit_key else 0,
+                details.get('setup_cost', 0),
+                PRICING_UNITS[unit_key]['months'] if unit_key else 0
+            ))
+    
+    pricing_catalog = pd.DataFrame(rows, columns=PRICING_CATALOG_COLUMNS)
+    return pricing_catalog.drop_duplicates('service_name').set_index('service_name')
+
+def price_operational_services(operational_services, custom_operational, pricing_catalog):
+    """Price all catalog and custom line items in one vectorized pass.
+    
+    Returns a per-line breakdown DataFrame and a dict of totals.
+    """
+    # Catalog selections joined against the compiled pricing arrays
+    selection_rows = [
+        (
+            service_key,
+            data.get('actual_service_name', ''),
+            data.get('selected', False),
+            data.get('new_implementation', False),
+            data.get('users', 0),
+            data.get('volume', data.get('users', 0))
+        )
+        for service_key, data in operational_services.items()
+    ]
+    selections = pd.DataFrame(
+        selection_rows,
+        columns=['line_key', 'service_name', 'selected', 'new_implementation', 'users', 'volume']
+    )
+    catalog_lines = selections.join(pricing_catalog, on='service_name', how='inner')
+    catalog_lines['source'] = catalog_lines['catalog']
+    catalog_lines['catalog_setup_cost'] = catalog_lines['setup_cost']
+    # User-priced services are sized by users, everything else by volume
+    catalog_lines['quantity'] = np.where(
+        catalog_lines['unit_key'] == 'price_per_user', catalog_lines['users'], catalog_lines['volume']
+    )
+    
+    # Custom services carry their own rate and pricing model
+    custom_rows = [
+        (
+            f"custom_{i}",
+            service.get('name', ''),
+            'CUSTOM',
+            service.get('department', ''),
+            service.get('pricing_model'),
+            True,
+            service.get('new_implementation', False),
+            service.get('volume', service.get('users', 0)),
+            service.get('price_per_user', service.get('price_per_unit', 0)),
+            12 if service.get('pricing_model') in ('per_user_monthly', 'monthly') else 1,
+            service.get('setup_cost', 0)
+        )
+        for i, service in enumerate(custom_operational)
+    ]
+    custom_lines = pd.DataFrame(custom_rows, columns=LINE_ITEM_COLUMNS)
+    
+    frames = [frame[LINE_ITEM_COLUMNS] for frame in (catalog_lines, custom_lines) if not frame.empty]
+    lines = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=LINE_ITEM_COLUMNS)
+    
+    quantity = lines['quantity'].to_numpy(dtype=float)
+    rate = lines['rate'].to_numpy(dtype=float)
+    months = lines['months'].to_numpy(dtype=float)
+    included = lines['selected'].to_numpy(dtype=bool) & (quantity > 0)
+    new_implementation = lines['new_implementation'].to_numpy(dtype=bool)
+    
+    lines['annual_cost'] = np.where(included, rate * quantity * months, 0.0)
+    lines['setup_cost'] = np.where(included & new_implementation, lines['catalog_setup_cost'].to_numpy(dtype=float), 0.0)
+    lines['total'] = lines['annual_cost'] + lines['setup_cost']
+    lines = lines[included].drop(columns=['selected', 'catalog_setup_cost']).reset_index(drop=True)
+    
+    totals = {
+        'annual': float(lines['annual_cost'].sum()),
+        'setup': float(lines['setup_cost'].sum()),
+        'total': float(lines['total'].sum()),
+        'by_department': {dept: float(value) for dept, value in lines.groupby('department')['total'].sum().items()}
+    }
+    return lines, totals
+
+def get_selection_fingerprint():
+    """Stable hash of everything the client has selected for the budget"""
+    selections = {
+        'operational_services': st.session_state.operational_services,
+        'custom_operational': st.session_state.custom_operational,
+        'support_package': st.session_state.support_package,
+        'support_extras': st.session_state.support_extras,
+        'implementation_projects': list_implementation_projects()
+    }
+    payload = json.dumps(selections, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def get_pricing_catalog():
+    """Compiled pricing catalog for the current catalog version"""
+    version = get_catalog_version()
+    cache = st.session_state.get('pricing_catalog_cache')
+    if cache is None or cache['version'] != version:
+        cache = {'version': version, 'catalog': compile_pricing_catalog(get_current_data())}
+        st.session_state.pricing_catalog_cache = cache
+    return cache['catalog']
+
+def compute_budget_totals():
+    """Price the current selections from scratch"""
     current_data = get_current_data()
+    operational_lines, operational_totals = price_operational_services(
+        st.session_state.operational_services,
+        st.session_state.custom_operational,
+        get_pricing_catalog()
+    )
+    
+    support_total = price_support_line(current_data)
+    
+    implementation_total = sum(st.session_state.project_store['department_budgets'].values())
+    
+    return {
+        'operational': operational_totals['total'],
+        'support': support_total,
+        'implementation': implementation_total,
+        'total': operational_totals['total'] + support_total + implementation_total,
+        'operational_lines': operational_lines,
+        'operational_totals': operational_totals
+    }
+
+def get_budget_totals():
+    """Budget totals and breakdowns, memoized on the selection fingerprint and catalog version"""
+    key = (get_catalog_version(), get_selection_fingerprint())
+    cache = st.session_state.get('budget_totals_cache')
+    if cache is None or cache['key'] != key:
+        cache = {'key': key, 'totals': compute_budget_totals()}
+        st.session_state.budget_totals_cache = cache
+    return cache['totals']
+
+# Budget ledger - running totals updated by per-line deltas
+BUDGET_BUCKETS = ['operational', 'support', 'implementation']
+
+def find_catalog_service(current_data, service_name):
+    """Look up a service record across the operational catalogs"""
+    for catalog in OPERATIONAL_CATALOGS:
+        if service_name in current_data[catalog]:
+            return current_data[catalog][service_name]
+    return None
+
+def price_catalog_line(data, details):
+    """Annual cost plus setup for one catalog selection - scalar twin of price_operational_services"""
+    unit_key = get_pricing_unit(details)
+    if unit_key == 'price_per_user':
+        quantity = data.get('users', 0)
+    else:
+        quantity = data.get('volume', data.get('users', 0))
+    
+    if not data.get('selected', False) or quantity <= 0:
+        return 0
+    
+    annual_cost = details[unit_key] * quantity * PRICING_UNITS[unit_key]['months'] if unit_key else 0
+    setup_cost = details.get('setup_cost', 0) if data.get('new_implementation', False) else 0
+    return annual_cost + setup_cost
+
+def price_custom_line(service):
+    """Annual cost plus setup for one custom service"""
+    volume = service.get('volume', service.get('users', 0))
+    if volume <= 0:
+        return 0
+    
+    price_per_unit = service.get('price_per_user', service.get('price_per_unit', 0))
+    months = 12 if service.get('pricing_model') in ('per_user_monthly', 'monthly') else 1
+    setup_cost = service.get('setup_cost', 0) if service.get('new_implementation', False) else 0
+    return price_per_unit * volume * months + setup_cost
+
+# Extra requests bought on top of a support package (SAR each)
+SUPPORT_EXTRA_UNIT_PRICES = {'support': 1800, 'training': 5399, 'reports': 5399}
+
+def get_selected_support_package(current_data):
+    """The selected support package record, or None.
+    
+    A package the catalog no longer offers (deleted, renamed or rolled back by an admin)
+    is dropped from the selection and the user is told.
+    """
+    package_name = st.session_state.support_package
+    if not package_name:
+        return None
+    package = current_data['SUPPORT_PACKAGES'].get(package_name)
+    if package is None:
+        st.session_state.support_package = None
+        st.session_state.removed_support_package = package_name
+        st.toast(f"⚠️ The {package_name} support package is no longer offered - please choose another package.")
+    return package
+
+def price_support_line(current_data):
+    """Selected support package plus extras"""
     total = 0
+    package = get_selected_support_package(current_data)
+    if package:
+        total += package['price']
+    
+    for extra, unit_price in SUPPORT_EXTRA_UNIT_PRICES.items():
+        total += st.session_state.support_extras.get(extra, 0) * unit_price
+    return total
+
+def ledger_post(ledger, line_key, bucket, department, amount):
+    """Replace one line's contribution: subtract the old amount and add the new one"""
+    old_line = ledger['lines'].pop(line_key, None)
+    if old_line:
+        old_bucket, old_department, old_amount = old_line
+        ledger['departments'][old_bucket][old_department] -= old_amount
+        ledger['totals'][old_bucket] -= old_amount
+    
+    if amount:
+        ledger['lines'][line_key] = (bucket, department, amount)
+        ledger['departments'][bucket][department] = ledger['departments'][bucket].get(department, 0) + amount
+        ledger['totals'][bucket] += amount
+
+def rebuild_budget_ledger():
+    """Build the ledger from scratch - used on first access and after catalog changes"""
+    current_data = get_current_data()
+    ledger = {
+        'catalog_version': get_catalog_version(),
+        'lines': {},
+        'departments': {bucket: {} for bucket in BUDGET_BUCKETS},
+        'totals': {bucket: 0 for bucket in BUDGET_BUCKETS}
+    }
     
-    # Predefined services (IT)
     for service_key, data in st.session_state.operational_services.items():
-        if data.get('selected', False) and data.get('users', 0) > 0:
-            users = data.get('users', 0)
-            actual_service_name = data.get('actual_service_name', '')
-            is_new_implementation = data.get('new_implementation', False)
-            
-            # Check Oracle services
-            if actual_service_name in current_data['ORACLE_SERVICES']:
-                service_info = current_data['ORACLE_SERVICES'][actual_service_name]
-                monthly_cost = service_info['price_per_user'] * users
-                setup_cost = service_info['setup_cost'] if is_new_implementation else 0
-                total += (monthly_cost * 12) + setup_cost
-            # Check Microsoft services
-            elif actual_service_name in current_data['MICROSOFT_SERVICES']:
-                service_info = current_data['MICROSOFT_SERVICES'][actual_service_name]
-                monthly_cost = service_info['price_per_user'] * users
-                setup_cost = service_info['setup_cost'] if is_new_implementation else 0
-                total += (monthly_cost * 12) + setup_cost
-            # Check Procurement services
-            elif actual_service_name in current_data['PROCUREMENT_SERVICES']:
-                service_info = current_data['PROCUREMENT_SERVICES'][actual_service_name]
-                volume = data.get('volume', users)  # Use volume or users depending on service
-                
-                if 'price_per_user' in service_info:
-                    monthly_cost = service_info['price_per_user'] * users
-                    annual_cost = monthly_cost * 12
-                elif 'price_per_transaction' in service_info:
-                    annual_cost = service_info['price_per_transaction'] * volume
-                elif 'price_per_supplier' in service_info:
-                    annual_cost = service_info['price_per_supplier'] * volume
-                elif 'price_per_contract' in service_info:
-                    annual_cost = service_info['price_per_contract'] * volume
-                elif 'price_per_event' in service_info:
-                    annual_cost = service_info['price_per_event'] * volume
-                else:
-                    annual_cost = 0
-                
-                setup_cost = service_info['setup_cost'] if is_new_implementation else 0
-                total += annual_cost + setup_cost
-            # Check Facility & Safety services
-            elif actual_service_name in current_data['FACILITY_SAFETY_SERVICES']:
-                service_info = current_data['FACILITY_SAFETY_SERVICES'][actual_service_name]
-                volume = data.get('volume', users)  # Use volume or users depending on service
-                
-                if 'price_per_user' in service_info:
-                    monthly_cost = service_info['price_per_user'] * users
-                    annual_cost = monthly_cost * 12
-                elif 'price_per_employee' in service_info:
-                    annual_cost = service_info['price_per_employee'] * volume
-                elif 'price_per_sq_meter' in service_info:
-                    annual_cost = service_info['price_per_sq_meter'] * volume
-                elif 'price_per_access_point' in service_info:
-                    annual_cost = service_info['price_per_access_point'] * volume
-                elif 'price_per_location' in service_info:
-                    annual_cost = service_info['price_per_location'] * volume
-                elif 'price_per_monitoring_point' in service_info:
-                    annual_cost = service_info['price_per_monitoring_point'] * volume
-                elif 'price_per_asset' in service_info:
-                    annual_cost = service_info['price_per_asset'] * volume
-                elif 'price_per_vehicle' in service_info:
-                    annual_cost = service_info['price_per_vehicle'] * volume
-                else:
-                    annual_cost = 0
-                
-                setup_cost = service_info['setup_cost'] if is_new_implementation else 0
-                total += annual_cost + setup_cost
+        details = find_catalog_service(current_data, data.get('actual_service_name', ''))
+        if details:
+            ledger_post(ledger, f"operational:{service_key}", 'operational',
+                        details.get('department', ''), price_catalog_line(data, details))
+    
+    for i, service in enumerate(st.session_state.custom_operational):
+        ledger_post(ledger, f"custom:{service.get('id', i)}", 'operational',
+                    service.get('department', ''), price_custom_line(service))
     
-    # Custom services
-    for custom_service in st.session_state.custom_operational:
-        volume = custom_service.get('volume', custom_service.get('users', 0))
-        price_per_unit = custom_service.get('price_per_user', custom_service.get('price_per_unit', 0))
+    ledger_post(ledger, 'support', 'support',
+                st.session_state.get('support_department'), price_support_line(current_data))
+    
+    for project in list_implementation_projects():
+        ledger_post(ledger, f"project:{project['id']}", 'implementation',
+                    project.get('shared_service_dept', ''), project.get('budget', 0))
+    
+    st.session_state.budget_ledger = ledger
+    return ledger
+
+def get_budget_ledger():
+    """Current budget ledger, rebuilt only when the catalog version has moved on"""
+    ledger = st.session_state.get('budget_ledger')
+    if ledger is None or ledger['catalog_version'] != get_catalog_version():
+        ledger = rebuild_budget_ledger()
+    return ledger
+
+def reset_budget_ledger():
+    """Drop the ledger so it is rebuilt from session state on next access"""
+    st.session_state.pop('budget_ledger', None)
+
+def check_budget_ledger(ledger):
+    """Compare running ledger totals with a full repricing (enabled by tests)"""
+    expected = compute_budget_totals()
+    for bucket in BUDGET_BUCKETS:
+        if abs(ledger['totals'][bucket] - expected[bucket]) > 0.01:
+            raise RuntimeError(
+                f"Budget ledger out of sync for {bucket}: "
+                f"ledger {ledger['totals'][bucket]:,.2f} vs recomputed {expected[bucket]:,.2f}"
+            )
+
+def post_budget_line(line_key, bucket, department, amount):
+    ledger = get_budget_ledger()
+    previous_line = ledger['lines'].get(line_key)
+    ledger_post(ledger, line_key, bucket, department, amount)
+    if st.session_state.get('ledger_consistency_check', False):
+        check_budget_ledger(ledger)
+    
+    # Keep the sidebar totals in step with the change
+    if previous_line != ledger['lines'].get(line_key):
+        show_budget_summary()
+
+def get_department_budget(department):
+    """O(1) per-department totals from the ledger"""
+    ledger = get_budget_ledger()
+    budget = {bucket: ledger['departments'][bucket].get(department, 0) for bucket in BUDGET_BUCKETS}
+    budget['total'] = sum(budget.values())
+    return budget
+
+# Selection updates - every write goes through the ledger
+def set_operational_service(service_key, entry):
+    st.session_state.operational_services[service_key] = entry
+    details = find_catalog_service(get_current_data(), entry.get('actual_service_name', ''))
+    if details:
+        post_budget_line(f"operational:{service_key}", 'operational',
+                         details.get('department', ''), price_catalog_line(entry, details))
+
+def add_custom_service(service):
+    st.session_state.custom_operational.append(service)
+    post_budget_line(f"custom:{service['id']}", 'operational', service.get('department', ''), price_custom_line(service))
+
+def remove_custom_service(index):
+    service = st.session_state.custom_operational.pop(index)
+    if 'id' in service:
+        post_budget_line(f"custom:{service['id']}", 'operational', service.get('department', ''), 0)
+    else:
+        reset_budget_ledger()
+
+def select_support_package(package_name):
+    st.session_state.support_package = package_name
+    st.session_state.support_department = st.session_state.selected_department
+    post_budget_line('support', 'support', st.session_state.support_department, price_support_line(get_current_data()))
+
+def set_support_extra(extra, count):
+    if st.session_state.support_extras.get(extra, 0) == count:
+        return
+    st.session_state.support_extras[extra] = count
+    post_budget_line('support', 'support', st.session_state.get('support_department'), price_support_line(get_current_data()))
+
+def add_implementation_project(project):
+    project.setdefault('id', str(uuid.uuid4()))
+    index_project(st.session_state.project_store, project)
+    post_budget_line(f"project:{project['id']}", 'implementation', project.get('shared_service_dept', ''), project.get('budget', 0))
+
+def remove_implementation_project(project_id):
+    project = unindex_project(st.session_state.project_store, project_id)
+    post_budget_line(f"project:{project_id}", 'implementation', project.get('shared_service_dept', ''), 0)
+
+# Implementation project store - projects keyed by their UUID, with a secondary index
+# (department -> category -> project IDs) and running budget sums per department, so
+# lookups, removal and per-department totals never scan every project
+PROJECT_QUARTERS = ['Q1', 'Q2', 'Q3', 'Q4']
+
+def get_project_quarter(project):
+    """Quarter a project runs in, or None when it spans the year (RPA, multi-quarter)"""
+    start, end = project['period'] if 'period' in project else get_project_period(project)
+    return PROJECT_QUARTERS[start // 3] if end - start == 2 else None
+
+def build_project_store(projects):
+    store = {'projects': {}, 'by_category': {}, 'department_budgets': {},
+             'schedules': {}, 'department_schedules': {}}
+    for project in projects:
+        project.setdefault('id', str(uuid.uuid4()))
+        index_project(store, project)
+    return store
+
+def index_project(store, project):
+    project_id = project['id']
+    department = project.get('shared_service_dept', '')
+    store['projects'][project_id] = project
+    # Dicts with None values serve as insertion-ordered sets of project IDs
+    store['by_category'].setdefault(department, {}).setdefault(project.get('category', '⚙️ Custom & Specialized'), {})[project_id] = None
+    store['department_budgets'][department] = store['department_budgets'].get(department, 0) + project.get('budget', 0)
+    
+    schedule = schedule_project(project)
+    store['schedules'][project_id] = schedule
+    store['department_schedules'][department] = store['department_schedules'].get(department, 0) + schedule
+
+def unindex_project(store, project_id):
+    """Remove a project from the store and its indexes, returning it"""
+    project = store['projects'].pop(project_id)
+    department = project.get('shared_service_dept', '')
+    category = project.get('category', '⚙️ Custom & Specialized')
+    store['by_category'][department][category].pop(project_id)
+    if not store['by_category'][department][category]:
+        del store['by_category'][department][category]
+    if not store['by_category'][department]:
+        del store['by_category'][department]
+    store['department_budgets'][department] -= project.get('budget', 0)
+    store['department_schedules'][department] = store['department_schedules'][department] - store['schedules'].pop(project_id)
+    if department not in store['by_category']:
+        del store['department_budgets'][department]
+        del store['department_schedules'][department]
+    return project
+
+def list_implementation_projects():
+    return list(st.session_state.project_store['projects'].values())
+
+def get_department_projects_by_category(department):
+    """{category: [projects]} for one shared service department"""
+    store = st.session_state.project_store
+    return {
+        category: [store['projects'][project_id] for project_id in project_ids]
+        for category, project_ids in store['by_category'].get(department, {}).items()
+    }
+
+def get_department_project_count(department):
+    return sum(len(project_ids) for project_ids in st.session_state.project_store['by_category'].get(department, {}).values())
+
+def get_department_project_budget(department):
+    return st.session_state.project_store['department_budgets'].get(department, 0)
+
+def get_department_project_schedule(department):
+    """Monthly implementation billing for a department - the sum of its projects' cached schedules"""
+    return st.session_state.project_store['department_schedules'].get(department, np.zeros(12))
+
+# Utility functions (updated to use current data)
+def calculate_operational_total():
+    return get_budget_ledger()['totals']['operational']
+
+def calculate_support_total():
+    return get_budget_ledger()['totals']['support']
+
+def calculate_implementation_total():
+    return get_budget_ledger()['totals']['implementation']
+
+def calculate_total_budget():
+    return sum(get_budget_ledger()['totals'].values())
+
+# Budget submissions - persisted by a write-behind thread so a burst of
+# submissions never waits on the database in the script thread
+SUBMISSION_BATCH_SIZE = 50
+SUBMISSION_FLUSH_INTERVAL = 0.2  # seconds to wait for more submissions before flushing a batch
+SUBMISSION_RETRY_DELAY = 0.5  # first backoff after a failed write, doubled up to the maximum
+SUBMISSION_RETRY_MAX_DELAY = 30
+
+logger = logging.getLogger("shared_services")
+
+SUBMISSION_COLUMNS = [
+    'reference_id', 'company', 'department', 'shared_service_dept', 'contact_person', 'email',
+    'submitted_at', 'catalog_version', 'operational_total', 'support_total', 'implementation_total',
+    'total_budget', 'selections'
+]
+
+SUBMISSION_LINE_COLUMNS = [
+    'reference_id', 'line_no', 'bucket', 'name', 'department', 'quantity',
+    'annual_cost', 'setup_cost', 'total', 'details'
+]
+
+def build_submission_lines(budget_totals):
+    """Flatten the priced selections into submission line items"""
+    lines = []
+    for row in budget_totals['operational_lines'].itertuples(index=False):
+        lines.append({
+            'bucket': 'operational',
+            'name': row.service_name,
+            'department': row.department,
+            'quantity': float(row.quantity),
+            'annual_cost': float(row.annual_cost),
+            'setup_cost': float(row.setup_cost),
+            'total': float(row.total),
+            'details': {'source': row.source, 'unit_key': row.unit_key, 'rate': float(row.rate)}
+        })
+    
+    package = get_selected_support_package(get_current_data())
+    if package:
+        price = package['price']
+        lines.append({
+            'bucket': 'support',
+            'name': f"{st.session_state.support_package} Support Package",
+            'department': st.session_state.support_department,
+            'quantity': 1,
+            'annual_cost': price,
+            'setup_cost': 0,
+            'total': price,
+            'details': {'package': st.session_state.support_package}
+        })
+    
+    for extra, unit_price in SUPPORT_EXTRA_UNIT_PRICES.items():
+        count = st.session_state.support_extras.get(extra, 0)
+        if count > 0:
+            lines.append({
+                'bucket': 'support',
+                'name': f"Extra {extra} requests",
+                'department': st.session_state.support_department,
+                'quantity': count,
+                'annual_cost': count * unit_price,
+                'setup_cost': 0,
+                'total': count * unit_price,
+                'details': {'extra': extra, 'unit_price': unit_price}
+            })
+    
+    for project in list_implementation_projects():
+        lines.append({
+            'bucket': 'implementation',
+            'name': project['name'],
+            'department': project.get('shared_service_dept'),
+            'quantity': 1,
+            'annual_cost': project.get('budget', 0),
+            'setup_cost': 0,
+            'total': project.get('budget', 0),
+            'details': {key: project.get(key) for key in ('id', 'category', 'type', 'timeline', 'priority', 'rpa_package_name')}
+        })
+    
+    return lines
+
+def build_submission(reference_id):
+    """Snapshot the current session's budget as a submission record"""
+    budget_totals = get_budget_totals()
+    company_info = st.session_state.company_info
+    return {
+        'reference_id': reference_id,
+        'company': company_info.get('company', ''),
+        'department': company_info.get('department', ''),
+        'shared_service_dept': st.session_state.selected_department,
+        'contact_person': company_info.get('contact_person', ''),
+        'email': company_info.get('email', ''),
+        'submitted_at': datetime.now().isoformat(timespec='seconds'),
+        'catalog_version': get_catalog_version(),
+        'operational_total': budget_totals['operational'],
+        'support_total': budget_totals['support'],
+        'implementation_total': budget_totals['implementation'],
+        'total_budget': budget_totals['total'],
+        # Round-trip through JSON so later edits in the session cannot change a queued submission
+        'selections': json.loads(json.dumps({
+            'operational_services': st.session_state.operational_services,
+            'custom_operational': st.session_state.custom_operational,
+            'support_package': st.session_state.support_package,
+            'support_extras': st.session_state.support_extras,
+            'implementation_projects': list_implementation_projects(),
+            'recurring_billing_profile': st.session_state.get('recurring_billing_profile', RECURRING_BILLING_PROFILE),
+            'company_info': company_info
+        }, default=str)),
+        'lines': build_submission_lines(budget_totals)
+    }
+
+def get_current_submission():
+    """The session's budget as a submission record, shared by the summary analyses.
+    
+    Memoized on the same selection fingerprint and catalog version as get_budget_totals,
+    so a rerun that changes no selection reuses the previous record.
+    """
+    get_budget_totals()
+    key = st.session_state.budget_totals_cache['key']
+    cache = st.session_state.get('current_submission_cache')
+    if cache is None or cache['key'] != key:
+        cache = {'key': key, 'submission': build_submission('CURRENT')}
+        st.session_state.current_submission_cache = cache
+    return cache['submission']
+
+def write_submissions(conn, submissions):
+    """Write a batch of submissions in a single transaction"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.executemany(
+            f"INSERT OR REPLACE INTO submissions ({', '.join(SUBMISSION_COLUMNS)}) "
+            f"VALUES ({', '.join('?' for _ in SUBMISSION_COLUMNS)})",
+            [
+                [json.dumps(submission[column], default=str) if column == 'selections' else submission[column]
+                 for column in SUBMISSION_COLUMNS]
+                for submission in submissions
+            ]
+        )
+        conn.executemany(
+            "DELETE FROM submission_lines WHERE reference_id = ?",
+            [(submission['reference_id'],) for submission in submissions]
+        )
+        conn.executemany(
+            f"INSERT INTO submission_lines ({', '.join(SUBMISSION_LINE_COLUMNS)}) "
+            f"VALUES ({', '.join('?' for _ in SUBMISSION_LINE_COLUMNS)})",
+            [
+                (submission['reference_id'], line_no, line['bucket'], line['name'], line['department'],
+                 line['quantity'], line['annual_cost'], line['setup_cost'], line['total'],
+                 json.dumps(line['details'], default=str))
+                for submission in submissions
+                for line_no, line in enumerate(submission['lines'])
+            ]
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+def run_submission_writer(writer):
+    """Background loop: drain queued submissions and write them in batches"""
+    conn = get_db_connection()
+    while True:
+        batch = [writer['queue'].get()]
+        while len(batch) < SUBMISSION_BATCH_SIZE:
+            try:
+                batch.append(writer['queue'].get(timeout=SUBMISSION_FLUSH_INTERVAL))
+            except queue.Empty:
+                break
+        
+        # Accepted submissions stay pending (and readable) until their batch is committed
+        delay = SUBMISSION_RETRY_DELAY
+        while True:
+            try:
+                write_submissions(conn, batch)
+                break
+            except Exception as error:
+                logger.exception("Failed to write %d submissions, retrying in %.1fs", len(batch), delay)
+                with writer['lock']:
+                    writer['error'] = str(error)
+                time.sleep(delay)
+                delay = min(delay * 2, SUBMISSION_RETRY_MAX_DELAY)
         
-        if custom_service.get('pricing_model') == 'monthly':
-            annual_cost = price_per_unit * volume * 12
+        with writer['lock']:
+            writer['error'] = None
+            for submission in batch:
+                writer['pending'].pop(submission['reference_id'], None)
+        for _ in batch:
+            writer['queue'].task_done()
+
+def wait_for_submission_writer(writer):
+    """Block until every queued submission is written, or the writer reports failing writes"""
+    while writer['queue'].unfinished_tasks and not writer['error']:
+        time.sleep(SUBMISSION_FLUSH_INTERVAL / 4)
+
+@st.cache_resource
+def get_submission_writer():
+    """Process-wide write-behind queue for submissions"""
+    writer = {'queue': queue.Queue(), 'pending': {}, 'lock': threading.Lock(), 'error': None}
+    threading.Thread(target=run_submission_writer, args=(writer,), name="submission-writer", daemon=True).start()
+    # Flush anything still queued when the server shuts down
+    atexit.register(wait_for_submission_writer, writer)
+    return writer
+
+def queue_submission(submission):
+    """Hand a submission to the write-behind thread and return immediately"""
+    writer = get_submission_writer()
+    with writer['lock']:
+        writer['pending'][submission['reference_id']] = submission
+    writer['queue'].put(submission)
+
+def flush_submissions():
+    """Block until every queued submission has been written (or writes are failing)"""
+    wait_for_submission_writer(get_submission_writer())
+
+def get_submission_write_error(reference_id):
+    """Why a queued submission is not stored yet, or None once it is written"""
+    writer = get_submission_writer()
+    with writer['lock']:
+        return writer['error'] if reference_id in writer['pending'] else None
+
+def row_to_submission(row):
+    submission = dict(zip(SUBMISSION_COLUMNS, row))
+    submission['selections'] = json.loads(submission['selections'])
+    return submission
+
+def get_submission(reference_id):
+    """Look up a submission by reference ID, including ones not yet flushed"""
+    writer = get_submission_writer()
+    with writer['lock']:
+        if reference_id in writer['pending']:
+            return writer['pending'][reference_id]
+    
+    row = get_db_connection().execute(
+        f"SELECT {', '.join(SUBMISSION_COLUMNS)} FROM submissions WHERE reference_id = ?", (reference_id,)
+    ).fetchone()
+    if row is None:
+        return None
+    
+    submission = row_to_submission(row)
+    line_columns = SUBMISSION_LINE_COLUMNS[2:]
+    submission['lines'] = []
+    for row in get_db_connection().execute(
+        f"SELECT {', '.join(line_columns)} FROM submission_lines WHERE reference_id = ? ORDER BY line_no",
+        (reference_id,)
+    ):
+        line = dict(zip(line_columns, row))
+        line['details'] = json.loads(line['details']) if line['details'] else {}
+        submission['lines'].append(line)
+    return submission
+
+def find_submissions(company, department=None):
+    """Submissions for a company (and optionally a requesting department), newest first"""
+    query = f"SELECT {', '.join(SUBMISSION_COLUMNS)} FROM submissions WHERE company = ?"
+    params = [company]
+    if department:
+        query += " AND department = ?"
+        params.append(department)
+    
+    submissions = [row_to_submission(row) for row in get_db_connection().execute(query, params)]
+    
+    writer = get_submission_writer()
+    with writer['lock']:
+        stored = {submission['reference_id'] for submission in submissions}
+        submissions += [
+            submission for submission in writer['pending'].values()
+            if submission['company'] == company
+            and (not department or submission['department'] == department)
+            and submission['reference_id'] not in stored
+        ]
+    
+    return sorted(submissions, key=lambda submission: submission['submitted_at'], reverse=True)
+
+# Budget drafts - compact, zlib-compressed JSON stored server-side per contact email and company.
+# Only selected catalog services are kept; unselected cards re-initialise themselves on render.
+DRAFT_FORMAT_VERSION = 1
+
+def encode_draft():
+    """Serialize the session's selections into a compressed draft payload"""
+    payload = {
+        'v': DRAFT_FORMAT_VERSION,
+        'operational': [
+            [service_key, data.get('actual_service_name', ''), data.get('users', 0),
+             data.get('volume', 0), int(data.get('new_implementation', False))]
+            for service_key, data in st.session_state.operational_services.items()
+            if data.get('selected', False)
+        ],
+        'custom_operational': st.session_state.custom_operational,
+        'support_package': st.session_state.support_package,
+        'support_department': st.session_state.support_department,
+        'support_extras': st.session_state.support_extras,
+        'implementation_projects': list_implementation_projects(),
+        'company_info': st.session_state.company_info
+    }
+    return zlib.compress(json.dumps(payload, separators=(',', ':'), default=str).encode(), 6)
+
+def decode_draft(blob):
+    """Inverse of encode_draft - returns the session values to restore"""
+    payload = json.loads(zlib.decompress(blob))
+    if payload.get('v') != DRAFT_FORMAT_VERSION:
+        raise ValueError(f"Unsupported draft format version: {payload.get('v')}")
+    
+    return {
+        'operational_services': {
+            service_key: {
+                'selected': True,
+                'users': users,
+                'volume': volume,
+                'actual_service_name': service_name,
+                'new_implementation': bool(new_implementation)
+            }
+            for service_key, service_name, users, volume, new_implementation in payload['operational']
+        },
+        'custom_operational': payload['custom_operational'],
+        'support_package': payload['support_package'],
+        'support_department': payload['support_department'],
+        'support_extras': payload['support_extras'],
+        'implementation_projects': payload['implementation_projects'],
+        'company_info': payload['company_info']
+    }
+
+def normalize_draft_email(email):
+    return (email or '').strip().lower()
+
+def save_draft(email, company):
+    get_db_connection().execute(
+        """INSERT OR REPLACE INTO drafts (email, company, format_version, saved_at, payload)
+           VALUES (?, ?, ?, ?, ?)""",
+        (normalize_draft_email(email), company, DRAFT_FORMAT_VERSION,
+         datetime.now().isoformat(timespec='seconds'), encode_draft())
+    )
+
+def load_draft(email, company):
+    """Stored draft for a contact and company, or None"""
+    row = get_db_connection().execute(
+        "SELECT payload FROM drafts WHERE email = ? AND company = ?",
+        (normalize_draft_email(email), company)
+    ).fetchone()
+    return decode_draft(row[0]) if row else None
+
+def restore_draft(draft):
+    """Replace the session's selections with a decoded draft.
+    
+    Must run before any widget is created in the rerun, so it is applied from
+    initialize_session_state via pending_draft.
+    """
+    # Drop widget state so every card and input re-seeds from the restored selections
+    service_keys = set(st.session_state.operational_services) | set(draft['operational_services'])
+    for service_key in service_keys:
+        for suffix in ('_selected', '_new_impl', '_users', '_volume'):
+            st.session_state.pop(f"{service_key}{suffix}", None)
+    for widget_key in ('extra_support_requests_input', 'extra_training_requests_input', 'extra_reports_requests_input'):
+        st.session_state.pop(widget_key, None)
+    
+    for key in ('operational_services', 'custom_operational', 'support_package', 'support_department',
+                'support_extras', 'company_info'):
+        st.session_state[key] = draft[key]
+    st.session_state.project_store = build_project_store(draft['implementation_projects'])
+    
+    # Company information widgets
+    company_info = draft['company_info']
+    if company_info.get('company') in ALKHORAYEF_COMPANIES:
+        st.session_state.company_selection = company_info['company']
+    if company_info.get('department') in COMPANY_DEPARTMENTS:
+        st.session_state.department_selection = company_info['department']
+    st.session_state.contact_person = company_info.get('contact_person', '')
+    st.session_state.email = company_info.get('email', '')
+    
+    reset_budget_ledger()
+
+# Full data export - every catalog record and stored submission streamed through gzip as
+# JSONL or CSV into a temporary file. Incremental exports use the catalog change log and
+# submission timestamps.
+DATA_EXPORT_CSV_COLUMNS = ['record_type', 'catalog', 'key', 'version', 'changed_at', 'deleted', 'data']
+DATA_EXPORT_DIR = os.path.join(tempfile.gettempdir(), 'shared_services_exports')
+
+def iter_changed_catalog_records(since_version=None, since_timestamp=None):
+    """Yield (catalog_key, name, version, changed_at) for records changed after the given point"""
+    if since_version is not None:
+        condition, parameter = "version > ?", since_version
+    else:
+        condition, parameter = "changed_at > ?", since_timestamp
+    yield from get_db_connection().execute(
+        f"""SELECT catalog_key, name, MAX(version), MAX(changed_at) FROM catalog_changes
+            WHERE {condition} GROUP BY catalog_key, name ORDER BY catalog_key, name""",
+        (parameter,)
+    )
+
+def iter_data_export_records(since_version=None, since_timestamp=None):
+    """Lazily yield every exportable record as a dict, or only changes when a since point is given"""
+    flush_submissions()
+    snapshot = get_catalog_store()['current']
+    incremental = since_version is not None or since_timestamp is not None
+    
+    yield {
+        'record_type': 'export', 'catalog': None, 'key': None, 'version': snapshot['version'],
+        'changed_at': datetime.now().isoformat(timespec='seconds'), 'deleted': False,
+        'data': {'since_version': since_version, 'since_timestamp': since_timestamp}
+    }
+    
+    if incremental:
+        for catalog_key, name, version, changed_at in iter_changed_catalog_records(since_version, since_timestamp):
+            record = snapshot['data'].get(catalog_key, {}).get(name)
+            yield {
+                'record_type': 'catalog', 'catalog': catalog_key, 'key': name, 'version': version,
+                'changed_at': changed_at, 'deleted': record is None,
+                'data': thaw_catalog_value(record) if record is not None else None
+            }
+    else:
+        for catalog_key, catalog in snapshot['data'].items():
+            for name, record in catalog.items():
+                yield {
+                    'record_type': 'catalog', 'catalog': catalog_key, 'key': name, 'version': snapshot['version'],
+                    'changed_at': None, 'deleted': False, 'data': thaw_catalog_value(record)
+                }
+    
+    # Submissions are not catalog-versioned - a version-based export covers catalogs only
+    if since_version is not None:
+        return
+    
+    conn = get_db_connection()
+    condition = "WHERE submitted_at > ?" if since_timestamp is not None else ""
+    parameters = (since_timestamp,) if since_timestamp is not None else ()
+    
+    for row in conn.execute(f"SELECT {', '.join(SUBMISSION_COLUMNS)} FROM submissions {condition} ORDER BY submitted_at", parameters):
+        submission = row_to_submission(row)
+        yield {
+            'record_type': 'submission', 'catalog': None, 'key': submission['reference_id'],
+            'version': submission['catalog_version'], 'changed_at': submission['submitted_at'],
+            'deleted': False, 'data': submission
+        }
+    
+    for row in conn.execute(
+        f"""SELECT {', '.join('l.' + column for column in SUBMISSION_LINE_COLUMNS)}, s.catalog_version, s.submitted_at
+            FROM submission_lines l JOIN submissions s ON s.reference_id = l.reference_id
+            {condition.replace('submitted_at', 's.submitted_at')} ORDER BY s.submitted_at, l.reference_id, l.line_no""",
+        parameters
+    ):
+        line = dict(zip(SUBMISSION_LINE_COLUMNS, row[:-2]))
+        line['details'] = json.loads(line['details']) if line['details'] else None
+        yield {
+            'record_type': 'submission_line', 'catalog': None, 'key': f"{line['reference_id']}:{line['line_no']}",
+            'version': row[-2], 'changed_at': row[-1], 'deleted': False, 'data': line
+        }
+
+def write_data_export(records, export_format, path):
+    """Stream records into a gzip-compressed JSONL or CSV file at path"""
+    with gzip.open(path, 'wt', encoding='utf-8', newline='') as text:
+        if export_format == 'csv':
+            writer = csv.writer(text)
+            writer.writerow(DATA_EXPORT_CSV_COLUMNS)
+            for record in records:
+                writer.writerow([
+                    json.dumps(record[column], default=str) if column == 'data' else record[column]
+                    for column in DATA_EXPORT_CSV_COLUMNS
+                ])
         else:
-            annual_cost = price_per_unit * volume
-            
-        setup_cost = custom_service.get('setup_cost', 0) if custom_service.get('new_implementation', False) else 0
-        total += annual_cost + setup_cost
+            for record in records:
+                text.write(json.dumps(record, default=str) + '\n')
+    return path
+
+def export_all_data(export_format, since_version=None, since_timestamp=None):
+    """Write an export to a temporary file and return its path - memory stays flat however many records"""
+    os.makedirs(DATA_EXPORT_DIR, exist_ok=True)
+    handle, path = tempfile.mkstemp(prefix="export_", suffix=f".{export_format}.gz", dir=DATA_EXPORT_DIR)
+    os.close(handle)
+    try:
+        return write_data_export(iter_data_export_records(since_version, since_timestamp), export_format, path)
+    except Exception:
+        os.remove(path)
+        raise
+
+def read_data_export(path):
+    with open(path, 'rb') as export_file:
+        return export_file.read()
+
+def discard_data_export(export_future):
+    """Delete the file of a finished export that is being replaced"""
+    if export_future is not None and export_future.done() and not export_future.exception():
+        if os.path.exists(export_future.result()):
+            os.remove(export_future.result())
+
+# Cash-flow schedule engine - every amount is billed over a period of 2025 months according to
+# a billing profile. Project periods are parsed once, when the project is created, and each
+# project's 12-month vector is cached in the project store.
+MONTHS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+BILLING_PROFILES = {
+    'upfront': "Upfront (first month)",
+    'straight_line': "Straight-line (monthly)",
+    'milestone': "Milestones (each quarter-end)",
+    'year_end': "Year-end (December)"
+}
+
+# Operational services and support packages are billed at year-end unless chosen otherwise
+RECURRING_BILLING_PROFILE = 'year_end'
+
+def parse_project_timeline(timeline):
+    """(start_month, end_month) indexes for a timeline - a quarter, or the whole year"""
+    match = re.search(r"\bQ([1-4])\b", timeline or '')
+    if match:
+        quarter = int(match.group(1))
+        return 3 * (quarter - 1), 3 * quarter - 1
+    return 0, 11
+
+def default_billing_profile(project):
+    """Single-quarter projects are billed on completion; RPA and longer projects evenly"""
+    return 'milestone' if get_project_quarter(project) else 'straight_line'
+
+def billing_vector(amount, start, end, profile):
+    """Spread amount over months start..end (inclusive) as a 12-month NumPy vector"""
+    vector = np.zeros(12)
+    if profile == 'upfront':
+        vector[start] = amount
+    elif profile == 'straight_line':
+        vector[start:end + 1] = amount / (end - start + 1)
+    elif profile == 'milestone':
+        milestones = np.arange(start, end + 1)
+        milestones = milestones[milestones % 3 == 2]
+        vector[milestones if len(milestones) else [end]] = amount / max(len(milestones), 1)
+    else:
+        vector[11] = amount
+    return vector
+
+def get_project_period(project):
+    """RPA packages run across the whole year whatever their timeline"""
+    if project.get('rpa_package', False):
+        return 0, 11
+    return parse_project_timeline(project.get('timeline', 'Q4 2025'))
+
+def schedule_project(project):
+    """Parse the project's period and billing profile (once) and return its monthly billing vector"""
+    if 'period' not in project:
+        project['period'] = list(get_project_period(project))
+    if project.get('billing_profile', 'auto') == 'auto':
+        project['billing_profile'] = default_billing_profile(project)
+    start, end = project['period']
+    return billing_vector(project.get('budget', 0), start, end, project['billing_profile'])
+
+def compute_monthly_cash_flow(operational_total, support_total, project_schedule, recurring_profile=RECURRING_BILLING_PROFILE):
+    """3 x 12 matrix of operational, support and implementation billing by month"""
+    return np.vstack([
+        billing_vector(operational_total, 0, 11, recurring_profile),
+        billing_vector(support_total, 0, 11, recurring_profile),
+        project_schedule
+    ])
+
+def schedule_projects(projects):
+    """Summed billing vector for stored project dicts (e.g. from a submission)"""
+    return sum((schedule_project(dict(project)) for project in projects), np.zeros(12))
+
+# Multi-year total cost of ownership - every budget line becomes a row of quoted costs for
+# years 1-3 plus a run rate for later years; escalation and discounting are applied to the
+# whole line x year matrix at once, so group-wide projections are a single NumPy pass
+TCO_LINE_COLUMNS = ['reference_id', 'company', 'department', 'bucket', 'name', 'year_1', 'year_2', 'year_3', 'run_rate']
+TCO_DEFAULT_HORIZON = 5
+TCO_DEFAULT_DISCOUNT_RATE = 0.08
+TCO_DEFAULT_ESCALATION_RATE = 0.03
+
+def build_tco_line_items(submissions):
+    """One row per budget line of each submission, as quoted year 1-3 costs and a run rate"""
+    rows = []
+    for submission in submissions:
+        base = [submission['reference_id'], submission['company']]
+        for line in submission['lines']:
+            if line['bucket'] == 'implementation':
+                continue
+            # Recurring lines: setup is a year-1 cost only
+            annual = line['annual_cost']
+            rows.append(base + [line['department'], line['bucket'], line['name'], annual + line['setup_cost'], annual, annual, annual])
+        
+        for project in submission['selections'].get('implementation_projects', []):
+            if project.get('rpa_package', False):
+                rpa = project.get('rpa_details', {})
+                # After year 3 the RPA package keeps running at its year-3 support cost
+                costs = [rpa.get('year_1_total', 0), rpa.get('year_2_cost', 0), rpa.get('year_3_cost', 0), rpa.get('year_3_cost', 0)]
+            else:
+                costs = [project.get('budget', 0), 0, 0, 0]
+            rows.append(base + [project.get('shared_service_dept'), 'implementation', project.get('name', '')] + costs)
     
-    return total
+    return pd.DataFrame(rows, columns=TCO_LINE_COLUMNS)
 
-def calculate_support_total():
+def compute_tco(line_items, horizon=TCO_DEFAULT_HORIZON, discount_rate=TCO_DEFAULT_DISCOUNT_RATE,
+                escalation_rate=TCO_DEFAULT_ESCALATION_RATE):
+    """Year-by-line cost matrix with escalation, plus nominal and discounted (NPV) totals.
+    
+    Year 1 is undiscounted and unescalated; year n is escalated by (1 + escalation)^(n-1)
+    and discounted by (1 + discount)^(n-1).
+    """
+    quoted = line_items[['year_1', 'year_2', 'year_3']].to_numpy(dtype=float)
+    run_rate = line_items['run_rate'].to_numpy(dtype=float)
+    
+    base = np.empty((len(line_items), horizon))
+    base[:, :min(horizon, 3)] = quoted[:, :horizon]
+    base[:, 3:] = run_rate[:, None]
+    
+    years = np.arange(horizon)
+    costs = base * (1 + escalation_rate) ** years
+    discounted = costs / (1 + discount_rate) ** years
+    
+    year_columns = [f"Year {year + 1}" for year in years]
+    matrix = pd.concat([
+        line_items[['reference_id', 'company', 'department', 'bucket', 'name']].reset_index(drop=True),
+        pd.DataFrame(costs, columns=year_columns)
+    ], axis=1)
+    matrix['Total'] = costs.sum(axis=1)
+    matrix['NPV'] = discounted.sum(axis=1)
+    
+    return {
+        'matrix': matrix,
+        'year_columns': year_columns,
+        'by_bucket': matrix.groupby('bucket')[year_columns].sum(),
+        'nominal_total': float(costs.sum()),
+        'npv': float(discounted.sum())
+    }
+
+# What-if scenarios - a grid of overrides is expanded into one row per scenario and priced
+# against a base selection as scenario x line matrices, so thousands of variations cost one
+# NumPy pass rather than one repricing each
+PROJECT_PRIORITIES = ["Low", "Medium", "High", "Critical"]
+SCENARIO_OVERRIDES = {
+    'volume_scale': "Multiplier on every operational quantity (users or volume)",
+    'volume_scale.<CATALOG>': "Multiplier on one catalog's quantities, e.g. volume_scale.ORACLE_SERVICES",
+    'support_package': "Support package name, or None for no package",
+    'min_project_priority': "Drop implementation projects below this priority"
+}
+
+def expand_scenario_grid(grid):
+    """Cartesian product of the override values, one row per scenario"""
+    for override in grid:
+        if override not in SCENARIO_OVERRIDES and not override.startswith('volume_scale.'):
+            raise ValueError(f"Unknown scenario override '{override}'")
+    return pd.DataFrame(list(itertools.product(*grid.values())), columns=list(grid))
+
+def evaluate_scenarios(selections, grid):
+    """Price a base selection under every combination of overrides in the grid.
+    
+    selections uses the submission 'selections' layout; grid maps each override in
+    SCENARIO_OVERRIDES to the values to try. Returns one row per scenario with the
+    override values, bucket totals, total and change against the base selection.
+    """
     current_data = get_current_data()
-    total = 0
+    scenarios = expand_scenario_grid(grid)
+    scenario_count = len(scenarios)
+    
+    # Operational: quantities scaled per scenario and rounded to whole users/units
+    lines, operational_totals = price_operational_services(
+        selections['operational_services'], selections['custom_operational'], get_pricing_catalog()
+    )
+    scale = np.ones((scenario_count, len(lines)))
+    sources = lines['source'].to_numpy()
+    for override in scenarios.columns:
+        if override == 'volume_scale':
+            scale *= scenarios[override].to_numpy(dtype=float)[:, None]
+        elif override.startswith('volume_scale.'):
+            scale[:, sources == override.split('.', 1)[1]] *= scenarios[override].to_numpy(dtype=float)[:, None]
+    quantity = np.rint(lines['quantity'].to_numpy(dtype=float) * scale)
+    annual = quantity * (lines['rate'] * lines['months']).to_numpy(dtype=float)
+    setup = np.where(quantity > 0, lines['setup_cost'].to_numpy(dtype=float), 0.0)
+    operational = (annual + setup).sum(axis=1)
+    
+    # Support: package price per scenario plus the base selection's extras
+    package_prices = {name: details['price'] for name, details in current_data['SUPPORT_PACKAGES'].items()}
+    packages = scenarios['support_package'] if 'support_package' in scenarios else pd.Series([selections['support_package']] * scenario_count)
+    unknown = set(packages.dropna()) - set(package_prices)
+    if unknown:
+        raise ValueError(f"Unknown support package(s): {', '.join(sorted(unknown))}")
+    extras = sum(count * SUPPORT_EXTRA_UNIT_PRICES.get(extra, 0) for extra, count in selections['support_extras'].items())
+    support = packages.map(package_prices).fillna(0).to_numpy(dtype=float) + extras
+    
+    # Implementation: scenario x project keep-mask against the project budgets
+    projects = selections['implementation_projects']
+    budgets = np.array([project.get('budget', 0) for project in projects], dtype=float)
+    ranks = np.array([PROJECT_PRIORITIES.index(project.get('priority', 'Medium')) for project in projects], dtype=int)
+    if 'min_project_priority' in scenarios:
+        min_ranks = scenarios['min_project_priority'].map(PROJECT_PRIORITIES.index).to_numpy(dtype=int)
+        keep = ranks[None, :] >= min_ranks[:, None]
+    else:
+        keep = np.ones((scenario_count, len(projects)), dtype=bool)
+    implementation = keep.astype(float) @ budgets
+    
+    base_support = (package_prices.get(selections['support_package'], 0) if selections['support_package'] else 0) + extras
+    base_total = operational_totals['total'] + base_support + budgets.sum()
+    
+    results = scenarios.copy()
+    results['projects'] = keep.sum(axis=1)
+    results['operational'] = operational
+    results['support'] = support
+    results['implementation'] = implementation
+    results['total'] = operational + support + implementation
+    results['change'] = results['total'] - base_total
+    results['change_pct'] = results['change'] / base_total * 100 if base_total else 0.0
+    return results
+
+# Monte Carlo budget simulation - estimated inputs (user counts, transaction/event volumes,
+# project budgets) get triangular distributions around the entered value. Lines are first
+# collapsed into one driver per (bucket, department, input), so a sample costs a few draws
+# however many lines the basket has; chunked sampling keeps memory bounded
+SIMULATION_SAMPLES = 100_000
+SIMULATION_CHUNK_SIZE = 10_000
+SIMULATION_DEFAULT_SPREADS = {'users': 0.10, 'volume': 0.25, 'projects': 0.20}
+SIMULATION_INPUTS = {
+    'price_per_user': 'users',
+    'per_user_monthly': 'users',
+    'price_per_transaction': 'volume',
+    'price_per_event': 'volume'
+}
+SIMULATION_PERCENTILES = [10, 50, 90]
+
+def get_simulation_input(line):
+    """Which estimated input drives a submission line, or None if its cost is fixed"""
+    if line['bucket'] == 'implementation':
+        return 'projects'
+    if line['bucket'] == 'operational':
+        return SIMULATION_INPUTS.get(line['details'].get('unit_key'))
+    return None
+
+def simulate_budget(lines, spreads=None, samples=SIMULATION_SAMPLES, chunk_size=SIMULATION_CHUNK_SIZE, seed=0):
+    """P10/P50/P90 of the budget per cost bucket, per department and overall.
+    
+    Estimates of the same kind within a department move together: each (bucket,
+    department, input) driver scales its lines' annual cost by one triangular draw
+    between (1 - spread) and (1 + spread). Setup fees and support costs are fixed.
+    """
+    spreads = {**SIMULATION_DEFAULT_SPREADS, **(spreads or {})}
+    rng = np.random.default_rng(seed)
+    
+    # Collapse lines into drivers: variable cost that scales with the draw, plus fixed cost
+    drivers = {}
+    for line in lines:
+        simulation_input = get_simulation_input(line)
+        driver = drivers.setdefault((line['bucket'], line['department'], simulation_input), [0.0, 0.0])
+        if simulation_input:
+            driver[0] += line['annual_cost']
+            driver[1] += line['setup_cost']
+        else:
+            driver[1] += line['annual_cost'] + line['setup_cost']
+    variable = np.array([driver[0] for driver in drivers.values()])
+    fixed = np.array([driver[1] for driver in drivers.values()])
+    spread = np.array([spreads.get(simulation_input, 0.0) for _, _, simulation_input in drivers])
+    
+    # Driver -> group membership: every driver counts towards its bucket, its department and the total
+    groups = ['operational', 'support', 'implementation']
+    groups += sorted({department for _, department, _ in drivers if department})
+    membership = np.zeros((len(drivers), len(groups) + 1))
+    for i, (bucket, department, _) in enumerate(drivers):
+        membership[i, groups.index(bucket)] = 1
+        if department:
+            membership[i, groups.index(department)] = 1
+    membership[:, -1] = 1
+    groups.append('total')
+    
+    totals = np.empty((samples, len(groups)))
+    for start in range(0, samples, chunk_size):
+        size = min(chunk_size, samples - start)
+        # Symmetric triangular on [-1, 1] by inverse CDF, scaled per driver
+        u = rng.random((size, len(drivers)))
+        offset = np.where(u < 0.5, np.sqrt(2 * u) - 1, 1 - np.sqrt(2 * (1 - u)))
+        costs = variable * (1 + offset * spread) + fixed
+        totals[start:start + size] = costs @ membership
+    
+    percentiles = np.percentile(totals, SIMULATION_PERCENTILES, axis=0)
+    result = pd.DataFrame(percentiles.T, index=groups, columns=[f"P{p}" for p in SIMULATION_PERCENTILES])
+    result.insert(0, 'Estimate', (variable + fixed) @ membership)
+    return result
+
+# Support package optimizer - expected demand is priced against every package at once as a
+# demand x package matrix: the package covers what it can, extras cover the rest. Spare
+# higher-tier tickets absorb lower-tier demand; extra support requests cover any tier and
+# improvement hours cannot be bought as extras
+SUPPORT_DEMAND_FIELDS = {
+    'premium': 'support_requests_premium',
+    'priority': 'support_requests_priority',
+    'standard': 'support_requests_standard',
+    'improvement_hours': 'improvement_hours',
+    'trainings': 'training_requests',
+    'reports': 'report_requests'
+}
+SUPPORT_TICKET_TIERS = ['premium', 'priority', 'standard']
+
+def compile_support_packages(packages, department=None):
+    """Package names, a package x demand-field capacity matrix and the package prices"""
+    names = [name for name, details in packages.items() if department is None or department in details.get('departments', [])]
+    capacity = np.array([[packages[name][field] for field in SUPPORT_DEMAND_FIELDS.values()] for name in names], dtype=float)
+    prices = np.array([packages[name]['price'] for name in names], dtype=float)
+    return names, capacity.reshape(len(names), len(SUPPORT_DEMAND_FIELDS)), prices
+
+def price_support_demand(demand, capacity, prices):
+    """Cost of meeting each demand row with each package plus extras.
+    
+    demand is (rows x fields) in SUPPORT_DEMAND_FIELDS order; every result is (rows x packages).
+    Packages that cannot cover the improvement hours cost infinity.
+    """
+    demand = demand[:, None, :]
+    capacity = capacity[None, :, :]
+    fields = list(SUPPORT_DEMAND_FIELDS)
+    
+    # Walk the ticket tiers from premium down, carrying spare capacity to the next tier
+    spare = 0
+    extra_support = 0
+    for tier in SUPPORT_TICKET_TIERS:
+        i = fields.index(tier)
+        available = capacity[..., i] + spare
+        extra_support = extra_support + np.maximum(demand[..., i] - available, 0)
+        spare = np.maximum(available - demand[..., i], 0)
+    
+    shortfall = {field: np.maximum(demand[..., fields.index(field)] - capacity[..., fields.index(field)], 0)
+                 for field in ('improvement_hours', 'trainings', 'reports')}
+    extras = {'support': extra_support, 'training': shortfall['trainings'], 'reports': shortfall['reports']}
+    extras_cost = sum(count * SUPPORT_EXTRA_UNIT_PRICES[extra] for extra, count in extras.items())
+    total = np.where(shortfall['improvement_hours'] > 0, np.inf, prices[None, :] + extras_cost)
+    return {'extras': extras, 'missing_hours': shortfall['improvement_hours'], 'extras_cost': extras_cost, 'total': total}
+
+def compare_support_packages(demand, packages, department=None):
+    """Every package's cost for one demand profile, cheapest first - the optimizer's working"""
+    names, capacity, prices = compile_support_packages(packages, department)
+    row = np.array([[demand.get(field, 0) for field in SUPPORT_DEMAND_FIELDS]], dtype=float)
+    priced = price_support_demand(row, capacity, prices)
+    comparison = pd.DataFrame({
+        'package': names,
+        'package_price': prices,
+        'extra_support': priced['extras']['support'][0],
+        'extra_training': priced['extras']['training'][0],
+        'extra_reports': priced['extras']['reports'][0],
+        'extras_cost': priced['extras_cost'][0],
+        'missing_improvement_hours': priced['missing_hours'][0],
+        'total': priced['total'][0]
+    })
+    return comparison.sort_values(['total', 'package_price']).reset_index(drop=True)
+
+def optimize_support_packages(demand, packages, department=None):
+    """Cheapest package plus extras for each row of a demand DataFrame (one column per field)"""
+    names, capacity, prices = compile_support_packages(packages, department)
+    priced = price_support_demand(demand[list(SUPPORT_DEMAND_FIELDS)].to_numpy(dtype=float), capacity, prices)
+    best = priced['total'].argmin(axis=1)
+    rows = np.arange(len(demand))
+    feasible = np.isfinite(priced['total'][rows, best])
+    
+    result = demand.copy()
+    result['package'] = np.where(feasible, np.array(names, dtype=object)[best], None)
+    for extra, counts in priced['extras'].items():
+        result[f"extra_{extra}"] = np.where(feasible, counts[rows, best], 0)
+    result['total'] = np.where(feasible, priced['total'][rows, best], np.nan)
+    return result
+
+def get_selection_support_demand(selections, packages):
+    """Demand implied by a selection: its package's allowance plus the extras bought on top"""
+    package = packages.get(selections['support_package']) or {}
+    demand = {field: package.get(capacity_field, 0) for field, capacity_field in SUPPORT_DEMAND_FIELDS.items()}
+    extras = selections['support_extras']
+    demand['standard'] += extras.get('support', 0)
+    demand['trainings'] += extras.get('training', 0)
+    demand['reports'] += extras.get('reports', 0)
+    return demand
+
+# Excel export - write-only (streaming) workbooks so memory stays flat for group-wide exports
+EXCEL_SHEETS = {
+    'Line Items': ['Reference', 'Company', 'Department', 'Shared Service', 'Bucket', 'Item',
+                   'Service Department', 'Quantity', 'Annual Cost (SAR)', 'Setup Cost (SAR)', 'Total (SAR)'],
+    'Support Extras': ['Reference', 'Company', 'Department', 'Support Package', 'Extra',
+                       'Quantity', 'Unit Price (SAR)', 'Cost (SAR)'],
+    'Projects': ['Reference', 'Company', 'Department', 'Shared Service', 'Project', 'Category', 'Type',
+                 'Timeline', 'Billing Profile', 'Priority', 'Budget (SAR)', 'Departments Involved'],
+    'RPA 3-Year': ['Reference', 'Company', 'Project', 'RPA Package', 'Year 1 (SAR)', 'Year 2 (SAR)',
+                   'Year 3 (SAR)', '3-Year Total (SAR)'],
+    'Cash Flow': ['Reference', 'Company', 'Shared Service', 'Month', 'Operational (SAR)', 'Support (SAR)',
+                  'Implementation (SAR)', 'Total (SAR)']
+}
+
+def append_submission_rows(sheets, submission):
+    """Append one submission's rows to every sheet of a write-only workbook"""
+    reference = submission['reference_id']
+    company = submission['company']
+    department = submission['department']
+    shared_service = submission['shared_service_dept']
+    selections = submission['selections']
+    
+    for line in submission['lines']:
+        sheets['Line Items'].append([
+            reference, company, department, shared_service, line['bucket'], line['name'],
+            line['department'], line['quantity'], line['annual_cost'], line['setup_cost'], line['total']
+        ])
+    
+    for extra, count in selections.get('support_extras', {}).items():
+        if count:
+            unit_price = SUPPORT_EXTRA_UNIT_PRICES.get(extra, 0)
+            sheets['Support Extras'].append([
+                reference, company, department, selections.get('support_package'),
+                extra, count, unit_price, count * unit_price
+            ])
     
-    if st.session_state.support_package:
-        total += current_data['SUPPORT_PACKAGES'][st.session_state.support_package]['price']
+    department_projects = []
+    for project in selections.get('implementation_projects', []):
+        sheets['Projects'].append([
+            reference, company, department, project.get('shared_service_dept'), project.get('name'),
+            project.get('category'), project.get('type'), project.get('timeline'),
+            BILLING_PROFILES.get(project.get('billing_profile'), project.get('billing_profile')), project.get('priority'),
+            project.get('budget', 0), ', '.join(project.get('departments', []))
+        ])
+        if project.get('rpa_package', False):
+            rpa_details = project.get('rpa_details', {})
+            year_costs = [rpa_details.get('year_1_total', 0), rpa_details.get('year_2_cost', 0), rpa_details.get('year_3_cost', 0)]
+            sheets['RPA 3-Year'].append(
+                [reference, company, project.get('name'), project.get('rpa_package_name')] + year_costs + [sum(year_costs)]
+            )
+        if project.get('shared_service_dept') == shared_service:
+            department_projects.append(project)
+    
+    cash_flow = compute_monthly_cash_flow(
+        submission['operational_total'], submission['support_total'], schedule_projects(department_projects),
+        selections.get('recurring_billing_profile', RECURRING_BILLING_PROFILE)
+    )
+    for month, operational, support, implementation in zip(MONTHS, *cash_flow.tolist()):
+        sheets['Cash Flow'].append([
+            reference, company, shared_service, month, operational, support, implementation,
+            operational + support + implementation
+        ])
+
+def write_budget_workbook(submissions):
+    """Stream submissions into an .xlsx workbook and return its bytes"""
+    workbook = openpyxl.Workbook(write_only=True)
+    sheets = {}
+    for title, header in EXCEL_SHEETS.items():
+        sheets[title] = workbook.create_sheet(title)
+        sheets[title].append(header)
+    
+    for submission in submissions:
+        append_submission_rows(sheets, submission)
+    
+    output = io.BytesIO()
+    workbook.save(output)
+    return output.getvalue()
+
+def iter_stored_submissions(companies):
+    """Yield stored submissions one at a time with their line items"""
+    conn = get_db_connection()
+    placeholders = ', '.join('?' for _ in companies)
+    reference_ids = [
+        row[0] for row in conn.execute(
+            f"SELECT reference_id FROM submissions WHERE company IN ({placeholders}) ORDER BY company, submitted_at",
+            list(companies)
+        )
+    ]
+    for reference_id in reference_ids:
+        submission = get_submission(reference_id)
+        if submission:
+            yield submission
+
+@st.cache_resource
+def get_export_executor():
+    """Worker pool for exports, so large workbooks never block the script thread"""
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="export")
+
+def export_group_workbook():
+    """Group-wide workbook across every Alkhorayef company's stored submissions"""
+    flush_submissions()
+    return write_budget_workbook(iter_stored_submissions(ALKHORAYEF_COMPANIES))
+
+# PDF reports - rendered from the submission record in the export worker pool and
+# cached by content hash, so re-downloading an unchanged report costs nothing
+REPORT_CACHE_SIZE = 64
+
+REPORT_TABLE_STYLE = TableStyle([
+    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#1e3a8a')),
+    ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+    ('FONTSIZE', (0, 0), (-1, -1), 8),
+    ('ALIGN', (1, 0), (-1, -1), 'RIGHT'),
+    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#f1f5f9')]),
+    ('GRID', (0, 0), (-1, -1), 0.25, colors.HexColor('#cbd5e1'))
+])
+
+def get_report_content_hash(submission, title, color):
+    """Hash of everything that ends up in the rendered report"""
+    content = {key: value for key, value in submission.items() if key != 'submitted_at'}
+    payload = json.dumps([content, title, color], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def build_budget_pie(submission, color):
+    """Budget distribution pie chart"""
+    drawing = Drawing(16 * cm, 6 * cm)
+    pie = Pie()
+    pie.x, pie.y, pie.width, pie.height = 1 * cm, 0.5 * cm, 5 * cm, 5 * cm
+    pie.data = [submission['operational_total'], submission['support_total'], submission['implementation_total']]
+    pie.labels = [f"{amount / submission['total_budget'] * 100:.1f}%" if amount else '' for amount in pie.data]
+    for index, slice_color in enumerate([color, '#10b981', '#f59e0b']):
+        pie.slices[index].fillColor = colors.HexColor(slice_color)
+    
+    legend = Legend()
+    legend.x, legend.y = 8 * cm, 4 * cm
+    legend.colorNamePairs = [
+        (colors.HexColor(color), 'Operational Services'),
+        (colors.HexColor('#10b981'), 'Support Packages'),
+        (colors.HexColor('#f59e0b'), 'Implementation Projects')
+    ]
+    drawing.add(pie)
+    drawing.add(legend)
+    return drawing
+
+def build_cash_flow_chart(cash_flow, color):
+    """Stacked monthly cash-flow bar chart"""
+    drawing = Drawing(16 * cm, 7 * cm)
+    chart = VerticalBarChart()
+    chart.x, chart.y, chart.width, chart.height = 1.5 * cm, 1.5 * cm, 13 * cm, 5 * cm
+    chart.data = cash_flow.tolist()
+    chart.categoryAxis.categoryNames = MONTHS
+    chart.categoryAxis.style = 'stacked'
+    chart.valueAxis.valueMin = 0
+    chart.valueAxis.labelTextFormat = lambda value: f"{value:,.0f}"
+    for index, bar_color in enumerate([color, '#10b981', '#f59e0b']):
+        chart.bars[index].fillColor = colors.HexColor(bar_color)
+    
+    legend = Legend()
+    legend.x, legend.y = 1.5 * cm, 0.5 * cm
+    legend.columnMaximum = 1
+    legend.colorNamePairs = [
+        (colors.HexColor(color), 'Operational'),
+        (colors.HexColor('#10b981'), 'Support'),
+        (colors.HexColor('#f59e0b'), 'Implementation')
+    ]
+    drawing.add(chart)
+    drawing.add(legend)
+    return drawing
+
+def render_budget_pdf(submission, title, color):
+    """Render a submission as a PDF budget report and return its bytes"""
+    styles = getSampleStyleSheet()
+    output = io.BytesIO()
+    document = SimpleDocTemplate(output, pagesize=A4, leftMargin=1.5 * cm, rightMargin=1.5 * cm,
+                                 topMargin=1.5 * cm, bottomMargin=1.5 * cm, title=f"2025 {title} Budget")
+    
+    story = [
+        Paragraph(f"2025 {escape(title)} - Service Catalogue Budget Report", styles['Title']),
+        Paragraph(
+            f"<b>Reference ID:</b> {escape(str(submission['reference_id']))}<br/>"
+            f"<b>Company:</b> {escape(submission['company'])} &nbsp; "
+            f"<b>Department:</b> {escape(submission['department'])}<br/>"
+            f"<b>Contact:</b> {escape(submission['contact_person'])} ({escape(submission['email'])})<br/>"
+            f"<b>Date:</b> {escape(submission['submitted_at'][:10])} &nbsp; "
+            f"<b>Catalog version:</b> {submission['catalog_version']}",
+            styles['Normal']
+        ),
+        Spacer(1, 0.4 * cm)
+    ]
     
-    # Add extras
-    total += st.session_state.support_extras.get('support', 0) * 1800
-    total += st.session_state.support_extras.get('training', 0) * 5399
-    total += st.session_state.support_extras.get('reports', 0) * 5399
+    totals = [
+        ['Budget Area', 'Amount (SAR)'],
+        ['Operational Services', f"{submission['operational_total']:,.0f}"],
+        ['Support Packages', f"{submission['support_total']:,.0f}"],
+        ['Implementation Projects', f"{submission['implementation_total']:,.0f}"],
+        ['Total Budget', f"{submission['total_budget']:,.0f}"]
+    ]
+    story += [Table(totals, colWidths=[9 * cm, 5 * cm], style=REPORT_TABLE_STYLE), Spacer(1, 0.4 * cm)]
     
-    return total
+    if submission['total_budget']:
+        story += [Paragraph("Budget Distribution", styles['Heading2']), build_budget_pie(submission, color)]
+    
+    department_projects = [
+        project for project in submission['selections'].get('implementation_projects', [])
+        if project.get('shared_service_dept') == submission['shared_service_dept']
+    ]
+    cash_flow = compute_monthly_cash_flow(
+        submission['operational_total'], submission['support_total'], schedule_projects(department_projects),
+        submission['selections'].get('recurring_billing_profile', RECURRING_BILLING_PROFILE)
+    )
+    story += [Paragraph("Monthly Cash Flow Projection (SAR)", styles['Heading2']), build_cash_flow_chart(cash_flow, color)]
+    
+    if submission['lines']:
+        line_rows = [['Item', 'Area', 'Qty', 'Annual (SAR)', 'Setup (SAR)', 'Total (SAR)']]
+        for line in submission['lines']:
+            line_rows.append([
+                Paragraph(escape(line['name']), styles['BodyText']), line['bucket'].title(), f"{line['quantity']:,.0f}",
+                f"{line['annual_cost']:,.0f}", f"{line['setup_cost']:,.0f}", f"{line['total']:,.0f}"
+            ])
+        story += [
+            Paragraph("Line Items", styles['Heading2']),
+            Table(line_rows, colWidths=[6.5 * cm, 2.5 * cm, 1.5 * cm, 2.5 * cm, 2.5 * cm, 2.5 * cm],
+                  style=REPORT_TABLE_STYLE, repeatRows=1)
+        ]
+    
+    document.build(story)
+    return output.getvalue()
 
-def calculate_implementation_total():
-    return sum(project.get('budget', 0) for project in st.session_state.implementation_projects)
+@st.cache_resource
+def get_report_cache():
+    """Process-wide cache of report futures keyed by content hash"""
+    return {'lock': threading.Lock(), 'reports': {}}
 
-def calculate_total_budget():
-    return calculate_operational_total() + calculate_support_total() + calculate_implementation_total()
+def request_budget_report(submission, title, color):
+    """Start (or reuse) a background render of a submission's PDF report"""
+    content_hash = get_report_content_hash(submission, title, color)
+    report_cache = get_report_cache()
+    
+    with report_cache['lock']:
+        future = report_cache['reports'].get(content_hash)
+        # Failed renders are retried rather than cached
+        if future is None or (future.done() and future.exception()):
+            future = get_export_executor().submit(render_budget_pdf, submission, title, color)
+            report_cache['reports'][content_hash] = future
+            while len(report_cache['reports']) > REPORT_CACHE_SIZE:
+                del report_cache['reports'][next(iter(report_cache['reports']))]
+    
+    return future
+
+# Report download - only a pending render is polled, without rerunning the rest of the summary
+def show_report_download():
+    future = st.session_state.get('report_future')
+    if future is None:
+        return
+    
+    if not future.done():
+        poll_report_render()
+    elif future.exception():
+        st.error(f"❌ PDF report could not be generated: {future.exception()}")
+    else:
+        st.download_button(
+            "📄 Download PDF Report",
+            data=future.result(),
+            file_name=f"{st.session_state.report_reference}.pdf",
+            mime="application/pdf",
+            key="download_report_btn"
+        )
+
+@st.fragment(run_every=2)
+def poll_report_render():
+    future = st.session_state.get('report_future')
+    if future is not None and not future.done():
+        st.info("⏳ Your PDF budget report is being prepared...")
+        return
+    # Rendering finished - a full rerun replaces this poller with the download button
+    st.rerun()
 
 # Header
 def show_header():
@@ -1826,6 +4092,14 @@ def show_sidebar():
             contact_person = st.text_input("Contact Person", key="contact_person", placeholder="Your full name")
             email = st.text_input("Email", key="email", placeholder="your.email@alkhorayef.com")
             
+            if email and st.button("📂 Restore Saved Draft", key="restore_draft_btn", use_container_width=True):
+                draft = load_draft(email, selected_company)
+                if draft:
+                    st.session_state.pending_draft = draft
+                    st.rerun()
+                else:
+                    st.info(f"No saved draft for {email} at {selected_company}.")
+            
             # Display selected company and shared service department
             if st.session_state.selected_department:
                 departments_config = get_departments_config()
@@ -1861,38 +4135,155 @@ def show_sidebar():
                 dept_config = departments_config[st.session_state.selected_department]
                 st.markdown(f"### 💰 {dept_config['title']} Budget Summary")
                 
-                operational_total = calculate_operational_total()
-                support_total = calculate_support_total()
-                implementation_total = calculate_implementation_total()
-                total_budget = operational_total + support_total + implementation_total
-                
-                st.markdown(f"""
-                <div class='metric-card'>
-                    <h4>Operational Services</h4>
-                    <h3>SAR {operational_total:,.0f}</h3>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                st.markdown(f"""
-                <div class='metric-card'>
-                    <h4>Support Packages</h4>
-                    <h3>SAR {support_total:,.0f}</h3>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                st.markdown(f"""
-                <div class='metric-card'>
-                    <h4>Custom Implementations</h4>
-                    <h3>SAR {implementation_total:,.0f}</h3>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                st.markdown(f"""
-                <div class='total-budget'>
-                    💰 Total 2025 Budget<br>
-                    <span style='font-size: 1.5em'>SAR {total_budget:,.0f}</span>
-                </div>
-                """, unsafe_allow_html=True)
+                # Service card fragments redraw this slot when their cost changes
+                st.session_state.budget_summary_placeholder = st.empty()
+                show_budget_summary()
+            else:
+                st.session_state.budget_summary_placeholder = None
+
+def show_budget_summary():
+    """Draw the sidebar budget metrics into their placeholder"""
+    placeholder = st.session_state.get('budget_summary_placeholder')
+    if placeholder is None:
+        return
+    
+    operational_total = calculate_operational_total()
+    support_total = calculate_support_total()
+    implementation_total = calculate_implementation_total()
+    total_budget = calculate_total_budget()
+    
+    with placeholder.container():
+        st.markdown(f"""
+        <div class='metric-card'>
+            <h4>Operational Services</h4>
+            <h3>SAR {operational_total:,.0f}</h3>
+        </div>
+        """, unsafe_allow_html=True)
+        
+        st.markdown(f"""
+        <div class='metric-card'>
+            <h4>Support Packages</h4>
+            <h3>SAR {support_total:,.0f}</h3>
+        </div>
+        """, unsafe_allow_html=True)
+        
+        st.markdown(f"""
+        <div class='metric-card'>
+            <h4>Custom Implementations</h4>
+            <h3>SAR {implementation_total:,.0f}</h3>
+        </div>
+        """, unsafe_allow_html=True)
+        
+        st.markdown(f"""
+        <div class='total-budget'>
+            💰 Total 2025 Budget<br>
+            <span style='font-size: 1.5em'>SAR {total_budget:,.0f}</span>
+        </div>
+        """, unsafe_allow_html=True)
+
+# Client catalogue search - an inverted index over service names and descriptions, project
+# categories and project types. Built once per catalog version and shared by all sessions.
+SEARCH_FIELD_WEIGHTS = {'name': 3.0, 'category': 2.0, 'description': 1.0}
+SEARCH_PREFIX_WEIGHT = 0.6
+SEARCH_RESULT_LIMIT = 50
+SEARCH_RESULT_CACHE_SIZE = 1024
+
+def tokenize_search_text(text):
+    return re.findall(r"\w+", str(text).lower())
+
+def build_catalogue_search_index(data):
+    """Inverted index (token -> {doc_id: weight}) plus a sorted vocabulary for prefix lookups"""
+    docs = []
+    postings = {}
+    
+    def add_document(doc, fields):
+        doc_id = len(docs)
+        docs.append(doc)
+        for field, text in fields.items():
+            for token in tokenize_search_text(text):
+                weights = postings.setdefault(token, {})
+                weights[doc_id] = max(weights.get(doc_id, 0), SEARCH_FIELD_WEIGHTS[field])
+    
+    for catalog_key in SERVICE_CATALOGS:
+        for service_name, details in data[catalog_key].items():
+            add_document(
+                {'catalog': catalog_key, 'name': service_name, 'category': None},
+                {'name': service_name, 'description': details.get('description', '')}
+            )
+    for catalog_key in CATEGORY_CATALOGS:
+        for category, project_types in data[catalog_key].items():
+            for project_type in project_types:
+                add_document(
+                    {'catalog': catalog_key, 'name': project_type, 'category': category},
+                    {'name': project_type, 'category': category}
+                )
+    
+    # token_matches and results memoize prefix expansions and ranked queries; filled lazily
+    return {'docs': docs, 'postings': postings, 'vocabulary': sorted(postings), 'token_matches': {}, 'results': {}}
+
+@st.cache_resource(max_entries=4)
+def get_catalogue_search_index(version, _data):
+    """Search index for one catalog version (data is not hashed - the version identifies it)"""
+    return build_catalogue_search_index(_data)
+
+def match_search_token(index, token):
+    """{doc_id: weight} for documents with a term equal to, or starting with, token"""
+    # The memo tables are shared by every session: read with a single get, never check-then-get
+    cached = index['token_matches'].get(token)
+    if cached is not None:
+        return cached
+    
+    vocabulary = index['vocabulary']
+    matches = {}
+    for position in range(bisect.bisect_left(vocabulary, token), len(vocabulary)):
+        term = vocabulary[position]
+        if not term.startswith(token):
+            break
+        factor = 1.0 if term == token else SEARCH_PREFIX_WEIGHT
+        for doc_id, weight in index['postings'][term].items():
+            if weight * factor > matches.get(doc_id, 0):
+                matches[doc_id] = weight * factor
+    
+    index['token_matches'][token] = matches
+    return matches
+
+def search_catalogue(query, catalogs=None, limit=SEARCH_RESULT_LIMIT):
+    """Ranked catalogue entries matching every word of query (each word may be a prefix)"""
+    tokens = tokenize_search_text(query)
+    if not tokens:
+        return []
+    
+    index = get_catalogue_search_index(get_catalog_version(), get_current_data())
+    result_key = (tuple(dict.fromkeys(tokens)), frozenset(catalogs) if catalogs is not None else None, limit)
+    cached = index['results'].get(result_key)
+    if cached is not None:
+        return cached
+    
+    token_matches = sorted((match_search_token(index, token) for token in result_key[0]), key=len)
+    
+    scores = token_matches[0]
+    for matches in token_matches[1:]:
+        scores = {doc_id: score + matches[doc_id] for doc_id, score in scores.items() if doc_id in matches}
+        if not scores:
+            break
+    
+    docs = index['docs']
+    if catalogs is not None:
+        scores = {doc_id: score for doc_id, score in scores.items() if docs[doc_id]['catalog'] in catalogs}
+    ranked = heapq.nsmallest(limit, scores, key=lambda doc_id: (-scores[doc_id], doc_id))
+    
+    results = [docs[doc_id] for doc_id in ranked]
+    if len(index['results']) >= SEARCH_RESULT_CACHE_SIZE:
+        index['results'].clear()
+    index['results'][result_key] = results
+    return results
+
+def select_project_type_match():
+    """Copy the picked search result into the category and type pickers"""
+    match = st.session_state.get('project_type_match')
+    if match:
+        st.session_state.project_category_input = match['category']
+        st.session_state.project_type_input = match['name']
 
 # Operational Services Section - Updated to use current data
 def show_operational_services():
@@ -1910,491 +4301,281 @@ def show_operational_services():
     </div>
     """, unsafe_allow_html=True)
     
-    if st.session_state.selected_department == "IT":
-        show_it_operational_services()
-    elif st.session_state.selected_department == "Procurement":
-        show_procurement_operational_services()
-    elif st.session_state.selected_department == "Facility_Safety":
-        show_facility_safety_operational_services()
-
-def show_it_operational_services():
-    current_data = get_current_data()
+    show_vendor_services(st.session_state.selected_department)
     
-    # Oracle Services (using current data)
-    st.markdown("### 🟠 Oracle Cloud Services")
+    # IT services are all catalogued; the other departments can add custom services
+    if st.session_state.selected_department != "IT":
+        show_custom_operational_services()
+
+# Service cards run as fragments: editing a card reruns only that card, and the
+# ledger redraws the sidebar budget summary when the card's cost changes.
+@st.fragment
+def show_it_service_card(vendor_key, service_name, details):
+    service_key = f"{vendor_key}_{service_name.lower().replace(' ', '_').replace('&', 'and')}"
     
-    col1, col2 = st.columns(2)
-    oracle_services = list(current_data['ORACLE_SERVICES'].items())
+    st.markdown(f"""
+    <div class='service-card'>
+        <h4>{service_name}</h4>
+        <p style='color: #6b7280; font-size: 0.9em;'>{details['description']}</p>
+        <div style='background: #f3f4f6; padding: 0.5rem; border-radius: 5px; margin: 0.5rem 0;'>
+            💰 SAR {details['price_per_user']}/user/month<br>
+            🆕 Setup (new implementation): SAR {details['setup_cost']:,}
+        </div>
+    </div>
+    """, unsafe_allow_html=True)
     
-    for i, (service_name, details) in enumerate(oracle_services):
-        col = col1 if i % 2 == 0 else col2
-        service_key = f"oracle_{service_name.lower().replace(' ', '_').replace('&', 'and')}"
+    # Initialize service data if not exists
+    if service_key not in st.session_state.operational_services:
+        set_operational_service(service_key, {
+            'selected': False, 
+            'users': 0, 
+            'actual_service_name': service_name,
+            'new_implementation': False
+        })
+    
+    # Get current values from session state
+    current_selected = st.session_state.operational_services[service_key].get('selected', False)
+    current_users = st.session_state.operational_services[service_key].get('users', 0)
+    current_new_impl = st.session_state.operational_services[service_key].get('new_implementation', False)
+    
+    selected = st.checkbox(f"Include {service_name}", 
+                         key=f"{service_key}_selected",
+                         value=current_selected)
+    
+    if selected:
+        # New Implementation checkbox
+        new_implementation = st.checkbox(
+            "🆕 New Implementation", 
+            key=f"{service_key}_new_impl",
+            value=current_new_impl,
+            help="Check this if it's a new implementation requiring setup. Uncheck if adding users to existing system."
+        )
         
-        with col:
-            st.markdown(f"""
-            <div class='service-card'>
-                <h4>{service_name}</h4>
-                <p style='color: #6b7280; font-size: 0.9em;'>{details['description']}</p>
-                <div style='background: #f3f4f6; padding: 0.5rem; border-radius: 5px; margin: 0.5rem 0;'>
-                    💰 SAR {details['price_per_user']}/user/month<br>
-                    🆕 Setup (new implementation): SAR {details['setup_cost']:,}
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
+        users = st.number_input(f"Number of users for {service_name}", 
+                              min_value=0, 
+                              value=current_users,
+                              key=f"{service_key}_users",
+                              step=1)
+        
+        # Update session state immediately
+        set_operational_service(service_key, {
+            'selected': True,
+            'users': users,
+            'actual_service_name': service_name,
+            'new_implementation': new_implementation
+        })
+        
+        if users > 0:
+            monthly_cost = details['price_per_user'] * users
+            setup_cost = details['setup_cost'] if new_implementation else 0
+            annual_cost = monthly_cost * 12 + setup_cost
             
-            # Initialize service data if not exists
-            if service_key not in st.session_state.operational_services:
-                st.session_state.operational_services[service_key] = {
-                    'selected': False, 
-                    'users': 0, 
-                    'actual_service_name': service_name,
-                    'new_implementation': False
-                }
+            setup_text = f" + SAR {setup_cost:,} setup" if new_implementation else " (no setup cost)"
             
-            # Get current values from session state
-            current_selected = st.session_state.operational_services[service_key].get('selected', False)
-            current_users = st.session_state.operational_services[service_key].get('users', 0)
-            current_new_impl = st.session_state.operational_services[service_key].get('new_implementation', False)
-            
-            selected = st.checkbox(f"Include {service_name}", 
-                                 key=f"{service_key}_selected",
-                                 value=current_selected)
-            
-            if selected:
-                # New Implementation checkbox
-                new_implementation = st.checkbox(
-                    "🆕 New Implementation", 
-                    key=f"{service_key}_new_impl",
-                    value=current_new_impl,
-                    help="Check this if it's a new implementation requiring setup. Uncheck if adding users to existing system."
-                )
-                
-                users = st.number_input(f"Number of users for {service_name}", 
-                                      min_value=0, 
-                                      value=current_users,
-                                      key=f"{service_key}_users",
-                                      step=1)
-                
-                # Update session state immediately
-                st.session_state.operational_services[service_key] = {
-                    'selected': True,
-                    'users': users,
-                    'actual_service_name': service_name,
-                    'new_implementation': new_implementation
-                }
-                
-                if users > 0:
-                    monthly_cost = details['price_per_user'] * users
-                    setup_cost = details['setup_cost'] if new_implementation else 0
-                    annual_cost = monthly_cost * 12 + setup_cost
-                    
-                    setup_text = f" + SAR {setup_cost:,} setup" if new_implementation else " (no setup cost)"
-                    
-                    st.markdown(f"""
-                    <div class='cost-display'>
-                        📊 Monthly: SAR {monthly_cost:,.0f}{setup_text}<br>
-                        <strong>Annual Total: SAR {annual_cost:,.0f}</strong>
-                    </div>
-                    """, unsafe_allow_html=True)
-            else:
-                st.session_state.operational_services[service_key] = {
-                    'selected': False,
-                    'users': 0,
-                    'actual_service_name': service_name,
-                    'new_implementation': False
-                }
-    
-    st.markdown("---")
-    
-    # Microsoft Services (using current data)
-    st.markdown("### 🟦 Microsoft Cloud Services")
-    
-    col1, col2 = st.columns(2)
-    microsoft_services = list(current_data['MICROSOFT_SERVICES'].items())
-    
-    for i, (service_name, details) in enumerate(microsoft_services):
-        col = col1 if i % 2 == 0 else col2
-        service_key = f"microsoft_{service_name.lower().replace(' ', '_').replace('&', 'and')}"
-        
-        with col:
             st.markdown(f"""
-            <div class='service-card'>
-                <h4>{service_name}</h4>
-                <p style='color: #6b7280; font-size: 0.9em;'>{details['description']}</p>
-                <div style='background: #f3f4f6; padding: 0.5rem; border-radius: 5px; margin: 0.5rem 0;'>
-                    💰 SAR {details['price_per_user']}/user/month<br>
-                    🆕 Setup (new implementation): SAR {details['setup_cost']:,}
-                </div>
+            <div class='cost-display'>
+                📊 Monthly: SAR {monthly_cost:,.0f}{setup_text}<br>
+                <strong>Annual Total: SAR {annual_cost:,.0f}</strong>
             </div>
             """, unsafe_allow_html=True)
-            
-            # Initialize service data if not exists
-            if service_key not in st.session_state.operational_services:
-                st.session_state.operational_services[service_key] = {
-                    'selected': False, 
-                    'users': 0, 
-                    'actual_service_name': service_name,
-                    'new_implementation': False
-                }
-            
-            # Get current values from session state
-            current_selected = st.session_state.operational_services[service_key].get('selected', False)
-            current_users = st.session_state.operational_services[service_key].get('users', 0)
-            current_new_impl = st.session_state.operational_services[service_key].get('new_implementation', False)
-            
-            selected = st.checkbox(f"Include {service_name}", 
-                                 key=f"{service_key}_selected",
-                                 value=current_selected)
-            
-            if selected:
-                # New Implementation checkbox
-                new_implementation = st.checkbox(
-                    "🆕 New Implementation", 
-                    key=f"{service_key}_new_impl",
-                    value=current_new_impl,
-                    help="Check this if it's a new implementation requiring setup. Uncheck if adding users to existing system."
-                )
-                
-                users = st.number_input(f"Number of users for {service_name}", 
-                                      min_value=0, 
-                                      value=current_users,
-                                      key=f"{service_key}_users",
-                                      step=1)
-                
-                # Update session state immediately
-                st.session_state.operational_services[service_key] = {
-                    'selected': True,
-                    'users': users,
-                    'actual_service_name': service_name,
-                    'new_implementation': new_implementation
-                }
-                
-                if users > 0:
-                    monthly_cost = details['price_per_user'] * users
-                    setup_cost = details['setup_cost'] if new_implementation else 0
-                    annual_cost = monthly_cost * 12 + setup_cost
-                    
-                    setup_text = f" + SAR {setup_cost:,} setup" if new_implementation else " (no setup cost)"
-                    
-                    st.markdown(f"""
-                    <div class='cost-display'>
-                        📊 Monthly: SAR {monthly_cost:,.0f}{setup_text}<br>
-                        <strong>Annual Total: SAR {annual_cost:,.0f}</strong>
-                    </div>
-                    """, unsafe_allow_html=True)
-            else:
-                st.session_state.operational_services[service_key] = {
-                    'selected': False,
-                    'users': 0,
-                    'actual_service_name': service_name,
-                    'new_implementation': False
-                }
+    else:
+        set_operational_service(service_key, {
+            'selected': False,
+            'users': 0,
+            'actual_service_name': service_name,
+            'new_implementation': False
+        })
 
-def show_procurement_operational_services():
-    current_data = get_current_data()
-    
-    # Procurement Services
-    st.markdown("### 🛒 Procurement Services & Solutions")
+# Price box background per department card style
+VOLUME_CARD_BACKGROUNDS = {
+    "procurement": "#f0fdf4",
+    "facility_safety": "#fffbeb"
+}
+
+@st.fragment
+def show_volume_service_card(dept_key, service_name, details):
+    service_key = f"{dept_key}_{service_name.lower().replace(' ', '_').replace('&', 'and')}"
+    
+    # Determine pricing display based on service type
+    unit_key = get_pricing_unit(details)
+    if unit_key:
+        pricing_text = f"SAR {details[unit_key]}/{PRICING_UNITS[unit_key]['unit']}"
+        volume_label = PRICING_UNITS[unit_key]['volume_label']
+    else:
+        pricing_text = "Custom Pricing"
+        volume_label = "Volume"
     
-    col1, col2 = st.columns(2)
-    procurement_services = list(current_data['PROCUREMENT_SERVICES'].items())
+    st.markdown(f"""
+    <div class='service-card {dept_key}'>
+        <h4>{service_name}</h4>
+        <p style='color: #6b7280; font-size: 0.9em;'>{details['description']}</p>
+        <div style='background: {VOLUME_CARD_BACKGROUNDS[dept_key]}; padding: 0.5rem; border-radius: 5px; margin: 0.5rem 0;'>
+            💰 {pricing_text}<br>
+            🆕 Setup (new implementation): SAR {details['setup_cost']:,}
+        </div>
+    </div>
+    """, unsafe_allow_html=True)
     
-    for i, (service_name, details) in enumerate(procurement_services):
-        col = col1 if i % 2 == 0 else col2
-        service_key = f"procurement_{service_name.lower().replace(' ', '_').replace('&', 'and')}"
+    # Initialize service data if not exists
+    if service_key not in st.session_state.operational_services:
+        set_operational_service(service_key, {
+            'selected': False, 
+            'users': 0,
+            'volume': 0,
+            'actual_service_name': service_name,
+            'new_implementation': False
+        })
+    
+    # Get current values from session state
+    current_selected = st.session_state.operational_services[service_key].get('selected', False)
+    current_volume = st.session_state.operational_services[service_key].get('volume', 0)
+    current_users = st.session_state.operational_services[service_key].get('users', 0)
+    current_new_impl = st.session_state.operational_services[service_key].get('new_implementation', False)
+    
+    selected = st.checkbox(f"Include {service_name}", 
+                         key=f"{service_key}_selected",
+                         value=current_selected)
+    
+    if selected:
+        # New Implementation checkbox
+        new_implementation = st.checkbox(
+            "🆕 New Implementation", 
+            key=f"{service_key}_new_impl",
+            value=current_new_impl,
+            help="Check this if it's a new implementation requiring setup."
+        )
         
-        with col:
-            # Determine pricing display based on service type
-            if 'price_per_user' in details:
-                pricing_text = f"SAR {details['price_per_user']}/user/month"
-                volume_label = "Number of Users"
-            elif 'price_per_transaction' in details:
-                pricing_text = f"SAR {details['price_per_transaction']}/transaction/year"
-                volume_label = "Annual Transactions"
-            elif 'price_per_supplier' in details:
-                pricing_text = f"SAR {details['price_per_supplier']}/supplier/year"
-                volume_label = "Number of Suppliers"
-            elif 'price_per_contract' in details:
-                pricing_text = f"SAR {details['price_per_contract']}/contract/year"
-                volume_label = "Annual Contracts"
-            elif 'price_per_event' in details:
-                pricing_text = f"SAR {details['price_per_event']}/event/year"
-                volume_label = "Annual Sourcing Events"
+        # Volume input based on service type
+        volume = st.number_input(volume_label, 
+                              min_value=0, 
+                              value=current_users if unit_key == 'price_per_user' else current_volume,
+                              key=f"{service_key}_volume",
+                              step=1)
+        users = volume if unit_key == 'price_per_user' else 0  # Only user-based services track users
+        
+        # Update session state immediately
+        set_operational_service(service_key, {
+            'selected': True,
+            'users': users,
+            'volume': volume,
+            'actual_service_name': service_name,
+            'new_implementation': new_implementation
+        })
+        
+        if volume > 0:
+            # Calculate cost based on pricing model
+            if unit_key == 'price_per_user':
+                monthly_cost = details['price_per_user'] * volume
+                annual_cost = monthly_cost * 12
+                cost_display = f"Monthly: SAR {monthly_cost:,.0f}"
+            elif unit_key:
+                annual_cost = details[unit_key] * volume
+                cost_display = f"Annual: SAR {annual_cost:,.0f}"
             else:
-                pricing_text = "Custom Pricing"
-                volume_label = "Volume"
-            
-            st.markdown(f"""
-            <div class='service-card procurement'>
-                <h4>{service_name}</h4>
-                <p style='color: #6b7280; font-size: 0.9em;'>{details['description']}</p>
-                <div style='background: #f0fdf4; padding: 0.5rem; border-radius: 5px; margin: 0.5rem 0;'>
-                    💰 {pricing_text}<br>
-                    🆕 Setup (new implementation): SAR {details['setup_cost']:,}
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
+                annual_cost = 0
+                cost_display = "Custom Pricing"
             
-            # Initialize service data if not exists
-            if service_key not in st.session_state.operational_services:
-                st.session_state.operational_services[service_key] = {
-                    'selected': False, 
-                    'users': 0,
-                    'volume': 0,
-                    'actual_service_name': service_name,
-                    'new_implementation': False
-                }
+            setup_cost = details['setup_cost'] if new_implementation else 0
+            total_cost = annual_cost + setup_cost
             
-            # Get current values from session state
-            current_selected = st.session_state.operational_services[service_key].get('selected', False)
-            current_volume = st.session_state.operational_services[service_key].get('volume', 0)
-            current_users = st.session_state.operational_services[service_key].get('users', 0)
-            current_new_impl = st.session_state.operational_services[service_key].get('new_implementation', False)
-            
-            selected = st.checkbox(f"Include {service_name}", 
-                                 key=f"{service_key}_selected",
-                                 value=current_selected)
-            
-            if selected:
-                # New Implementation checkbox
-                new_implementation = st.checkbox(
-                    "🆕 New Implementation", 
-                    key=f"{service_key}_new_impl",
-                    value=current_new_impl,
-                    help="Check this if it's a new implementation requiring setup."
-                )
-                
-                # Volume input based on service type
-                if 'price_per_user' in details:
-                    volume = st.number_input(volume_label, 
-                                          min_value=0, 
-                                          value=current_users,
-                                          key=f"{service_key}_volume",
-                                          step=1)
-                    users = volume
-                else:
-                    volume = st.number_input(volume_label, 
-                                          min_value=0, 
-                                          value=current_volume,
-                                          key=f"{service_key}_volume",
-                                          step=1)
-                    users = 0  # Not user-based
-                
-                # Update session state immediately
-                st.session_state.operational_services[service_key] = {
-                    'selected': True,
-                    'users': users,
-                    'volume': volume,
-                    'actual_service_name': service_name,
-                    'new_implementation': new_implementation
-                }
-                
-                if volume > 0:
-                    # Calculate cost based on pricing model
-                    if 'price_per_user' in details:
-                        monthly_cost = details['price_per_user'] * volume
-                        annual_cost = monthly_cost * 12
-                        cost_display = f"Monthly: SAR {monthly_cost:,.0f}"
-                    elif 'price_per_transaction' in details:
-                        annual_cost = details['price_per_transaction'] * volume
-                        cost_display = f"Annual: SAR {annual_cost:,.0f}"
-                    elif 'price_per_supplier' in details:
-                        annual_cost = details['price_per_supplier'] * volume
-                        cost_display = f"Annual: SAR {annual_cost:,.0f}"
-                    elif 'price_per_contract' in details:
-                        annual_cost = details['price_per_contract'] * volume
-                        cost_display = f"Annual: SAR {annual_cost:,.0f}"
-                    elif 'price_per_event' in details:
-                        annual_cost = details['price_per_event'] * volume
-                        cost_display = f"Annual: SAR {annual_cost:,.0f}"
-                    else:
-                        annual_cost = 0
-                        cost_display = "Custom Pricing"
-                    
-                    setup_cost = details['setup_cost'] if new_implementation else 0
-                    total_cost = annual_cost + setup_cost
-                    
-                    setup_text = f" + SAR {setup_cost:,} setup" if new_implementation else " (no setup cost)"
-                    
-                    st.markdown(f"""
-                    <div class='cost-display procurement'>
-                        📊 {cost_display}{setup_text}<br>
-                        <strong>Total Annual Cost: SAR {total_cost:,.0f}</strong>
-                    </div>
-                    """, unsafe_allow_html=True)
-            else:
-                st.session_state.operational_services[service_key] = {
-                    'selected': False,
-                    'users': 0,
-                    'volume': 0,
-                    'actual_service_name': service_name,
-                    'new_implementation': False
-                }
-    
-    # Show common custom services section
-    show_custom_operational_services()
-
-def show_facility_safety_operational_services():
-    current_data = get_current_data()
-    
-    # Facility & Safety Services
-    st.markdown("### 🏢 Facility & Safety Services & Solutions")
-    
-    col1, col2 = st.columns(2)
-    facility_safety_services = list(current_data['FACILITY_SAFETY_SERVICES'].items())
-    
-    for i, (service_name, details) in enumerate(facility_safety_services):
-        col = col1 if i % 2 == 0 else col2
-        service_key = f"facility_safety_{service_name.lower().replace(' ', '_').replace('&', 'and')}"
-        
-        with col:
-            # Determine pricing display based on service type
-            if 'price_per_user' in details:
-                pricing_text = f"SAR {details['price_per_user']}/user/month"
-                volume_label = "Number of Users"
-            elif 'price_per_employee' in details:
-                pricing_text = f"SAR {details['price_per_employee']}/employee/year"
-                volume_label = "Number of Employees"
-            elif 'price_per_sq_meter' in details:
-                pricing_text = f"SAR {details['price_per_sq_meter']}/sq meter/year"
-                volume_label = "Square Meters"
-            elif 'price_per_access_point' in details:
-                pricing_text = f"SAR {details['price_per_access_point']}/access point/year"
-                volume_label = "Number of Access Points"
-            elif 'price_per_location' in details:
-                pricing_text = f"SAR {details['price_per_location']}/location/year"
-                volume_label = "Number of Locations"
-            elif 'price_per_monitoring_point' in details:
-                pricing_text = f"SAR {details['price_per_monitoring_point']}/monitoring point/year"
-                volume_label = "Number of Monitoring Points"
-            elif 'price_per_asset' in details:
-                pricing_text = f"SAR {details['price_per_asset']}/asset/year"
-                volume_label = "Number of Assets"
-            elif 'price_per_vehicle' in details:
-                pricing_text = f"SAR {details['price_per_vehicle']}/vehicle/year"
-                volume_label = "Number of Vehicles"
-            else:
-                pricing_text = "Custom Pricing"
-                volume_label = "Volume"
+            setup_text = f" + SAR {setup_cost:,} setup" if new_implementation else " (no setup cost)"
             
             st.markdown(f"""
-            <div class='service-card' style='border-left: 4px solid #f59e0b;'>
-                <h4>{service_name}</h4>
-                <p style='color: #6b7280; font-size: 0.9em;'>{details['description']}</p>
-                <div style='background: #fffbeb; padding: 0.5rem; border-radius: 5px; margin: 0.5rem 0;'>
-                    💰 {pricing_text}<br>
-                    🆕 Setup (new implementation): SAR {details['setup_cost']:,}
-                </div>
+            <div class='cost-display {dept_key}'>
+                📊 {cost_display}{setup_text}<br>
+                <strong>Total Annual Cost: SAR {total_cost:,.0f}</strong>
             </div>
             """, unsafe_allow_html=True)
-            
-            # Initialize service data if not exists
-            if service_key not in st.session_state.operational_services:
-                st.session_state.operational_services[service_key] = {
-                    'selected': False, 
-                    'users': 0,
-                    'volume': 0,
-                    'actual_service_name': service_name,
-                    'new_implementation': False
-                }
-            
-            # Get current values from session state
-            current_selected = st.session_state.operational_services[service_key].get('selected', False)
-            current_volume = st.session_state.operational_services[service_key].get('volume', 0)
-            current_users = st.session_state.operational_services[service_key].get('users', 0)
-            current_new_impl = st.session_state.operational_services[service_key].get('new_implementation', False)
-            
-            selected = st.checkbox(f"Include {service_name}", 
-                                 key=f"{service_key}_selected",
-                                 value=current_selected)
-            
-            if selected:
-                # New Implementation checkbox
-                new_implementation = st.checkbox(
-                    "🆕 New Implementation", 
-                    key=f"{service_key}_new_impl",
-                    value=current_new_impl,
-                    help="Check this if it's a new implementation requiring setup."
-                )
-                
-                # Volume input based on service type
-                if 'price_per_user' in details:
-                    volume = st.number_input(volume_label, 
-                                          min_value=0, 
-                                          value=current_users,
-                                          key=f"{service_key}_volume",
-                                          step=1)
-                    users = volume
-                else:
-                    volume = st.number_input(volume_label, 
-                                          min_value=0, 
-                                          value=current_volume,
-                                          key=f"{service_key}_volume",
-                                          step=1)
-                    users = 0  # Not user-based
-                
-                # Update session state immediately
-                st.session_state.operational_services[service_key] = {
-                    'selected': True,
-                    'users': users,
-                    'volume': volume,
-                    'actual_service_name': service_name,
-                    'new_implementation': new_implementation
-                }
-                
-                if volume > 0:
-                    # Calculate cost based on pricing model
-                    if 'price_per_user' in details:
-                        monthly_cost = details['price_per_user'] * volume
-                        annual_cost = monthly_cost * 12
-                        cost_display = f"Monthly: SAR {monthly_cost:,.0f}"
-                    elif 'price_per_employee' in details:
-                        annual_cost = details['price_per_employee'] * volume
-                        cost_display = f"Annual: SAR {annual_cost:,.0f}"
-                    elif 'price_per_sq_meter' in details:
-                        annual_cost = details['price_per_sq_meter'] * volume
-                        cost_display = f"Annual: SAR {annual_cost:,.0f}"
-                    elif 'price_per_access_point' in details:
-                        annual_cost = details['price_per_access_point'] * volume
-                        cost_display = f"Annual: SAR {annual_cost:,.0f}"
-                    elif 'price_per_location' in details:
-                        annual_cost = details['price_per_location'] * volume
-                        cost_display = f"Annual: SAR {annual_cost:,.0f}"
-                    elif 'price_per_monitoring_point' in details:
-                        annual_cost = details['price_per_monitoring_point'] * volume
-                        cost_display = f"Annual: SAR {annual_cost:,.0f}"
-                    elif 'price_per_asset' in details:
-                        annual_cost = details['price_per_asset'] * volume
-                        cost_display = f"Annual: SAR {annual_cost:,.0f}"
-                    elif 'price_per_vehicle' in details:
-                        annual_cost = details['price_per_vehicle'] * volume
-                        cost_display = f"Annual: SAR {annual_cost:,.0f}"
-                    else:
-                        annual_cost = 0
-                        cost_display = "Custom Pricing"
-                    
-                    setup_cost = details['setup_cost'] if new_implementation else 0
-                    total_cost = annual_cost + setup_cost
-                    
-                    setup_text = f" + SAR {setup_cost:,} setup" if new_implementation else " (no setup cost)"
-                    
-                    st.markdown(f"""
-                    <div class='cost-display' style='background: #fffbeb; border-color: #f59e0b;'>
-                        📊 {cost_display}{setup_text}<br>
-                        <strong>Total Annual Cost: SAR {total_cost:,.0f}</strong>
-                    </div>
-                    """, unsafe_allow_html=True)
-            else:
-                st.session_state.operational_services[service_key] = {
-                    'selected': False,
-                    'users': 0,
-                    'volume': 0,
-                    'actual_service_name': service_name,
-                    'new_implementation': False
-                }
+    else:
+        set_operational_service(service_key, {
+            'selected': False,
+            'users': 0,
+            'volume': 0,
+            'actual_service_name': service_name,
+            'new_implementation': False
+        })
+
+# Vendor catalogs per department, in display order - adding a vendor is one entry here.
+# 'key' prefixes the service keys in operational_services; 'card' draws one service.
+SERVICE_VENDORS = {
+    "IT": [
+        {'key': 'oracle', 'catalog': 'ORACLE_SERVICES', 'title': "🟠 Oracle Cloud Services", 'card': show_it_service_card},
+        {'key': 'microsoft', 'catalog': 'MICROSOFT_SERVICES', 'title': "🟦 Microsoft Cloud Services", 'card': show_it_service_card}
+    ],
+    "Procurement": [
+        {'key': 'procurement', 'catalog': 'PROCUREMENT_SERVICES', 'title': "🛒 Procurement Services & Solutions", 'card': show_volume_service_card}
+    ],
+    "Facility_Safety": [
+        {'key': 'facility_safety', 'catalog': 'FACILITY_SAFETY_SERVICES', 'title': "🏢 Facility & Safety Services & Solutions", 'card': show_volume_service_card}
+    ]
+}
+
+# Cards drawn per vendor before "show more" - only these get widgets
+SERVICE_WINDOW_SIZE = 6
+
+def extend_service_window(window_key):
+    st.session_state[window_key] = st.session_state.get(window_key, SERVICE_WINDOW_SIZE) + SERVICE_WINDOW_SIZE
+
+def show_vendor_services(department):
+    """Search box plus a windowed card grid for each of the department's vendor catalogs.
     
-    # Show common custom services section
-    show_custom_operational_services()
+    Selections live in operational_services, so services outside the window keep their
+    state without any widgets being created for them.
+    """
+    current_data = get_current_data()
+    vendors = SERVICE_VENDORS[department]
+    
+    query = st.text_input(
+        "🔍 Search services", key=f"service_search_{department}", placeholder="Search by name or description"
+    )
+    ranks = None
+    if query:
+        matches = search_catalogue(query, catalogs={vendor['catalog'] for vendor in vendors})
+        if not matches:
+            st.info(f"No services match '{query}'.")
+        ranks = {(match['catalog'], match['name']): rank for rank, match in enumerate(matches)}
+    
+    for index, vendor in enumerate(vendors):
+        catalog_key = vendor['catalog']
+        services = list(current_data[catalog_key].items())
+        if ranks is not None:
+            services = sorted(
+                [(name, details) for name, details in services if (catalog_key, name) in ranks],
+                key=lambda service: ranks[(catalog_key, service[0])]
+            )
+            if not services:
+                continue
+        
+        if index:
+            st.markdown("---")
+        st.markdown(f"### {vendor['title']}")
+        
+        window_key = f"service_window_{vendor['key']}"
+        window = st.session_state.get(window_key, SERVICE_WINDOW_SIZE)
+        visible = services[:window]
+        
+        col1, col2 = st.columns(2)
+        for i, (service_name, details) in enumerate(visible):
+            with col1 if i % 2 == 0 else col2:
+                vendor['card'](vendor['key'], service_name, details)
+        
+        # Selected services outside the window stay in the budget - list them so they are not forgotten
+        visible_names = {service_name for service_name, _ in visible}
+        hidden_selected = [
+            entry['actual_service_name'] for service_key, entry in st.session_state.operational_services.items()
+            if service_key.startswith(f"{vendor['key']}_") and entry.get('selected')
+            and entry.get('actual_service_name') not in visible_names
+        ]
+        if hidden_selected:
+            st.caption(f"✅ Also selected (not shown): {', '.join(hidden_selected)}")
+        
+        if len(services) > window:
+            st.button(
+                f"⬇️ Show more ({len(services) - window} remaining)",
+                key=f"show_more_{vendor['key']}",
+                on_click=extend_service_window,
+                args=(window_key,)
+            )
 
 def show_custom_operational_services():
     st.markdown("---")
@@ -2461,6 +4642,7 @@ def show_custom_operational_services():
         if st.button("Add Custom Service", key="add_custom_operational_service_btn"):
             if custom_name and custom_description and custom_volume > 0:
                 custom_service = {
+                    'id': str(uuid.uuid4()),
                     'name': custom_name,
                     'description': custom_description,
                     'price_per_unit': custom_price,
@@ -2471,7 +4653,7 @@ def show_custom_operational_services():
                     'department': st.session_state.selected_department
                 }
                 
-                st.session_state.custom_operational.append(custom_service)
+                add_custom_service(custom_service)
                 st.success(f"✅ Added custom service: {custom_name}")
                 st.rerun()
             else:
@@ -2523,7 +4705,7 @@ def show_custom_operational_services():
                 """, unsafe_allow_html=True)
                 
                 if st.button(f"Remove {service['name']}", key=f"remove_custom_service_{original_index}"):
-                    st.session_state.custom_operational.pop(original_index)
+                    remove_custom_service(original_index)
                     st.rerun()
 
 # Support Packages Section (updated to use current data)
@@ -2543,6 +4725,11 @@ def show_support_packages():
     </div>
     """, unsafe_allow_html=True)
     
+    selected_package = get_selected_support_package(current_data)
+    removed_package = st.session_state.pop('removed_support_package', None)
+    if removed_package:
+        st.warning(f"⚠️ The {removed_package} support package you selected is no longer offered. Please choose another package.")
+    
     st.markdown("### 📞 Support Packages Comparison")
     
     # Create comparison using Streamlit's native dataframe
@@ -2599,6 +4786,9 @@ def show_support_packages():
     styled_df = df.style.apply(highlight_selected, axis=0)
     st.dataframe(styled_df, use_container_width=True)
     
+    with st.expander("💡 Find the Cheapest Package for Your Expected Demand", expanded=False):
+        show_support_optimizer(dict(available_packages))
+    
     # Package selection section
     st.markdown("### 🎯 Select Your Support Package")
     
@@ -2655,12 +4845,12 @@ def show_support_packages():
                         disabled=is_selected,
                         type=button_type,
                         use_container_width=True):
-                st.session_state.support_package = package_name
+                select_support_package(package_name)
                 st.success(f"✅ Selected {package_name} Support Package")
                 st.rerun()
     
     # Additional services section (same as before)
-    if st.session_state.support_package:
+    if selected_package:
         st.markdown("---")
         st.markdown("### ➕ Additional Support Services")
         st.markdown("Enhance your selected package with additional services as needed.")
@@ -2672,7 +4862,7 @@ def show_support_packages():
                 '🎓 Extra Training Request', 
                 '📋 Extra Report Request'
             ],
-            'Cost (SAR)': [1800, 5399, 5399],
+            'Cost (SAR)': [SUPPORT_EXTRA_UNIT_PRICES[extra] for extra in ('support', 'training', 'reports')],
             'Available': ['✅ All Packages', '✅ All Packages', '✅ All Packages']
         }
         
@@ -2688,7 +4878,7 @@ def show_support_packages():
                 value=st.session_state.support_extras.get('support', 0),
                 key="extra_support_requests_input"
             )
-            st.session_state.support_extras['support'] = extra_support
+            set_support_extra('support', extra_support)
         
         with col2:
             extra_training = st.number_input(
@@ -2697,7 +4887,7 @@ def show_support_packages():
                 value=st.session_state.support_extras.get('training', 0),
                 key="extra_training_requests_input"
             )
-            st.session_state.support_extras['training'] = extra_training
+            set_support_extra('training', extra_training)
         
         with col3:
             extra_reports = st.number_input(
@@ -2706,14 +4896,13 @@ def show_support_packages():
                 value=st.session_state.support_extras.get('reports', 0),
                 key="extra_reports_requests_input"
             )
-            st.session_state.support_extras['reports'] = extra_reports
+            set_support_extra('reports', extra_reports)
         
         # Calculate and display total cost
-        selected_package = current_data['SUPPORT_PACKAGES'][st.session_state.support_package]
         base_cost = selected_package['price']
-        extra_support_cost = extra_support * 1800
-        extra_training_cost = extra_training * 5399
-        extra_reports_cost = extra_reports * 5399
+        extra_support_cost = extra_support * SUPPORT_EXTRA_UNIT_PRICES['support']
+        extra_training_cost = extra_training * SUPPORT_EXTRA_UNIT_PRICES['training']
+        extra_reports_cost = extra_reports * SUPPORT_EXTRA_UNIT_PRICES['reports']
         total_extra_cost = extra_support_cost + extra_training_cost + extra_reports_cost
         total_cost = base_cost + total_extra_cost
         
@@ -2723,14 +4912,14 @@ def show_support_packages():
         with col1:
             st.metric("Base Package Cost", f"SAR {base_cost:,.0f}")
             if extra_support > 0:
-                st.metric("Extra Support", f"SAR {extra_support_cost:,.0f}", f"{extra_support} × SAR 1,800")
+                st.metric("Extra Support", f"SAR {extra_support_cost:,.0f}", f"{extra_support} × SAR {SUPPORT_EXTRA_UNIT_PRICES['support']:,}")
         
         with col2:
             st.metric("Additional Services", f"SAR {total_extra_cost:,.0f}")
             if extra_training > 0:
-                st.metric("Extra Training", f"SAR {extra_training_cost:,.0f}", f"{extra_training} × SAR 5,399")
+                st.metric("Extra Training", f"SAR {extra_training_cost:,.0f}", f"{extra_training} × SAR {SUPPORT_EXTRA_UNIT_PRICES['training']:,}")
             if extra_reports > 0:
-                st.metric("Extra Reports", f"SAR {extra_reports_cost:,.0f}", f"{extra_reports} × SAR 5,399")
+                st.metric("Extra Reports", f"SAR {extra_reports_cost:,.0f}", f"{extra_reports} × SAR {SUPPORT_EXTRA_UNIT_PRICES['reports']:,}")
         
         # Total cost display
         st.markdown(f"""
@@ -2795,6 +4984,23 @@ def show_implementation_projects():
             </div>
             """, unsafe_allow_html=True)
             
+            # Search across the department's categories and service types
+            category_catalogs = {key for key in DEPARTMENT_CATALOGS[st.session_state.selected_department] if key in CATEGORY_CATALOGS}
+            type_query = st.text_input("🔍 Search project types", key="project_type_search", placeholder="e.g. chatbot, inventory, cctv")
+            if type_query:
+                type_matches = search_catalogue(type_query, catalogs=category_catalogs)
+                if type_matches:
+                    st.selectbox(
+                        f"Matching project types ({len(type_matches)})",
+                        options=type_matches,
+                        index=None,
+                        format_func=lambda match: f"{match['name']} — {match['category']}",
+                        key="project_type_match",
+                        on_change=select_project_type_match
+                    )
+                else:
+                    st.caption(f"No project types match '{type_query}'.")
+            
             # Category selection based on department
             project_categories = dept_config['project_categories']
             selected_category = st.selectbox(
@@ -2813,7 +5019,13 @@ def show_implementation_projects():
             )
             
             timeline = st.selectbox("Timeline", ["Q1 2025", "Q2 2025", "Q3 2025", "Q4 2025", "Multi-quarter", "2+ years"], key="project_timeline_input")
-            priority = st.select_slider("Priority Level", ["Low", "Medium", "High", "Critical"], value="Medium", key="project_priority_input")
+            priority = st.select_slider("Priority Level", PROJECT_PRIORITIES, value="Medium", key="project_priority_input")
+            billing_profile = st.selectbox(
+                "Billing Profile", ['auto'] + list(BILLING_PROFILES),
+                format_func=lambda profile: "Automatic (from timeline)" if profile == 'auto' else BILLING_PROFILES[profile],
+                key="project_billing_profile_input",
+                help="How the budget is billed across 2025 - automatic bills single-quarter projects on completion and spreads longer ones evenly"
+            )
         
         with col2:
             budget = st.number_input("Budget Estimate (SAR)", min_value=0, value=100000, step=10000, key="project_budget_input")
@@ -2902,6 +5114,7 @@ def show_implementation_projects():
         if st.button("Add Project", type="primary", key="add_implementation_project_btn"):
             if project_name and project_description and budget > 0:
                 new_project = {
+                    'id': str(uuid.uuid4()),
                     'name': project_name,
                     'category': selected_category,
                     'type': project_type,
@@ -2912,7 +5125,8 @@ def show_implementation_projects():
                     'departments': departments,
                     'success_criteria': success_criteria,
                     'created_date': datetime.now().strftime("%Y-%m-%d"),
-                    'shared_service_dept': st.session_state.selected_department
+                    'shared_service_dept': st.session_state.selected_department,
+                    'billing_profile': billing_profile
                 }
                 
                 # Add RPA package details if applicable
@@ -2923,42 +5137,27 @@ def show_implementation_projects():
                     if 'rpa_package_selection' in st.session_state:
                         rpa_package = st.session_state['rpa_package_selection']
                         new_project['rpa_package'] = True
-                        new_project['rpa_details'] = current_data['RPA_PACKAGES'][rpa_package]
+                        new_project['rpa_details'] = thaw_catalog_value(current_data['RPA_PACKAGES'][rpa_package])
                         new_project['rpa_package_name'] = rpa_package
                 
-                st.session_state.implementation_projects.append(new_project)
+                add_implementation_project(new_project)
                 st.success(f"✅ Added project: {project_name}")
                 st.rerun()
             else:
                 st.error("Please fill in project name, description, and budget.")
     
-    # Display existing projects for current department
-    dept_projects = [
-        project for project in st.session_state.implementation_projects 
-        if project.get('shared_service_dept') == st.session_state.selected_department
-    ]
+    # Display existing projects for current department, grouped by category
+    projects_by_category = get_department_projects_by_category(st.session_state.selected_department)
     
-    if dept_projects:
+    if projects_by_category:
         st.markdown(f"### 📋 Your {dept_config['title']} Implementation Projects")
         
-        total_implementation_budget = 0
-        
-        # Group projects by category for better organization
-        projects_by_category = {}
-        for project in dept_projects:
-            category = project.get('category', '⚙️ Custom & Specialized')
-            if category not in projects_by_category:
-                projects_by_category[category] = []
-            projects_by_category[category].append(project)
+        total_implementation_budget = get_department_project_budget(st.session_state.selected_department)
         
         for category, projects in projects_by_category.items():
             st.markdown(f"#### {category}")
             
             for project in projects:
-                # Find the original index in the full projects list
-                original_index = st.session_state.implementation_projects.index(project)
-                total_implementation_budget += project['budget']
-                
                 # Color coding by priority
                 priority_colors = {
                     'Low': '#10b981',
@@ -3015,8 +5214,8 @@ def show_implementation_projects():
                 
                 col1, col2 = st.columns([3, 1])
                 with col2:
-                    if st.button(f"Remove", key=f"remove_implementation_project_{original_index}"):
-                        st.session_state.implementation_projects.pop(original_index)
+                    if st.button(f"Remove", key=f"remove_implementation_project_{project['id']}"):
+                        remove_implementation_project(project['id'])
                         st.rerun()
         
         st.markdown(f"""
@@ -3025,6 +5224,201 @@ def show_implementation_projects():
         </div>
         """, unsafe_allow_html=True)
 
+# Multi-year TCO section of the summary
+def show_tco_projection(dept_config, submission):
+    st.markdown("### 📈 Multi-Year Total Cost of Ownership")
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        horizon = st.slider("Horizon (years)", min_value=1, max_value=10, value=TCO_DEFAULT_HORIZON, key="tco_horizon")
+    with col2:
+        discount_rate = st.number_input("Discount rate (%)", min_value=0.0, max_value=50.0,
+                                        value=TCO_DEFAULT_DISCOUNT_RATE * 100, step=0.5, key="tco_discount_rate") / 100
+    with col3:
+        escalation_rate = st.number_input("Annual price escalation (%)", min_value=0.0, max_value=50.0,
+                                          value=TCO_DEFAULT_ESCALATION_RATE * 100, step=0.5, key="tco_escalation_rate") / 100
+    
+    # Reruns with the same selections and settings reuse the last projection
+    settings = (horizon, discount_rate, escalation_rate)
+    cache = st.session_state.get('tco_cache')
+    if cache is None or cache['submission'] is not submission or cache['settings'] != settings:
+        cache = {'submission': submission, 'settings': settings,
+                 'tco': compute_tco(build_tco_line_items([submission]), *settings)}
+        st.session_state.tco_cache = cache
+    tco = cache['tco']
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.metric(f"{horizon}-Year Total Cost (nominal)", f"SAR {tco['nominal_total']:,.0f}")
+    with col2:
+        st.metric(f"{horizon}-Year Total Cost (NPV @ {discount_rate * 100:.1f}%)", f"SAR {tco['npv']:,.0f}")
+    
+    bucket_colors = {'operational': dept_config['color'], 'support': '#10b981', 'implementation': '#f59e0b'}
+    fig_tco = go.Figure()
+    for bucket, yearly in tco['by_bucket'].iterrows():
+        fig_tco.add_trace(go.Bar(name=bucket.title(), x=tco['year_columns'], y=yearly.values, marker_color=bucket_colors.get(bucket)))
+    fig_tco.update_layout(barmode='stack', title=f"{dept_config['title']} Cost by Year (SAR, escalated)", yaxis_title='Cost (SAR)')
+    st.plotly_chart(fig_tco, use_container_width=True, key="tco_chart")
+    
+    with st.expander("📋 TCO by line item", expanded=False):
+        st.dataframe(
+            tco['matrix'].drop(columns=['reference_id', 'company']),
+            hide_index=True, use_container_width=True,
+            column_config={column: st.column_config.NumberColumn(format="%.0f") for column in tco['year_columns'] + ['Total', 'NPV']}
+        )
+
+# What-if scenarios section of the summary
+def show_scenario_analysis(submission):
+    selections = submission['selections']
+    scale_options = [0.5, 0.6, 0.7, 0.8, 0.9, 1.0, 1.1, 1.2, 1.3, 1.4, 1.5, 2.0]
+    vendors = list(get_budget_totals()['operational_lines']['source'].unique())
+    
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        scales = st.multiselect("User / volume multipliers", scale_options, default=[0.8, 1.0, 1.2],
+                                format_func=lambda scale: f"{scale:.0%}", key="scenario_scales")
+        per_vendor = st.checkbox("Vary each catalog independently", key="scenario_per_vendor",
+                                 help="Try every combination of multipliers across the selected catalogs")
+    with col2:
+        package_options = [None] + list(get_current_data()['SUPPORT_PACKAGES'])
+        packages = st.multiselect("Support packages", package_options, default=[selections['support_package']],
+                                  format_func=lambda name: name or "No package", key="scenario_packages")
+    with col3:
+        priorities = st.multiselect("Keep projects from priority", PROJECT_PRIORITIES, default=["Low"],
+                                    key="scenario_priorities")
+    
+    grid = {}
+    if scales:
+        if per_vendor and vendors:
+            grid.update({f"volume_scale.{catalog}": scales for catalog in vendors})
+        else:
+            grid['volume_scale'] = scales
+    if packages:
+        grid['support_package'] = packages
+    if priorities:
+        grid['min_project_priority'] = priorities
+    if not grid:
+        return
+    
+    # Scenarios are evaluated on demand; results stay until the selections or the grid change
+    cache = st.session_state.get('scenario_cache')
+    if st.button("▶️ Evaluate Scenarios", key="evaluate_scenarios_btn", type="primary"):
+        cache = {'submission': submission, 'grid': grid, 'results': evaluate_scenarios(selections, grid).sort_values('total')}
+        st.session_state.scenario_cache = cache
+    if cache is None:
+        return
+    if cache['submission'] is not submission or cache['grid'] != grid:
+        st.info("Your selections or scenario options changed - evaluate again to refresh the results.")
+        return
+    
+    results = cache['results']
+    st.caption(f"{len(results):,} scenarios evaluated")
+    st.dataframe(
+        results, hide_index=True, use_container_width=True,
+        column_config={
+            **{column: st.column_config.NumberColumn(format="%.0f") for column in ['operational', 'support', 'implementation', 'total', 'change']},
+            'change_pct': st.column_config.NumberColumn("change %", format="%.1f")
+        }
+    )
+    st.download_button(
+        "📥 Download Scenarios (CSV)",
+        data=results.to_csv(index=False).encode(),
+        file_name=f"budget_scenarios_{datetime.now().strftime('%Y%m%d')}.csv",
+        mime="text/csv",
+        key="download_scenarios_btn"
+    )
+
+# Monte Carlo section of the summary
+def show_budget_simulation(submission):
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        users_spread = st.slider("User count uncertainty (±%)", 0, 50, int(SIMULATION_DEFAULT_SPREADS['users'] * 100), key="simulation_users_spread")
+    with col2:
+        volume_spread = st.slider("Transaction / event volume uncertainty (±%)", 0, 100, int(SIMULATION_DEFAULT_SPREADS['volume'] * 100), key="simulation_volume_spread")
+    with col3:
+        projects_spread = st.slider("Project budget uncertainty (±%)", 0, 100, int(SIMULATION_DEFAULT_SPREADS['projects'] * 100), key="simulation_projects_spread")
+    
+    spreads = {'users': users_spread / 100, 'volume': volume_spread / 100, 'projects': projects_spread / 100}
+    # The simulation runs on demand; its result stays until the selections or spreads change
+    cache = st.session_state.get('budget_simulation_cache')
+    if st.button("▶️ Run Simulation", key="run_simulation_btn", type="primary"):
+        cache = {'submission': submission, 'spreads': spreads, 'result': simulate_budget(submission['lines'], spreads)}
+        st.session_state.budget_simulation_cache = cache
+    if cache is None:
+        return
+    if cache['submission'] is not submission or cache['spreads'] != spreads:
+        st.info("Your selections or uncertainty ranges changed - run the simulation again to refresh the results.")
+        return
+    result = cache['result']
+    
+    col1, col2, col3 = st.columns(3)
+    for column, percentile in zip((col1, col2, col3), result.columns[1:]):
+        with column:
+            st.metric(f"{percentile} Total Budget", f"SAR {result.loc['total', percentile]:,.0f}",
+                      f"{result.loc['total', percentile] - result.loc['total', 'Estimate']:+,.0f} vs. estimate", delta_color="off")
+    
+    st.dataframe(
+        result.rename(index=lambda group: group.title() if group.islower() else group.replace('_', ' ')).style.format("{:,.0f}"),
+        use_container_width=True
+    )
+    st.caption(f"{SIMULATION_SAMPLES:,} samples; user counts, transaction/event volumes and project budgets vary together per department, "
+               "setup fees and support are fixed.")
+
+# Support package optimizer panel
+SUPPORT_DEMAND_LABELS = {
+    'standard': "🛠️ Standard tickets",
+    'priority': "🔥 Priority tickets",
+    'premium': "⭐ Premium tickets",
+    'improvement_hours': "🔧 Improvement hours",
+    'trainings': "🎓 Trainings",
+    'reports': "📋 New reports"
+}
+
+def show_support_optimizer(packages):
+    st.markdown("Enter your expected yearly demand to get the cheapest package plus extras that covers it.")
+    
+    demand = {}
+    cols = st.columns(3)
+    for i, (field, label) in enumerate(SUPPORT_DEMAND_LABELS.items()):
+        with cols[i % 3]:
+            demand[field] = st.number_input(label, min_value=0, value=0, step=1, key=f"support_demand_{field}")
+    
+    comparison = compare_support_packages(demand, packages)
+    best = comparison.iloc[0]
+    if not np.isfinite(best['total']):
+        st.warning("No package includes enough improvement hours, and improvement hours cannot be added as extras.")
+        return
+    
+    extras_text = ", ".join(
+        f"{int(best[f'extra_{extra}'])} extra {extra} request(s)"
+        for extra in ('support', 'training', 'reports') if best[f'extra_{extra}'] > 0
+    ) or "no extras"
+    st.success(f"**Recommended: {best['package']}** with {extras_text} — SAR {best['total']:,.0f} per year")
+    
+    if len(comparison) > 1 and np.isfinite(comparison.iloc[1]['total']):
+        runner_up = comparison.iloc[1]
+        st.caption(f"Next best: {runner_up['package']} at SAR {runner_up['total']:,.0f} "
+                   f"(SAR {runner_up['total'] - best['total']:,.0f} more)")
+    
+    st.dataframe(
+        comparison.replace(np.inf, np.nan), hide_index=True, use_container_width=True,
+        column_config={
+            'package_price': st.column_config.NumberColumn("package (SAR)", format="%.0f"),
+            'extras_cost': st.column_config.NumberColumn("extras (SAR)", format="%.0f"),
+            'missing_improvement_hours': st.column_config.NumberColumn("hours not covered", format="%.0f"),
+            'total': st.column_config.NumberColumn("total (SAR)", format="%.0f")
+        }
+    )
+    
+    if st.button(f"Apply {best['package']} + extras", key="apply_support_optimizer_btn", type="primary"):
+        select_support_package(best['package'])
+        for extra in ('support', 'training', 'reports'):
+            set_support_extra(extra, int(best[f'extra_{extra}']))
+        # The extras inputs read their value from session state on the next run
+        for extra, key in (('support', 'extra_support_requests_input'), ('training', 'extra_training_requests_input'), ('reports', 'extra_reports_requests_input')):
+            st.session_state.pop(key, None)
+        st.rerun()
+
 # Summary Section with Multi-Department Support (updated to use current data)
 def show_summary():
     if not st.session_state.selected_department:
@@ -3045,7 +5439,7 @@ def show_summary():
     operational_total = calculate_operational_total()
     support_total = calculate_support_total()
     implementation_total = calculate_implementation_total()
-    total_budget = operational_total + support_total + implementation_total
+    total_budget = calculate_total_budget()
     
     if total_budget == 0:
         st.info(f"👋 No {dept_config['title'].lower()} services selected yet. Please visit the other sections to build your shared services selection.")
@@ -3097,62 +5491,26 @@ def show_summary():
     
     # Monthly cash flow projection
     with col2:
-        months = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
-        
-        monthly_operational = [0] * 12
-        monthly_support = [0] * 12
-        monthly_implementation = [0] * 12
-        
-        # Support and Operational costs are billed at year-end (December)
-        monthly_operational[11] = operational_total
-        monthly_support[11] = support_total
-        
-        # Implementation projects billed based on timeline/completion
-        if st.session_state.implementation_projects:
-            q1_projects = []
-            q2_projects = []
-            q3_projects = []
-            q4_projects = []
-            multi_quarter_projects = []
-            
-            for project in st.session_state.implementation_projects:
-                # Only include projects for current department
-                if project.get('shared_service_dept') == st.session_state.selected_department:
-                    timeline = project.get('timeline', 'Q4 2025')
-                    budget = project.get('budget', 0)
-                    
-                    if project.get('rpa_package', False):
-                        multi_quarter_projects.append(budget)
-                    elif 'Q1' in timeline:
-                        q1_projects.append(budget)
-                    elif 'Q2' in timeline:
-                        q2_projects.append(budget)
-                    elif 'Q3' in timeline:
-                        q3_projects.append(budget)
-                    elif 'Q4' in timeline:
-                        q4_projects.append(budget)
-                    else:
-                        multi_quarter_projects.append(budget)
-            
-            if q1_projects:
-                monthly_implementation[2] = sum(q1_projects)
-            if q2_projects:
-                monthly_implementation[5] = sum(q2_projects)
-            if q3_projects:
-                monthly_implementation[8] = sum(q3_projects)
-            if q4_projects:
-                monthly_implementation[11] = sum(q4_projects)
-            if multi_quarter_projects:
-                monthly_amount = sum(multi_quarter_projects) / 12
-                monthly_implementation = [x + monthly_amount for x in monthly_implementation]
+        months = MONTHS
+        recurring_profile = st.selectbox(
+            "Operational & support billing", ['year_end', 'straight_line', 'upfront'],
+            format_func=BILLING_PROFILES.get, key="recurring_billing_profile"
+        )
+        monthly_operational, monthly_support, monthly_implementation = compute_monthly_cash_flow(
+            operational_total,
+            support_total,
+            get_department_project_schedule(st.session_state.selected_department),
+            recurring_profile
+        )
+        recurring_label = BILLING_PROFILES[recurring_profile].split(' (')[0]
         
         fig_bar = go.Figure()
-        fig_bar.add_trace(go.Bar(name='Operational (Year-end)', x=months, y=monthly_operational, marker_color=dept_config['color']))
-        fig_bar.add_trace(go.Bar(name='Support (Year-end)', x=months, y=monthly_support, marker_color='#10b981'))
-        fig_bar.add_trace(go.Bar(name='Implementation (On Completion)', x=months, y=monthly_implementation, marker_color='#f59e0b'))
+        fig_bar.add_trace(go.Bar(name=f'Operational ({recurring_label})', x=months, y=monthly_operational, marker_color=dept_config['color']))
+        fig_bar.add_trace(go.Bar(name=f'Support ({recurring_label})', x=months, y=monthly_support, marker_color='#10b981'))
+        fig_bar.add_trace(go.Bar(name='Implementation (Per Billing Profile)', x=months, y=monthly_implementation, marker_color='#f59e0b'))
         
         fig_bar.update_layout(
-            title=f'{dept_config["title"]} Monthly Cash Flow Projection (SAR)<br><sub>Support & Operations billed year-end | Projects billed on completion</sub>',
+            title=f'{dept_config["title"]} Monthly Cash Flow Projection (SAR)<br><sub>Support & Operations billed {recurring_label.lower()} | Projects billed per their billing profile</sub>',
             barmode='stack',
             xaxis_title='Month',
             yaxis_title='Cost (SAR)',
@@ -3160,6 +5518,15 @@ def show_summary():
         )
         st.plotly_chart(fig_bar, use_container_width=True, key="cash_flow_chart")
     
+    current_submission = get_current_submission()
+    show_tco_projection(dept_config, current_submission)
+    
+    with st.expander("🧪 What-If Scenarios", expanded=False):
+        show_scenario_analysis(current_submission)
+    
+    with st.expander("🎲 Budget Uncertainty (Monte Carlo)", expanded=False):
+        show_budget_simulation(current_submission)
+    
     # Export and submission options
     st.markdown("### 📤 Export & Submit Selection")
     
@@ -3167,14 +5534,36 @@ def show_summary():
     
     with col1:
         if st.button("📊 Export to Excel", use_container_width=True, key="export_excel_btn"):
-            st.success(f"📊 Excel export functionality would generate a comprehensive {dept_config['title'].lower()} budget report including all selected services, costs, and projections.")
+            reference_id = f"DRAFT-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+            st.session_state.excel_export = write_budget_workbook([build_submission(reference_id)])
+        
+        if st.session_state.get('excel_export'):
+            st.download_button(
+                "⬇️ Download Excel",
+                data=st.session_state.excel_export,
+                file_name=f"{st.session_state.company_info.get('company', 'ALK')}_{st.session_state.selected_department}_budget_2025.xlsx",
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                use_container_width=True,
+                key="download_excel_btn"
+            )
     
     with col2:
         if st.button("💾 Save Draft", use_container_width=True, key="save_draft_btn"):
-            st.success("💾 Draft saved! Your selections have been preserved and you can continue editing later.")
+            email = st.session_state.company_info.get('email', '')
+            if email:
+                save_draft(email, st.session_state.company_info.get('company', ''))
+                st.success("💾 Draft saved! Your selections have been preserved and you can continue editing later.")
+            else:
+                st.error("Please enter your email in the sidebar so the draft can be saved against it.")
     
     with col3:
         if st.button("📧 Share Summary", use_container_width=True, key="share_summary_btn"):
+            company_code = st.session_state.company_info.get('company_code', 'ALK')
+            dept_code = st.session_state.selected_department[:3].upper()
+            st.session_state.report_reference = f"{company_code}-{dept_code}-2025-DRAFT"
+            st.session_state.report_future = request_budget_report(
+                build_submission(st.session_state.report_reference), dept_config['title'], dept_config['color']
+            )
             st.success(f"📧 {dept_config['title']} budget summary prepared for sharing with stakeholders and finance team.")
     
     with col4:
@@ -3182,6 +5571,11 @@ def show_summary():
             company_code = st.session_state.company_info.get('company_code', 'ALK')
             dept_code = st.session_state.selected_department[:3].upper()
             reference_id = f"{company_code}-{dept_code}-2025-{datetime.now().strftime('%Y%m%d%H%M%S')}-{str(uuid.uuid4())[:8].upper()}"
+            submission = build_submission(reference_id)
+            queue_submission(submission)
+            st.session_state.submission_reference = reference_id
+            st.session_state.report_reference = reference_id
+            st.session_state.report_future = request_budget_report(submission, dept_config['title'], dept_config['color'])
             
             st.balloons()
             st.success(f"""
@@ -3206,8 +5600,17 @@ def show_summary():
             3. Q4 2024: Service implementation planning begins
             4. Q1 2025: Service delivery starts
             
-            A detailed {dept_config['title'].lower()} service catalogue report has been sent to your email and the shared services team.
+            A detailed {dept_config['title'].lower()} service catalogue report is available to download below.
             """)
+    
+    submission_reference = st.session_state.get('submission_reference')
+    if submission_reference:
+        write_error = get_submission_write_error(submission_reference)
+        if write_error:
+            st.warning(f"⏳ Submission {submission_reference} is queued but not stored yet ({write_error}). "
+                       "It is retried automatically - please keep your reference ID.")
+    
+    show_report_download()
 
 # Main application
 def main():
@@ -3263,25 +5666,26 @@ def main():
                     st.session_state.selected_department = None
                     st.rerun()
             
-            # Navigation tabs
-            tab1, tab2, tab3, tab4 = st.tabs([
-                f"{dept_config['icon']} Operational Services", 
-                "🛠️ Support Packages", 
-                "🚀 Implementation Projects", 
-                "📊 Summary"
-            ])
-            
-            with tab1:
-                show_operational_services()
-            
-            with tab2:
-                show_support_packages()
+            # Section navigation - only the active section is executed on each rerun.
+            # Selections live in session state, so they survive switching sections.
+            sections = {
+                'operational': (f"{dept_config['icon']} Operational Services", show_operational_services),
+                'support': ("🛠️ Support Packages", show_support_packages),
+                'implementation': ("🚀 Implementation Projects", show_implementation_projects),
+                'summary': ("📊 Summary", show_summary)
+            }
             
-            with tab3:
-                show_implementation_projects()
+            active_section = st.radio(
+                "Section",
+                options=list(sections.keys()),
+                format_func=lambda section: sections[section][0],
+                horizontal=True,
+                key="active_section",
+                label_visibility="collapsed"
+            )
             
-            with tab4:
-                show_summary()
+            st.markdown("---")
+            sections[active_section][1]()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,47 @@
+import importlib.util
+from pathlib import Path
+
+import pytest
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+APP_PATH = str(Path(__file__).resolve().parents[1] / "app.py")
+
+
+@pytest.fixture(autouse=True)
+def database(tmp_path, monkeypatch):
+    """Every test starts from a freshly seeded database and an empty catalog store"""
+    monkeypatch.setenv("SHARED_SERVICES_DB", str(tmp_path / "shared_services.db"))
+    st.cache_resource.clear()
+    yield
+    st.cache_resource.clear()
+
+
+@pytest.fixture
+def client():
+    """A client session with the IT department selected"""
+    at = AppTest.from_file(APP_PATH, default_timeout=60)
+    at.session_state["selected_department"] = "IT"
+    return at.run()
+
+
+@pytest.fixture
+def admin():
+    """An admin session for all departments"""
+    at = AppTest.from_file(APP_PATH, default_timeout=60)
+    at.session_state["app_mode"] = "admin"
+    at.session_state["admin_authenticated"] = True
+    at.session_state["admin_info"] = {"department": "ALL", "name": "Test Admin"}
+    return at.run()
+
+
+@pytest.fixture
+def app():
+    """The app module, imported against the test database"""
+    spec = importlib.util.spec_from_file_location("shared_services_app", APP_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    yield module
+    conn = module.DB_CONNECTIONS.__dict__.pop('conn', None)
+    if conn is not None:
+        conn.close()
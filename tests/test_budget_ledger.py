@@ -0,0 +1,73 @@
+import pytest
+
+
+@pytest.fixture
+def checked_client(client):
+    """A client session that verifies the ledger against a full repricing on every post"""
+    client.session_state["ledger_consistency_check"] = True
+    return client.run()
+
+
+def assert_ledger_matches_rebuild(at):
+    assert not at.exception, at.exception
+    totals = dict(at.session_state["budget_ledger"]["totals"])
+    at.session_state["budget_ledger"] = None
+    at.run()
+    assert not at.exception, at.exception
+    assert at.session_state["budget_ledger"]["totals"] == pytest.approx(totals)
+    return totals
+
+
+def include_checkboxes(at):
+    return [checkbox for checkbox in at.checkbox if checkbox.label.startswith("Include")]
+
+
+def user_inputs(at):
+    return [number_input for number_input in at.number_input if number_input.label.startswith("Number of users")]
+
+
+def test_operational_add_change_remove(checked_client):
+    at = checked_client
+    include_checkboxes(at)[0].check().run()
+    user_inputs(at)[0].set_value(10).run()
+    added = assert_ledger_matches_rebuild(at)
+    assert added["operational"] > 0
+    
+    user_inputs(at)[0].set_value(25).run()
+    changed = assert_ledger_matches_rebuild(at)
+    assert changed["operational"] == pytest.approx(added["operational"] * 2.5)
+    
+    include_checkboxes(at)[0].uncheck().run()
+    removed = assert_ledger_matches_rebuild(at)
+    assert removed["operational"] == 0
+
+
+def test_support_and_projects(checked_client):
+    at = checked_client
+    at.radio(key="active_section").set_value("support").run()
+    at.button(key="select_package_bronze_btn").click().run()
+    at.number_input(key="extra_support_requests_input").set_value(3).run()
+    totals = assert_ledger_matches_rebuild(at)
+    assert totals["support"] == pytest.approx(195975 + 3 * 1800)
+    
+    at.radio(key="active_section").set_value("implementation").run()
+    at.text_input(key="project_name_input").input("Service Desk Portal")
+    at.text_area(key="project_description_input").input("Self-service portal for IT requests")
+    at.number_input(key="project_budget_input").set_value(250000)
+    at.button(key="add_implementation_project_btn").click().run()
+    totals = assert_ledger_matches_rebuild(at)
+    assert totals["implementation"] == pytest.approx(250000)
+    
+    project_id = next(iter(at.session_state["project_store"]["projects"]))
+    at.button(key=f"remove_implementation_project_{project_id}").click().run()
+    totals = assert_ledger_matches_rebuild(at)
+    assert totals["implementation"] == 0
+
+
+def test_inconsistent_ledger_is_reported(checked_client):
+    at = checked_client
+    include_checkboxes(at)[0].check().run()
+    at.session_state["budget_ledger"]["totals"]["operational"] += 1000
+    user_inputs(at)[0].set_value(10).run()
+    assert at.exception
+    assert "Budget ledger out of sync" in at.exception[0].message
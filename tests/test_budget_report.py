@@ -0,0 +1,14 @@
+def test_user_text_is_escaped_in_pdf(app):
+    submission = {
+        'reference_id': 'REF-1', 'company': 'A <b', 'department': 'R&D', 'shared_service_dept': 'IT',
+        'contact_person': '<i>Jane', 'email': 'jane@example.com', 'submitted_at': '2025-01-01T00:00:00',
+        'catalog_version': 1, 'operational_total': 1000.0, 'support_total': 0.0, 'implementation_total': 0.0,
+        'total_budget': 1000.0, 'selections': {},
+        'lines': [{
+            'bucket': 'operational', 'name': 'Custom <b service', 'department': 'IT', 'quantity': 1.0,
+            'annual_cost': 1000.0, 'setup_cost': 0.0, 'total': 1000.0
+        }]
+    }
+    
+    pdf = app.render_budget_pdf(submission, 'Information <Technology>', '#1f77b4')
+    assert pdf.startswith(b'%PDF')
@@ -0,0 +1,27 @@
+import sqlite3
+
+
+def stored_order(conn, statement, catalog_key):
+    return list(dict.fromkeys(row[0] for row in conn.execute(statement, (catalog_key,))))
+
+
+def test_reset_restores_default_order(app, tmp_path):
+    first_category = next(iter(app.DEFAULT_CATALOGS['IT_PROJECT_CATEGORIES']))
+    app.apply_catalog_changes({
+        ('ORACLE_SERVICES', 'Oracle ERP Cloud'): None,
+        ('IT_PROJECT_CATEGORIES', first_category): None,
+    })
+    app.reset_catalogs_to_defaults('IT')
+    
+    conn = sqlite3.connect(tmp_path / "shared_services.db")
+    services = stored_order(
+        conn, "SELECT name FROM services WHERE catalog_key = ? ORDER BY position", 'ORACLE_SERVICES'
+    )
+    categories = stored_order(
+        conn, "SELECT category FROM categories WHERE catalog_key = ? ORDER BY category_position, item_position",
+        'IT_PROJECT_CATEGORIES'
+    )
+    conn.close()
+    assert services == list(app.DEFAULT_CATALOGS['ORACLE_SERVICES'])
+    assert categories == list(app.DEFAULT_CATALOGS['IT_PROJECT_CATEGORIES'])
+    assert list(app.get_current_data()['ORACLE_SERVICES']) == services
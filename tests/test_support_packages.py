@@ -0,0 +1,20 @@
+def open_support_section(at):
+    at.radio(key="active_section").set_value("support").run()
+    assert not at.exception, at.exception
+
+
+def test_selected_package_removed_by_admin(client, admin):
+    open_support_section(client)
+    client.button(key="select_package_bronze_btn").click().run()
+    assert client.session_state["support_package"] == "Bronze"
+    
+    admin.button(key="remove_support_Bronze").click().run()
+    assert not admin.exception, admin.exception
+    
+    client.run()
+    assert not client.exception, client.exception
+    assert client.session_state["support_package"] is None
+    assert any("Bronze support package" in warning.value for warning in client.warning)
+    
+    client.radio(key="active_section").set_value("summary").run()
+    assert not client.exception, client.exception